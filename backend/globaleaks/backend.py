@@ -1,15 +1,21 @@
 # -*- coding: utf-8
 #   backend
 #   *******
+import os
 import sys
 import traceback
 
+from io import BytesIO
+
 from twisted.application import service
 from twisted.internet import reactor, defer
 from twisted.python.log import ILogObserver
 from twisted.web import server
 
+from globaleaks.handlers.l10n import load_l10n_bundles
+from globaleaks.handlers.staticfile import StaticFileIndex
 from globaleaks.jobs import job, jobs_list
+from globaleaks.jobs.worker import JobsWorkerSupervisor
 from globaleaks.services import onion
 
 from globaleaks.db import create_db, init_db, update_db, \
@@ -18,6 +24,7 @@ from globaleaks.rest.api import APIResourceWrapper
 from globaleaks.settings import Settings
 from globaleaks.state import State
 from globaleaks.utils.log import log, openLogFile, logFormatter, LogObserver
+from globaleaks.utils.multipart import MultipartError, MultipartParser, parse_header
 from globaleaks.utils.process import disable_swap, drop_privileges, set_proc_title
 from globaleaks.utils.sock import listen_tcp_on_sock, listen_tls_on_sock, reserve_port_for_ip
 from globaleaks.utils.utility import fix_file_permissions
@@ -34,6 +41,57 @@ def fail_startup(excep):
 class Request(server.Request):
     current_user = None
     log_ip_and_ua = False
+    multipart = None
+    upload_file = None
+    upload_file_size = 0
+
+    def gotLength(self, length):
+        content_type = self.requestHeaders.getRawHeaders(b'content-type', [b''])[0]
+        key, params = parse_header(content_type.decode('latin-1'))
+
+        if key != 'multipart/form-data' or 'boundary' not in params:
+            return server.Request.gotLength(self, length)
+
+        # Multipart bodies are parsed while they are received and the
+        # content of the uploads is encrypted straight to the disk
+        self.multipart = MultipartParser(params['boundary'].encode('latin-1'), Settings.tmp_path)
+        self.content = BytesIO()
+
+    def handleContentChunk(self, data):
+        if self.multipart is None:
+            return server.Request.handleContentChunk(self, data)
+
+        self.multipart.feed(data)
+
+    def process(self):
+        if self.multipart is not None:
+            try:
+                fields = self.multipart.close()
+            except MultipartError:
+                self.setResponseCode(400)
+                self.finish()
+                return
+
+            for key, values in fields.items():
+                self.args.setdefault(key, []).extend(values)
+
+            self.upload_file = self.multipart.file
+            self.upload_file_size = self.multipart.file_size
+
+        try:
+            return server.Request.process(self)
+        finally:
+            # The upload handlers consume the file synchronously while rendering
+            # and the file is otherwise deleted
+            if self.upload_file is not None:
+                self.upload_file.close()
+
+                try:
+                    os.remove(self.upload_file.filepath)
+                except OSError:
+                    pass
+
+                self.upload_file = None
 
 
 class Site(server.Site):
@@ -119,6 +177,10 @@ class Service(service.Service):
 
     def start_jobs(self):
         for j in jobs_list:
+            # The jobs assigned to the jobs worker are executed in its process
+            if Settings.jobs_worker and j.worker:
+                continue
+
             self.state.jobs.append(j())
 
         self.state.onion_service_job = onion.OnionService()
@@ -127,6 +189,10 @@ class Service(service.Service):
 
         self.state.jobs_monitor = job.JobsMonitor(self.state.jobs)
 
+        if Settings.jobs_worker:
+            self.state.jobs_worker = JobsWorkerSupervisor()
+            self.state.jobs_worker.start()
+
     def stop_jobs(self):
         deferred_list = []
 
@@ -137,6 +203,10 @@ class Service(service.Service):
             deferred_list.append(self.state.jobs_monitor.stop())
             self.state.jobs_monitor = None
 
+        if self.state.jobs_worker is not None:
+            deferred_list.append(self.state.jobs_worker.stop())
+            self.state.jobs_worker = None
+
         return defer.DeferredList(deferred_list)
 
     def _deferred_start(self):
@@ -153,6 +223,8 @@ class Service(service.Service):
         sync_clean_untracked_files()
         sync_refresh_memory_variables()
         sync_initialize_snimap()
+        load_l10n_bundles()
+        StaticFileIndex.load(Settings.client_path)
 
         self.state.orm_tp.start()
 
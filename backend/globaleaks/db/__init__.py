@@ -12,6 +12,7 @@ from globaleaks.handlers.admin.https import load_tls_dict_list
 from globaleaks.models import Base, Config
 from globaleaks.models.config_desc import ConfigFilters
 from globaleaks.orm import get_engine, get_session, make_db_uri, transact, transact_sync
+from globaleaks.rest.cache import FileCache, L10NCache
 from globaleaks.sessions import Session
 from globaleaks.settings import Settings
 from globaleaks.state import State, TenantState
@@ -227,6 +228,11 @@ def db_refresh_memory_variables(session, to_refresh=None):
     if to_refresh:
         db_refresh_tenant_cache(session, to_refresh)
 
+    # The files and the texts served to a tenant depend on its configuration
+    for tid in set(to_remove) | set(to_refresh):
+        FileCache.invalidate(tid)
+        L10NCache.invalidate(tid)
+
     if 1 in to_refresh:
         to_refresh = State.tenant_cache.keys()
         db_set_cache_exception_delivery_list(session, State.tenant_cache[1])
@@ -267,6 +273,10 @@ def db_refresh_memory_variables(session, to_refresh=None):
 
         State.tenant_hostname_id_map.update({h: tid for h in hostnames + onionnames})
 
+    # The jobs worker reloads the configuration once the transaction is committed
+    if State.jobs_worker is not None:
+        session.info['refresh_jobs_worker'] = True
+
 
 @transact
 def refresh_memory_variables(session, to_refresh=None):
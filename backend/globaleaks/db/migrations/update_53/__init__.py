@@ -0,0 +1,120 @@
+# -*- coding: UTF-8
+from sqlalchemy.sql.expression import func
+
+from globaleaks.db.migrations.update import MigrationBase
+from globaleaks.models import Model
+from globaleaks.models.properties import *
+from globaleaks.utils.utility import datetime_now, datetime_never, datetime_null
+
+
+class Comment_v_52(Model):
+    __tablename__ = 'comment'
+    id = Column(UnicodeText(36), primary_key=True, default=uuid4, nullable=False)
+    creation_date = Column(DateTime, default=datetime_now, nullable=False)
+    internaltip_id = Column(UnicodeText(36), nullable=False)
+    author_id = Column(UnicodeText(36))
+    content = Column(UnicodeText, nullable=False)
+    type = Column(UnicodeText, nullable=False)
+    new = Column(Boolean, default=True, nullable=False)
+
+
+class File_v_52(Model):
+    __tablename__ = 'file'
+    tid = Column(Integer, primary_key=True, default=1)
+    id = Column(UnicodeText(36), primary_key=True, default=uuid4)
+    name = Column(UnicodeText, default='', nullable=False)
+    data = Column(UnicodeText, nullable=False)
+
+
+class InternalFile_v_52(Model):
+    __tablename__ = 'internalfile'
+    id = Column(UnicodeText(36), primary_key=True, default=uuid4)
+    creation_date = Column(DateTime, default=datetime_now, nullable=False)
+    internaltip_id = Column(UnicodeText(36), nullable=False)
+    name = Column(UnicodeText, nullable=False)
+    filename = Column(UnicodeText, default='', nullable=False)
+    content_type = Column(JSON, default='', nullable=False)
+    size = Column(JSON, default='', nullable=False)
+    new = Column(Boolean, default=True, nullable=False)
+    submission = Column(Integer, default=False, nullable=False)
+
+
+class InternalTip_v_52(Model):
+    __tablename__ = 'internaltip'
+    id = Column(UnicodeText(36), primary_key=True, default=uuid4)
+    tid = Column(Integer, default=1, nullable=False)
+    creation_date = Column(DateTime, default=datetime_now, nullable=False)
+    update_date = Column(DateTime, default=datetime_now, nullable=False)
+    context_id = Column(UnicodeText(36), nullable=False)
+    preview = Column(JSON, default=dict, nullable=False)
+    progressive = Column(Integer, default=0, nullable=False)
+    https = Column(Boolean, default=False, nullable=False)
+    mobile = Column(Boolean, default=False, nullable=False)
+    total_score = Column(Integer, default=0, nullable=False)
+    expiration_date = Column(DateTime, default=datetime_never, nullable=False)
+    enable_two_way_comments = Column(Boolean, default=True, nullable=False)
+    enable_two_way_messages = Column(Boolean, default=True, nullable=False)
+    enable_attachments = Column(Boolean, default=True, nullable=False)
+    enable_whistleblower_identity = Column(Boolean, default=False, nullable=False)
+    label = Column(UnicodeText, default='', nullable=False)
+    additional_questionnaire_id = Column(UnicodeText(36))
+    wb_last_access = Column(DateTime, default=datetime_now, nullable=False)
+    wb_access_counter = Column(Integer, default=0, nullable=False)
+    status = Column(UnicodeText(36), nullable=True)
+    substatus = Column(UnicodeText(36), nullable=True)
+    crypto_tip_pub_key = Column(UnicodeText(56), default='', nullable=False)
+
+
+class Message_v_52(Model):
+    __tablename__ = 'message'
+    id = Column(UnicodeText(36), primary_key=True, default=uuid4)
+    creation_date = Column(DateTime, default=datetime_now, nullable=False)
+    receivertip_id = Column(UnicodeText(36), nullable=False)
+    content = Column(UnicodeText, nullable=False)
+    type = Column(UnicodeText, nullable=False)
+    new = Column(Boolean, default=True, nullable=False)
+
+
+class Questionnaire_v_52(Model):
+    __tablename__ = 'questionnaire'
+    id = Column(UnicodeText(36), primary_key=True, default=uuid4)
+    tid = Column(Integer, default=1, nullable=False)
+    name = Column(UnicodeText, default='', nullable=False)
+    enable_whistleblower_identity = Column(Boolean, default=False, nullable=False)
+    editable = Column(Boolean, default=True, nullable=False)
+
+
+class ReceiverTip_v_52(Model):
+    __tablename__ = 'receivertip'
+    id = Column(UnicodeText(36), primary_key=True, default=uuid4)
+    internaltip_id = Column(UnicodeText(36), nullable=False)
+    receiver_id = Column(UnicodeText(36), nullable=False)
+    last_access = Column(DateTime, default=datetime_null, nullable=False)
+    access_counter = Column(Integer, default=0, nullable=False)
+    label = Column(UnicodeText, default='', nullable=False)
+    can_access_whistleblower_identity = Column(Boolean, default=False, nullable=True)
+    new = Column(Boolean, default=True, nullable=False)
+    enable_notifications = Column(Boolean, default=True, nullable=False)
+    crypto_tip_prv_key = Column(UnicodeText(84), default='', nullable=False)
+
+
+class MigrationScript(MigrationBase):
+    def epilogue(self):
+        # Backfill the counters of the activities of the submissions
+        for itip_id, count in self.session_new.query(self.model_to['Comment'].internaltip_id, func.count(self.model_to['Comment'].id)) \
+                                              .group_by(self.model_to['Comment'].internaltip_id):
+            self.session_new.query(self.model_to['InternalTip']) \
+                            .filter(self.model_to['InternalTip'].id == itip_id) \
+                            .update({'comment_count': count}, synchronize_session=False)
+
+        for itip_id, count in self.session_new.query(self.model_to['InternalFile'].internaltip_id, func.count(self.model_to['InternalFile'].id)) \
+                                              .group_by(self.model_to['InternalFile'].internaltip_id):
+            self.session_new.query(self.model_to['InternalTip']) \
+                            .filter(self.model_to['InternalTip'].id == itip_id) \
+                            .update({'file_count': count}, synchronize_session=False)
+
+        for rtip_id, count in self.session_new.query(self.model_to['Message'].receivertip_id, func.count(self.model_to['Message'].id)) \
+                                              .group_by(self.model_to['Message'].receivertip_id):
+            self.session_new.query(self.model_to['ReceiverTip']) \
+                            .filter(self.model_to['ReceiverTip'].id == rtip_id) \
+                            .update({'message_count': count}, synchronize_session=False)
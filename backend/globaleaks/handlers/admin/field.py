@@ -3,12 +3,13 @@ from sqlalchemy.sql.expression import not_
 
 from globaleaks import models
 from globaleaks.handlers.base import BaseHandler
-from globaleaks.handlers.public import serialize_field, trigger_map
+from globaleaks.handlers.public import db_prepare_questionnaires_serialization, serialize_field, trigger_map
 from globaleaks.models import fill_localized_keys
 from globaleaks.orm import transact
 from globaleaks.rest import errors, requests
 from globaleaks.settings import Settings
 from globaleaks.utils.fs import read_json_file
+from globaleaks.utils.utility import uuid4
 
 
 def fieldtree_ancestors(session, field_id):
@@ -24,6 +25,27 @@ def fieldtree_ancestors(session, field_id):
         yield fieldtree_ancestors(session, field.fieldgroup_id)
 
 
+def db_update_questionnaires_revision(session, tid):
+    """
+    Transaction to renew the revision of the questionnaires affected by a change
+
+    The revision is a random identifier rather than a counter so that a questionnaire
+    deleted and then imported again with the same id never matches a revision cached
+    before the deletion.
+
+    The questionnaires and the field templates of the root tenant are shared with
+    every tenant and so a change on the root tenant affects every questionnaire.
+
+    :param session: An ORM session
+    :param tid: The tenant ID on which the change is performed
+    """
+    q = session.query(models.Questionnaire)
+    if tid != 1:
+        q = q.filter(models.Questionnaire.tid == tid)
+
+    q.update({'revision': uuid4()}, synchronize_session='fetch')
+
+
 def db_create_option_trigger(session, option_id, type, object_id, sufficient):
     """
     Transaction for creating an option trigger
@@ -263,6 +285,8 @@ def create_field(session, tid, request, language):
     """
     field = db_create_field(session, tid, request, language)
 
+    db_update_questionnaires_revision(session, tid)
+
     return serialize_field(session, tid, field, language)
 
 
@@ -325,6 +349,8 @@ def update_field(session, tid, field_id, field, language):
     """
     field = db_update_field(session, tid, field_id, field, language)
 
+    db_update_questionnaires_revision(session, tid)
+
     return serialize_field(session, tid, field, language)
 
 
@@ -347,6 +373,8 @@ def delete_field(session, tid, field_id):
 
     session.delete(field)
 
+    db_update_questionnaires_revision(session, tid)
+
 
 @transact
 def get_fieldtemplate_list(session, tid, language):
@@ -362,7 +390,9 @@ def get_fieldtemplate_list(session, tid, language):
                                                    models.Field.instance == 'template',
                                                    models.Field.fieldgroup_id.is_(None))
 
-    return [serialize_field(session, tid, f, language) for f in templates]
+    data = db_prepare_questionnaires_serialization(session, {1, tid})
+
+    return [serialize_field(session, tid, f, language, data) for f in templates]
 
 
 class FieldTemplatesCollection(BaseHandler):
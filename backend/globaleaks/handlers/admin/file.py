@@ -9,8 +9,9 @@ from globaleaks.handlers.base import BaseHandler
 from globaleaks.handlers.user import can_edit_general_settings_or_raise
 from globaleaks.orm import transact, tw
 from globaleaks.rest import errors
+from globaleaks.rest.cache import FileCache
 from globaleaks.utils.fs import directory_traversal_check
-from globaleaks.utils.utility import uuid4
+from globaleaks.utils.utility import datetime_now, uuid4
 
 
 @transact
@@ -49,6 +50,7 @@ def db_add_file(session, tid, file_id, name, data):
     file_obj.id = file_id
     file_obj.name = name
     file_obj.data = data
+    file_obj.update_date = datetime_now()
     session.merge(file_obj)
 
 
@@ -66,6 +68,20 @@ def db_get_file(session, tid, file_id):
     return file_obj.data if file_obj is not None else ''
 
 
+def db_get_file_and_date(session, tid, file_id):
+    """
+    Transaction returning the content of the file identified by the specified id and the date of its last update
+
+    :param session: An ORM session
+    :param tid: A tenant ID
+    :param file_id: A file ID
+    :return: A tuple (content, update date) or ('', None) if the file does not exist
+    """
+    file_obj = session.query(models.File).filter(models.File.tid == tid, models.File.id == file_id).one_or_none()
+
+    return (file_obj.data, file_obj.update_date) if file_obj is not None else ('', None)
+
+
 class FileInstance(BaseHandler):
     check_roles = 'user'
     invalidate_cache = True
@@ -88,6 +104,7 @@ class FileInstance(BaseHandler):
 
             data = base64.b64encode(data).decode()
             d = yield tw(db_add_file, self.request.tid, id, '', data)
+            FileCache.invalidate(self.request.tid)
         else:
             id = uuid4()
             path = os.path.join(self.state.settings.files_path, id)
@@ -106,6 +123,7 @@ class FileInstance(BaseHandler):
             os.remove(path)
 
         result = yield models.delete(models.File, models.File.tid == self.request.tid, models.File.id == id)
+        FileCache.invalidate(self.request.tid)
         returnValue(result)
 
 
@@ -7,6 +7,7 @@ from globaleaks import models
 from globaleaks.handlers.base import BaseHandler
 from globaleaks.handlers.user import can_edit_general_settings_or_raise
 from globaleaks.orm import transact
+from globaleaks.rest.cache import L10NCache
 
 
 @transact
@@ -51,10 +52,12 @@ class AdminL10NHandler(BaseHandler):
     def put(self, lang):
         yield can_edit_general_settings_or_raise(self)
         result = yield update(self.request.tid, lang, json.loads(self.request.content.read()))
+        L10NCache.invalidate(self.request.tid)
         returnValue(result)
 
     @inlineCallbacks
     def delete(self, lang):
         yield can_edit_general_settings_or_raise(self)
         result = yield models.delete(models.CustomTexts, models.CustomTexts.tid == self.request.tid, models.CustomTexts.lang == lang)
+        L10NCache.invalidate(self.request.tid)
         returnValue(result)
@@ -2,9 +2,10 @@
 from twisted.internet.defer import inlineCallbacks, returnValue
 
 from globaleaks import models, QUESTIONNAIRE_EXPORT_VERSION
+from globaleaks.handlers.admin.field import db_update_questionnaires_revision
 from globaleaks.handlers.admin.step import db_create_step
 from globaleaks.handlers.base import BaseHandler
-from globaleaks.handlers.public import serialize_questionnaire
+from globaleaks.handlers.public import db_serialize_questionnaires, serialize_questionnaire
 from globaleaks.models import fill_localized_keys
 from globaleaks.orm import transact, tw
 from globaleaks.rest import requests
@@ -22,7 +23,7 @@ def db_get_questionnaires(session, tid, language):
     """
     questionnaires = session.query(models.Questionnaire).filter(models.Questionnaire.tid.in_(set([1, tid])))
 
-    return [serialize_questionnaire(session, tid, questionnaire, language) for questionnaire in questionnaires]
+    return db_serialize_questionnaires(session, tid, questionnaires, language)
 
 
 def db_get_questionnaire(session, tid, questionnaire_id, language, serialize_templates=True):
@@ -31,7 +32,7 @@ def db_get_questionnaire(session, tid, questionnaire_id, language, serialize_tem
                                   models.Questionnaire.tid.in_(set([1, tid])),
                                   models.Questionnaire.id == questionnaire_id)
 
-    return serialize_questionnaire(session, tid, questionnaire, language, serialize_templates=serialize_templates)
+    return db_serialize_questionnaires(session, tid, [questionnaire], language, serialize_templates=serialize_templates)[0]
 
 
 def db_create_questionnaire(session, tid, questionnaire_dict, language):
@@ -85,7 +86,9 @@ def db_update_questionnaire(session, tid, questionnaire_id, request, language):
 
     questionnaire.update(request)
 
-    return  serialize_questionnaire(session, tid, questionnaire, language)
+    db_update_questionnaires_revision(session, tid)
+
+    return serialize_questionnaire(session, tid, questionnaire, language)
 
 
 @transact
@@ -196,7 +196,13 @@ class JobsTiming(BaseHandler):
         for job in State.jobs:
             response.append({
                 'name': job.name,
-                'timings': job.last_executions
+                'timings': job.last_executions,
+                'status': job.get_status(),
+                'schedule': job.get_schedule()
             })
 
+        # The jobs executed by the jobs worker are reported by means of its heartbeats
+        if State.jobs_worker is not None:
+            response.extend(State.jobs_worker.jobs)
+
         return response
\ No newline at end of file
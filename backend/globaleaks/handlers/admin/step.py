@@ -1,6 +1,7 @@
 # -*- coding: utf-8
 from globaleaks import models
-from globaleaks.handlers.admin.field import db_create_field, db_update_field, db_create_option_trigger, db_reset_option_triggers
+from globaleaks.handlers.admin.field import db_create_field, db_update_field, db_create_option_trigger, db_reset_option_triggers, \
+    db_update_questionnaires_revision
 from globaleaks.handlers.base import BaseHandler
 from globaleaks.handlers.operation import OperationHandler
 from globaleaks.handlers.public import serialize_step
@@ -34,6 +35,22 @@ def db_create_step(session, tid, request, language):
     return serialize_step(session, tid, step, language)
 
 
+@transact
+def create_step(session, tid, request, language):
+    """
+    Transaction for creating a step
+
+    :param session: An ORM session
+    :param tid: A tenant ID
+    :param request: The request data
+    :param language: the language of the specified steps.
+    :return: a serialization of the object
+    """
+    db_update_questionnaires_revision(session, tid)
+
+    return db_create_step(session, tid, request, language)
+
+
 def db_update_step(session, tid, step_id, request, language):
     """
     Transaction for updating a step
@@ -61,6 +78,8 @@ def db_update_step(session, tid, step_id, request, language):
     for trigger in request.get('triggered_by_options', []):
         db_create_option_trigger(session, tid, trigger['option'], 'step', step.id, trigger.get('sufficient', True))
 
+    db_update_questionnaires_revision(session, tid)
+
     return serialize_step(session, tid, step, language)
 
 
@@ -70,6 +89,8 @@ def db_delete_step(session, tid, step_id):
     session.query(models.Step).filter(models.Step.id == step_id,
                                       models.Step.questionnaire_id.in_(subquery)).delete(synchronize_session=False)
 
+    db_update_questionnaires_revision(session, tid)
+
 
 @transact
 def order_elements(session, handler, req_args, *args, **kwargs):
@@ -87,6 +108,8 @@ def order_elements(session, handler, req_args, *args, **kwargs):
     for i, step_id in enumerate(ids):
         id_dict[step_id].order = i
 
+    db_update_questionnaires_revision(session, handler.request.tid)
+
 
 class StepCollection(OperationHandler):
     check_roles = 'admin'
@@ -97,7 +120,7 @@ class StepCollection(OperationHandler):
         request = self.validate_message(self.request.content.read(),
                                         requests.AdminStepDesc)
 
-        return tw(db_create_step, self.request.tid, request, self.request.language)
+        return create_step(self.request.tid, request, self.request.language)
 
     def operation_descriptors(self):
         return {
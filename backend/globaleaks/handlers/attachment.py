@@ -5,8 +5,10 @@ import base64
 
 from globaleaks import models
 from globaleaks.handlers.base import BaseHandler
+from globaleaks.handlers.events import db_notify_tip_update
 from globaleaks.models import serializers
 from globaleaks.orm import transact
+from globaleaks.rest import errors
 from globaleaks.utils.crypto import GCE
 from globaleaks.utils.utility import datetime_now
 
@@ -44,9 +46,14 @@ def register_ifile_on_db(session, tid, internaltip_id, uploaded_file):
     new_file.filename = uploaded_file['filename']
     new_file.submission = uploaded_file['submission']
     new_file.internaltip_id = internaltip_id
+    new_file.seq = models.db_next_tip_seq(session, itip)
 
     session.add(new_file)
 
+    itip.file_count = models.InternalTip.file_count + 1
+
+    db_notify_tip_update(session, tid, itip.id, 'file')
+
     return serializers.serialize_ifile(session, new_file)
 
 
@@ -57,6 +64,14 @@ class SubmissionAttachment(BaseHandler):
     check_roles = 'none'
     upload_handler = True
 
+    def get_upload_owner(self, token_id):
+        # The uploads of a submission not yet completed are accounted to its token
+        token = self.state.tokens.get(token_id)
+        if token.tid != self.request.tid or not token.solved:
+            raise errors.InternalServerError("TokenFailure: Invalid token")
+
+        return token.id
+
     def post(self, token_id):
         token = self.state.tokens.get(token_id)
 
@@ -72,6 +87,8 @@ class PostSubmissionAttachment(SubmissionAttachment):
     check_roles = 'whistleblower'
     upload_handler = True
 
+    get_upload_owner = BaseHandler.get_upload_owner
+
     def post(self):
         self.uploaded_file['submission'] = False
 
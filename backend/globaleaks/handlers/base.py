@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 import base64
+import calendar
 import collections
 import io
 import json
@@ -11,7 +12,10 @@ from datetime import datetime
 
 from cryptography.hazmat.primitives import constant_time
 from twisted.internet import abstract
+from twisted.internet.defer import Deferred
+from twisted.internet.threads import deferToThread
 from twisted.protocols.basic import FileSender
+from twisted.web.http import datetimeToString, stringToDatetime
 
 from globaleaks.event import track_handler
 from globaleaks.rest import errors, requests
@@ -19,8 +23,8 @@ from globaleaks.utils.crypto import sha512
 from globaleaks.sessions import Sessions
 from globaleaks.settings import Settings
 from globaleaks.utils.crypto import sha512
+from globaleaks.utils import resumable
 from globaleaks.utils.log import log
-from globaleaks.utils.securetempfile import SecureTemporaryFile
 from globaleaks.utils.utility import datetime_now, deferred_sleep
 
 # https://github.com/globaleaks/GlobaLeaks/issues/1601
@@ -31,18 +35,166 @@ mimetypes.add_type('application/woff', '.woff')
 mimetypes.add_type('application/woff2', '.woff2')
 
 
-def serve_file(request, fo):
+def serve_file(request, fo, threaded=False):
     def on_finish(ignored):
         fo.close()
         request.finish()
 
-    filesender = FileSender().beginFileTransfer(fo, request)
+    if threaded:
+        filesender = FileProducer(request, fo).start()
+    else:
+        filesender = FileSender().beginFileTransfer(fo, request)
 
     filesender.addBoth(on_finish)
 
     return filesender
 
 
+class ThreadedProducer(object):
+    """
+    Push producer generating the chunks of a response in a worker thread
+
+    The thread keeps a bounded number of chunks ready ahead of the client
+    and it is suspended while the transport is paused; the deferred returned
+    by start fires only once no chunk is being generated anymore.
+    """
+    def __init__(self, request, lookahead=None):
+        self.request = request
+        self.lookahead = lookahead if lookahead is not None else Settings.download_prefetch_chunks
+        self.finish = Deferred()
+        self.buffer = collections.deque()
+        self.failure = None
+        self.fetching = False
+        self.exhausted = False
+        self.paused = False
+
+    def start(self):
+        self.request.registerProducer(self, True)
+        self.fetch()
+        return self.finish
+
+    def read_chunk(self):
+        """
+        Return the next chunk of the response or an empty value at its end
+
+        This method is executed in a worker thread
+        """
+        raise NotImplementedError
+
+    def release(self):
+        """
+        Release the resources used to generate the response
+        """
+        pass
+
+    def fetch(self):
+        if self.fetching or self.exhausted or len(self.buffer) >= self.lookahead:
+            return
+
+        self.fetching = True
+        deferToThread(self.read_chunk).addCallbacks(self.chunk_ready, self.chunk_failed)
+
+    def chunk_ready(self, data):
+        self.fetching = False
+
+        if data:
+            self.buffer.append(data)
+        else:
+            self.exhausted = True
+
+        self.flush()
+
+    def chunk_failed(self, failure):
+        self.fetching = False
+        self.exhausted = True
+        self.failure = failure
+
+        self.flush()
+
+    def flush(self):
+        while self.request is not None and not self.paused and self.buffer:
+            self.request.write(self.buffer.popleft())
+
+        if self.request is None:
+            self.terminate()
+        elif self.exhausted and not self.buffer:
+            self.stopProducing()
+        else:
+            self.fetch()
+
+    def pauseProducing(self):
+        self.paused = True
+
+    def resumeProducing(self):
+        self.paused = False
+        self.flush()
+
+    def stopProducing(self):
+        if self.request is None:
+            return
+
+        self.request.unregisterProducer()
+        self.request = None
+        self.buffer.clear()
+
+        self.terminate()
+
+    def terminate(self):
+        if self.fetching or self.finish.called:
+            return
+
+        self.release()
+
+        if self.failure is not None:
+            self.finish.errback(self.failure)
+        else:
+            self.finish.callback(None)
+
+
+class FileProducer(ThreadedProducer):
+    """
+    Producer reading a file in a worker thread
+
+    It is used for the files decrypted while they are served, so that
+    decryption does not run on the reactor
+    """
+    def __init__(self, request, fo, lookahead=None):
+        ThreadedProducer.__init__(self, request, lookahead)
+        self.fo = fo
+
+    def read_chunk(self):
+        chunk = []
+        chunk_size = 0
+
+        while chunk_size < abstract.FileDescriptor.bufferSize:
+            data = self.fo.read(abstract.FileDescriptor.bufferSize - chunk_size)
+            if not data:
+                break
+
+            chunk.append(data)
+            chunk_size += len(data)
+
+        return b''.join(chunk)
+
+
+class FileSlice(object):
+    """
+    File-like object limiting the reads of an open file to a range of bytes
+    """
+    def __init__(self, fo, start, end):
+        self.fo = fo
+        self.fo.seek(start)
+        self.remaining = end - start + 1
+
+    def read(self, size):
+        data = self.fo.read(min(size, self.remaining))
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.fo.close()
+
+
 class BaseHandler(object):
     check_roles = 'admin'
     handler_exec_time_threshold = 120
@@ -242,6 +394,110 @@ class BaseHandler(object):
 
         return open(filepath, 'rb')
 
+    def set_cache_headers(self, immutable=False):
+        """
+        Enable caching of the response overriding the default no-cache policy
+
+        :param immutable: A boolean to mark the resource as never changing
+        """
+        self.request.responseHeaders.removeHeader(b'Pragma')
+        self.request.responseHeaders.removeHeader(b'Expires')
+
+        if immutable:
+            self.request.setHeader(b'Cache-control', b'public, max-age=31536000, immutable')
+        else:
+            self.request.setHeader(b'Cache-control', b'no-cache')
+
+    def check_etag(self, etag):
+        """
+        Set the ETag of the response and verify if the copy of the client is still valid
+
+        :param etag: The entity tag of the resource
+        :return: True if the response has been marked as not modified
+        """
+        etag = b'"' + (etag.encode() if isinstance(etag, str) else etag) + b'"'
+
+        self.request.setHeader(b'ETag', etag)
+
+        if_none_match = self.request.headers.get(b'if-none-match')
+        if if_none_match is None:
+            return False
+
+        tags = [x.strip() for x in if_none_match.split(b',')]
+        tags = [x[2:] if x.startswith(b'W/') else x for x in tags]
+        if b'*' in tags or etag in tags:
+            self.request.setResponseCode(304)
+            return True
+
+        return False
+
+    def check_last_modified(self, date):
+        """
+        Set the Last-Modified date of the response and verify if the copy of the client is still valid
+
+        The If-Modified-Since header is evaluated only if If-None-Match is not present.
+
+        :param date: The date of the last modification of the resource
+        :return: True if the response has been marked as not modified
+        """
+        date = calendar.timegm(date.utctimetuple())
+
+        self.request.setHeader(b'Last-Modified', datetimeToString(date))
+
+        if_modified_since = self.request.headers.get(b'if-modified-since')
+        if if_modified_since is None or b'if-none-match' in self.request.headers:
+            return False
+
+        try:
+            if stringToDatetime(if_modified_since) < date:
+                return False
+        except ValueError:
+            return False
+
+        self.request.setResponseCode(304)
+        return True
+
+    def parse_range(self, size, etag):
+        """
+        Parse the Range header of the request supporting a single range of bytes
+
+        :param size: The size of the resource
+        :param etag: The entity tag of the resource used to evaluate If-Range
+        :return: A tuple (start, end) of the requested bytes or None for the entire resource
+        """
+        value = self.request.headers.get(b'range')
+        if value is None:
+            return None
+
+        if_range = self.request.headers.get(b'if-range')
+        if if_range is not None and if_range.strip(b'"') != etag.encode():
+            return None
+
+        unit, _, spec = value.partition(b'=')
+        if unit.strip() != b'bytes' or b',' in spec:
+            return None
+
+        start, sep, end = spec.strip().partition(b'-')
+        if not sep:
+            return None
+
+        try:
+            if not start:
+                start, end = max(size - int(end), 0), size - 1
+            else:
+                start, end = int(start), int(end) if end else size - 1
+        except ValueError:
+            return None
+
+        if start >= size:
+            self.request.setHeader(b'Content-Range', b'bytes */%d' % size)
+            raise errors.RangeNotSatisfiable
+
+        if start > end:
+            return None
+
+        return start, min(end, size - 1)
+
     def write_file(self, filename, fp):
         if isinstance(fp, str):
           fp = self.open_file(fp)
@@ -256,7 +512,17 @@ class BaseHandler(object):
 
         return serve_file(self.request, fp)
 
-    def write_file_as_download(self, filename, fp):
+    def write_file_as_download(self, filename, fp, etag=None):
+        """
+        Serve a file as a download
+
+        Ranges of bytes are served whenever the file is seekable and an
+        entity tag identifying its immutable content is provided
+
+        :param filename: The name of the file proposed to the client
+        :param fp: A path or a file-like object
+        :param etag: An optional entity tag of the file
+        """
         if isinstance(fp, str):
           fp = self.open_file(fp)
 
@@ -265,7 +531,30 @@ class BaseHandler(object):
         self.request.setHeader(b'Content-Disposition',
                                'attachment; filename="%s"' % filename)
 
-        return serve_file(self.request, fp)
+        size = getattr(fp, 'size', None)
+        if size is None and isinstance(fp, io.IOBase):
+            size = os.fstat(fp.fileno()).st_size
+
+        if etag is not None and size is not None:
+            self.request.setHeader(b'ETag', b'"%s"' % etag.encode())
+            self.request.setHeader(b'Accept-Ranges', b'bytes')
+
+            try:
+                byte_range = self.parse_range(size, etag)
+            except errors.RangeNotSatisfiable:
+                fp.close()
+                raise
+
+            if byte_range is None:
+                self.request.setHeader(b'Content-Length', b'%d' % size)
+            else:
+                start, end = byte_range
+                self.request.setResponseCode(206)
+                self.request.setHeader(b'Content-Range', b'bytes %d-%d/%d' % (start, end, size))
+                self.request.setHeader(b'Content-Length', b'%d' % (end - start + 1))
+                fp = FileSlice(fp, start, end)
+
+        return serve_file(self.request, fp, threaded=True)
 
     def get_current_user(self):
         api_session = self.get_api_session()
@@ -313,30 +602,168 @@ class BaseHandler(object):
         if constant_time.bytes_eq(sha512(token), stored_token_hash):
             return self.state.api_token_session
 
-    def process_file_upload(self):
+    def get_upload_owner(self, *args):
+        """
+        Return the identifier used to account and to scope the uploads of the caller
+
+        :param args: The arguments of the handler matched on the path of the request
+        :return: The identifier of the session of the caller
+        """
+        if self.current_user is None:
+            raise errors.NotAuthenticated
+
+        return self.current_user.id
+
+    def get_upload(self, file_id, owner):
+        """
+        Return the upload in progress with the given identifier if it belongs to the caller
+
+        :param file_id: The identifier of the upload
+        :param owner: The identifier to which the uploads of the caller are accounted
+        :return: The temporary file of the upload or None
+        """
+        f = self.state.TempUploadFiles.get(file_id)
+        if f is not None and (f.tid != self.request.tid or f.owner != owner):
+            raise errors.InputValidationError("Invalid chunk")
+
+        return f
+
+    def test_file_upload_chunk(self, *args):
+        """
+        Report if a chunk of an upload of the caller has been already received
+
+        This answers the requests issued by Flow.js with the option testChunks
+        in order to resume an upload after a disconnection or a restart.
+
+        :param args: The arguments of the handler matched on the path of the request
+        :return: True if the chunk has been received
+        """
+        file_id = self.request.args[b'flowIdentifier'][0].decode()
+        chunk_number = int(self.request.args[b'flowChunkNumber'][0]) - 1
+
+        f = self.get_upload(file_id, self.get_upload_owner(*args))
+        if f is None:
+            # The manifest is bound to the tenant and to the identifier of the upload
+            upload = resumable.load_upload(Settings.tmp_path, self.request.tid, file_id)
+            if upload is None:
+                return False
+
+            f = upload[0]
+
+        return f.chunks is not None and 0 <= chunk_number < len(f.chunks) and bool(f.chunks[chunk_number])
+
+    def process_file_upload(self, *args):
         if b'flowFilename' not in self.request.args:
             return
 
+        owner = self.get_upload_owner(*args)
+
         total_file_size = int(self.request.args[b'flowTotalSize'][0])
         file_id = self.request.args[b'flowIdentifier'][0].decode()
 
-        chunk_size = len(self.request.args[b'file'][0])
+        # The content of the chunk is streamed to an encrypted temporary file
+        # while the request is received whenever the body is multipart
+        chunk_file = getattr(self.request, 'upload_file', None)
+        if chunk_file is not None:
+            chunk_size = self.request.upload_file_size
+        else:
+            chunk_size = len(self.request.args[b'file'][0])
+
         if ((chunk_size // (1024 * 1024)) > self.state.tenant_cache[self.request.tid].maximum_filesize or
             (total_file_size // (1024 * 1024)) > self.state.tenant_cache[self.request.tid].maximum_filesize):
             log.err("File upload request rejected: file too big", tid=self.request.tid)
             raise errors.FileTooBig(self.state.tenant_cache[self.request.tid].maximum_filesize)
 
-        if file_id not in self.state.TempUploadFiles:
-            self.state.TempUploadFiles.set(file_id, SecureTemporaryFile(Settings.tmp_path))
+        # Chunks may be received in any order and are written at their offset
+        chunk_number = int(self.request.args[b'flowChunkNumber'][0]) - 1
+        total_chunks = int(self.request.args[b'flowTotalChunks'][0])
+        offset = chunk_number * int(self.request.args[b'flowChunkSize'][0])
+
+        if not 0 <= chunk_number < total_chunks or offset + chunk_size > total_file_size:
+            raise errors.InputValidationError("Invalid chunk")
 
-        f = self.state.TempUploadFiles[file_id]
-        with f.open('w') as f:
-            f.write(self.request.args[b'file'][0])
+        f = self.get_upload(file_id, owner)
+        if f is None:
+            written = 0
 
-            if self.request.args[b'flowChunkNumber'][0] != self.request.args[b'flowTotalChunks'][0]:
-                return None
+            # Uploads interrupted by a restart are resumed from their manifest
+            upload = resumable.load_upload(Settings.tmp_path, self.request.tid, file_id)
+            if upload is not None:
+                if upload[1] != total_file_size:
+                    raise errors.InputValidationError("Invalid chunk")
 
-            f.finalize_write()
+                chunk_len = int(self.request.args[b'flowChunkSize'][0])
+                written = min(upload[0].chunks.count(1) * chunk_len, total_file_size)
+
+            # The bytes already written by resumed uploads and the chunk received
+            # are accounted before registering the upload
+            self.state.TempUploadFiles.check_quota(self.request.tid, owner, written + chunk_size,
+                                                   Settings.upload_tenant_quota,
+                                                   Settings.upload_session_quota)
+
+            if upload is not None:
+                f = upload[0]
+            else:
+                # The first chunk streamed to the disk is adopted as the temporary file of the upload
+                if chunk_number != 0 or chunk_file is None:
+                    f = resumable.create_upload(Settings.tmp_path, self.request.tid, file_id, total_chunks)
+                else:
+                    f = resumable.create_upload(Settings.tmp_path, self.request.tid, file_id, total_chunks, chunk_file)
+
+                    # The file is not deleted anymore at the end of the request
+                    self.request.upload_file = None
+
+            f.tid = self.request.tid
+            f.owner = owner
+            f.size = written
+            f.total_size = total_file_size
+            self.state.TempUploadFiles.set(file_id, f)
+
+        # The chunks must be part of the upload declared by its first chunk
+        if f.chunks is None or len(f.chunks) != total_chunks or f.total_size != total_file_size:
+            raise errors.InputValidationError("Invalid chunk")
+
+        # The chunks received again (e.g. retried after a lost response) are
+        # acknowledged without being rewritten: writing the same offset again
+        # would reuse the AES-CTR keystream of the file
+        if f.chunks[chunk_number]:
+            if f.first_missing_chunk() != -1:
+                return resumable.persist_upload(f, self.request.tid, file_id, total_file_size)
+
+            return None
+
+        # Limit the number of chunks of a file that could be uploaded in parallel
+        if chunk_number >= f.first_missing_chunk() + Settings.upload_parallel_chunks:
+            raise errors.InputValidationError("Chunk out of the upload window")
+
+        # The quotas are accounted on the bytes actually written and not on
+        # the size declared by the client
+        self.state.TempUploadFiles.check_quota(self.request.tid, owner, chunk_size,
+                                               Settings.upload_tenant_quota,
+                                               Settings.upload_session_quota)
+
+        if chunk_file is not f:
+            with f.open('rw'):
+                if chunk_file is None:
+                    f.write_at(offset, self.request.args[b'file'][0])
+                else:
+                    with chunk_file.open('r'):
+                        while True:
+                            data = chunk_file.read(abstract.FileDescriptor.bufferSize)
+                            if not data:
+                                break
+
+                            f.write_at(offset, data)
+                            offset += len(data)
+
+        f.set_chunk(chunk_number)
+        self.state.TempUploadFiles.add_size(file_id, chunk_size)
+
+        if f.first_missing_chunk() != -1:
+            # The manifest is written in a thread and the chunk is acknowledged once durable
+            return resumable.persist_upload(f, self.request.tid, file_id, total_file_size)
+
+        resumable.delete_manifest(f, self.request.tid, file_id)
 
         mime_type, _ = mimetypes.guess_type(self.request.args[b'flowFilename'][0].decode())
         if mime_type is None:
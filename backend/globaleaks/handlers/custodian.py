@@ -8,14 +8,19 @@ from globaleaks.rest import requests
 from globaleaks.utils.utility import datetime_to_ISO8601, datetime_now
 
 
-def serialize_identityaccessrequest(session, identityaccessrequest):
-    itip, user = session.query(models.InternalTip, models.User) \
-                      .filter(models.InternalTip.id == models.ReceiverTip.internaltip_id,
-                              models.ReceiverTip.id == identityaccessrequest.receivertip_id,
-                              models.User.id == models.ReceiverTip.receiver_id).one()
-
-    reply_user = session.query(models.User) \
-                        .filter(models.User.id == identityaccessrequest.reply_user_id).one_or_none()
+def serialize_identityaccessrequest(session, identityaccessrequest, data=None):
+    if data is not None:
+        itip = data['itip']
+        user = data['users'][data['rtips'][identityaccessrequest.receivertip_id].receiver_id]
+        reply_user = data['users'].get(identityaccessrequest.reply_user_id)
+    else:
+        itip, user = session.query(models.InternalTip, models.User) \
+                          .filter(models.InternalTip.id == models.ReceiverTip.internaltip_id,
+                                  models.ReceiverTip.id == identityaccessrequest.receivertip_id,
+                                  models.User.id == models.ReceiverTip.receiver_id).one()
+
+        reply_user = session.query(models.User) \
+                            .filter(models.User.id == identityaccessrequest.reply_user_id).one_or_none()
 
     return {
         'id': identityaccessrequest.id,
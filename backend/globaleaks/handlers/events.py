@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+#
+# Handler streaming to the recipients the notifications of the updates of their tips
+import json
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred
+from twisted.internet.task import LoopingCall
+
+from globaleaks import models
+from globaleaks.handlers.base import BaseHandler
+from globaleaks.rest import errors
+from globaleaks.sessions import Sessions
+from globaleaks.settings import Settings
+
+
+class EventsHub(object):
+    """
+    Registry of the event streams opened by the users of each tenant
+    """
+    streams = {}
+
+    @classmethod
+    def count(cls, tid):
+        return len(cls.streams.get(tid, {}))
+
+    @classmethod
+    def subscribe(cls, stream):
+        streams = cls.streams.setdefault(stream.tid, {})
+
+        # Each session is allowed to keep a single stream open
+        previous = streams.get(stream.session_id)
+        if previous is not None:
+            previous.close()
+
+        streams[stream.session_id] = stream
+
+    @classmethod
+    def unsubscribe(cls, stream):
+        streams = cls.streams.get(stream.tid, {})
+        if streams.get(stream.session_id) is stream:
+            del streams[stream.session_id]
+
+    @classmethod
+    def publish(cls, tid, user_id, data):
+        for stream in list(cls.streams.get(tid, {}).values()):
+            if stream.user_id == user_id:
+                stream.send(data)
+
+
+class EventStream(object):
+    """
+    Server-sent events stream bound to a user session
+    """
+    def __init__(self, request, session):
+        self.request = request
+        self.tid = session.tid
+        self.user_id = session.user_id
+        self.session_id = session.id
+        self.heartbeat = LoopingCall(self.send_heartbeat)
+        self.finished = Deferred()
+
+    def open(self):
+        EventsHub.subscribe(self)
+
+        self.request.write(b'retry: %d\n\n' % (Settings.events_heartbeat_interval * 1000))
+
+        self.heartbeat.start(Settings.events_heartbeat_interval, now=False)
+
+        return self.finished
+
+    def send(self, data):
+        self.request.write(b'data: ' + json.dumps(data, separators=(',', ':')).encode() + b'\n\n')
+
+    def send_heartbeat(self):
+        # The membership test avoids extending the lifetime of the session
+        if self.session_id not in Sessions:
+            self.close()
+        else:
+            self.request.write(b': heartbeat\n\n')
+
+    def close(self, *args):
+        if self.heartbeat.running:
+            self.heartbeat.stop()
+
+        EventsHub.unsubscribe(self)
+
+        if not self.finished.called:
+            self.finished.callback(None)
+
+
+def db_notify_tip_update(session, tid, itip_id, event_type, rtip_id=None):
+    """
+    Transaction scheduling the notification of the update of a tip
+    to the recipients involved
+
+    The notifications are dispatched only once the transaction is committed
+
+    :param session: An ORM session
+    :param tid: A tenant ID
+    :param itip_id: The ID of the submission updated
+    :param event_type: The type of the update
+    :param rtip_id: An optional rtip ID used to notify a single recipient
+    """
+    if not EventsHub.count(tid):
+        return
+
+    query = session.query(models.ReceiverTip.id, models.ReceiverTip.receiver_id) \
+                   .filter(models.ReceiverTip.internaltip_id == itip_id)
+
+    if rtip_id is not None:
+        query = query.filter(models.ReceiverTip.id == rtip_id)
+
+    events = session.info.setdefault('events', [])
+    for x in query:
+        events.append((tid, x[1], {'type': event_type, 'tip_id': x[0]}))
+
+
+@event.listens_for(Session, 'after_commit')
+def dispatch_events(session):
+    for x in session.info.pop('events', []):
+        reactor.callFromThread(EventsHub.publish, *x)
+
+
+@event.listens_for(Session, 'after_rollback')
+def discard_events(session):
+    session.info.pop('events', None)
+
+
+class EventsHandler(BaseHandler):
+    """
+    Handler streaming to the recipients the notifications of the updates of their tips
+    """
+    check_roles = 'receiver'
+    handler_exec_time_threshold = 86400
+
+    def get(self):
+        if EventsHub.count(self.request.tid) >= Settings.events_connections_limit:
+            raise errors.TooManyConnections
+
+        self.request.setHeader(b'Content-Type', b'text/event-stream')
+        self.request.setHeader(b'X-Accel-Buffering', b'no')
+
+        stream = EventStream(self.request, self.current_user)
+
+        self.request.notifyFinish().addBoth(stream.close)
+
+        return stream.open()
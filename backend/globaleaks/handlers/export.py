@@ -1,9 +1,10 @@
 # -*- coding: utf-8 -*-
 #
 # API handling export of submissions
+from collections import OrderedDict
 from io import BytesIO
 from twisted.internet import abstract
-from twisted.internet.defer import Deferred, inlineCallbacks
+from twisted.internet.defer import inlineCallbacks
 from twisted.internet.threads import deferToThread
 
 from globaleaks import models
@@ -11,17 +12,38 @@ from globaleaks.handlers.admin.context import admin_serialize_context
 from globaleaks.handlers.admin.node import db_admin_serialize_node
 from globaleaks.handlers.admin.notification import db_get_notification
 from globaleaks.handlers.admin.submission_statuses import db_get_submission_statuses
-from globaleaks.handlers.base import BaseHandler
+from globaleaks.handlers.base import BaseHandler, ThreadedProducer
 from globaleaks.handlers.rtip import db_access_rtip, serialize_rtip
-from globaleaks.handlers.submission import decrypt_tip
+from globaleaks.handlers.submission import decrypt_tip_with_key
 from globaleaks.handlers.user import user_serialize_user
 from globaleaks.orm import transact
+from globaleaks.rest import errors, requests
 from globaleaks.utils.crypto import Base64Encoder, GCE
 from globaleaks.utils.templating import Templating
 from globaleaks.utils.utility import msdos_encode
 from globaleaks.utils.zipstream import ZipStream
 
 
+@transact
+def check_tips_export(session, tid, user_id, rtips_ids):
+    """
+    Transaction verifying that a user can access all the tips to be exported
+
+    :param session: An ORM session
+    :param tid: A tenant ID
+    :param user_id: A user ID
+    :param rtips_ids: The list of IDs of the tips to be exported
+    """
+    count = session.query(models.ReceiverTip) \
+                   .filter(models.ReceiverTip.id.in_(rtips_ids),
+                           models.ReceiverTip.receiver_id == user_id,
+                           models.ReceiverTip.internaltip_id == models.InternalTip.id,
+                           models.InternalTip.tid == tid).count()
+
+    if count != len(rtips_ids):
+        raise errors.ModelNotFound(models.ReceiverTip)
+
+
 @transact
 def get_tip_export(session, tid, user_id, rtip_id, language):
     rtip, itip = db_access_rtip(session, tid, user_id, rtip_id)
@@ -46,35 +68,64 @@ def get_tip_export(session, tid, user_id, rtip_id, language):
     }
 
 
-class ZipStreamProducer(object):
-    """Streaming producter for ZipStream"""
+def prepare_tip_export(user_key, tip_export, prefix=''):
+    """
+    Decrypt a tip export and return the list of the files to be archived
 
-    def __init__(self, handler, zipstreamObject):
-        self.finish = Deferred()
-        self.handler = handler
-        self.zipstreamObject = zipstreamObject
+    The key of the tip is decrypted once and reused for all its files
+
+    :param user_key: The private key of the user
+    :param tip_export: A tip export as returned by get_tip_export
+    :param prefix: A path prefix for the files of the tip inside the archive
+    :return: The list of the files to be archived
+    """
+    if tip_export['crypto_tip_prv_key']:
+        tip_key = GCE.asymmetric_decrypt(user_key, tip_export['crypto_tip_prv_key'])
+
+        tip_export['tip'] = decrypt_tip_with_key(tip_key, tip_export['tip'])
+
+        for file_dict in tip_export['tip']['rfiles'] + tip_export['tip']['wbfiles']:
+            if file_dict.get('forged') or 'path' not in file_dict:
+                continue
 
-    def start(self):
-        self.handler.request.registerProducer(self, False)
-        return self.finish
+            file_dict['fo'] = GCE.streaming_encryption_open('DECRYPT', tip_key, file_dict['path'])
+            del file_dict['path']
 
-    def resumeProducing(self):
-        if not self.handler:
-            return
+    for file_dict in tip_export['tip']['rfiles']:
+        file_dict['name'] = prefix + 'files/' + file_dict['name']
 
-        data = self.zip_chunk()
-        if data:
-            self.handler.request.write(data)
-        else:
-            self.stopProducing()
+    for file_dict in tip_export['tip']['wbfiles']:
+        file_dict['name'] = prefix + 'files_attached_from_recipients/' + file_dict['name']
 
-    def stopProducing(self):
-        self.handler.request.unregisterProducer()
-        self.handler.request.finish()
-        self.handler = None
-        self.finish.callback(None)
+    tip_export['comments'] = tip_export['tip']['comments']
+    tip_export['messages'] = tip_export['tip']['messages']
+
+    files = tip_export['tip']['rfiles'] + tip_export['tip']['wbfiles']
+    del tip_export['tip']['rfiles'], tip_export['tip']['wbfiles']
+
+    export_template = Templating().format_template(tip_export['notification']['export_template'], tip_export).encode()
+    export_template = msdos_encode(export_template.decode()).encode()
+
+    files.append({'fo': BytesIO(export_template),
+                  'name': prefix + 'data.txt',
+                  'size': len(export_template),
+                  'forged': True})
+
+    return files
+
+
+class ZipStreamProducer(ThreadedProducer):
+    """
+    Streaming producer for ZipStream
+
+    The chunks of the archive, including the decryption and the compression
+    of the files, are generated in a worker thread
+    """
+    def __init__(self, handler, zipstreamObject):
+        ThreadedProducer.__init__(self, handler.request)
+        self.zipstreamObject = zipstreamObject
 
-    def zip_chunk(self):
+    def read_chunk(self):
         chunk = []
         chunk_size = 0
 
@@ -87,6 +138,9 @@ class ZipStreamProducer(object):
 
         return b''.join(chunk)
 
+    def release(self):
+        self.zipstreamObject.close()
+
 
 class ExportHandler(BaseHandler):
     check_roles = 'receiver'
@@ -99,38 +153,58 @@ class ExportHandler(BaseHandler):
                                           rtip_id,
                                           self.request.language)
 
-        if tip_export['crypto_tip_prv_key']:
-            tip_export['tip'] = yield deferToThread(decrypt_tip, self.current_user.cc, tip_export['crypto_tip_prv_key'], tip_export['tip'])
+        files = yield deferToThread(prepare_tip_export, self.current_user.cc, tip_export)
+
+        self.request.setHeader(b'X-Download-Options', b'noopen')
+        self.request.setHeader(b'Content-Type', b'application/octet-stream')
+        self.request.setHeader(b'Content-Disposition', b'attachment; filename="submission.zip"')
 
-            for file_dict in tip_export['tip']['rfiles'] + tip_export['tip']['wbfiles']:
-                if file_dict.get('forged'):
-                    continue
+        self.zip_stream = iter(ZipStream(files))
 
-                tip_prv_key = GCE.asymmetric_decrypt(self.current_user.cc, tip_export['crypto_tip_prv_key'])
-                file_dict['fo'] = GCE.streaming_encryption_open('DECRYPT', tip_prv_key, file_dict['path'])
-                del file_dict['path']
+        yield ZipStreamProducer(self, self.zip_stream).start()
 
-        for file_dict in tip_export['tip']['rfiles']:
-            file_dict['name'] = 'files/' + file_dict['name']
 
-        for file_dict in tip_export['tip']['wbfiles']:
-            file_dict['name'] = 'files_attached_from_recipients/' + file_dict['name']
+class TipsExportHandler(BaseHandler):
+    """
+    Handler streaming the export of multiple tips into a single archive
 
-        tip_export['comments'] = tip_export['tip']['comments']
-        tip_export['messages'] = tip_export['tip']['messages']
+    The tips are loaded and decrypted one at a time while the archive is
+    streamed so that the memory used does not depend on the number of tips
+    """
+    check_roles = 'receiver'
+    handler_exec_time_threshold = 3600
 
-        files = tip_export['tip']['rfiles'] + tip_export['tip']['wbfiles']
-        del tip_export['tip']['rfiles'], tip_export['tip']['wbfiles']
+    @inlineCallbacks
+    def post(self):
+        request = self.validate_message(self.request.content.read(), requests.TipsExportDesc)
 
-        export_template = Templating().format_template(tip_export['notification']['export_template'], tip_export).encode()
-        export_template = msdos_encode(export_template.decode()).encode()
+        rtips_ids = list(OrderedDict.fromkeys(request['rtips']))
 
-        files.append({'fo': BytesIO(export_template), 'name': 'data.txt', 'forged': True})
+        yield check_tips_export(self.request.tid, self.current_user.user_id, rtips_ids)
 
         self.request.setHeader(b'X-Download-Options', b'noopen')
         self.request.setHeader(b'Content-Type', b'application/octet-stream')
-        self.request.setHeader(b'Content-Disposition', b'attachment; filename="submission.zip"')
+        self.request.setHeader(b'Content-Disposition', b'attachment; filename="submissions.zip"')
 
-        self.zip_stream = iter(ZipStream(files))
+        disconnected = []
+        self.request.notifyFinish().addBoth(disconnected.append)
 
-        yield ZipStreamProducer(self, self.zip_stream).start()
+        zip_stream = ZipStream([])
+
+        for rtip_id in rtips_ids:
+            if disconnected:
+                return
+
+            tip_export = yield get_tip_export(self.request.tid,
+                                              self.current_user.user_id,
+                                              rtip_id,
+                                              self.request.language)
+
+            prefix = 'submission-%d/' % tip_export['tip']['progressive']
+
+            files = yield deferToThread(prepare_tip_export, self.current_user.cc, tip_export, prefix)
+
+            yield ZipStreamProducer(self, zip_stream.zip_files(files)).start()
+
+        if not disconnected:
+            self.request.write(zip_stream.archive_footer())
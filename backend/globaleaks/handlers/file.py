@@ -7,9 +7,13 @@ import os
 from twisted.internet.defer import inlineCallbacks, returnValue
 
 from globaleaks import models
-from globaleaks.handlers.admin.file import db_get_file
+from globaleaks.handlers.admin.file import db_get_file_and_date
 from globaleaks.handlers.base import BaseHandler
 from globaleaks.orm import transact, tw
+from globaleaks.rest import errors
+from globaleaks.rest.cache import FileCache
+from globaleaks.state import State
+from globaleaks.utils.crypto import sha256
 
 
 appfiles = {
@@ -17,6 +21,28 @@ appfiles = {
     'script': 'application/javascript'
 }
 
+# Signatures of the image formats accepted for the logos and the pictures
+image_signatures = [
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpeg'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif')
+]
+
+
+def get_image_type(data):
+    """
+    Detect the type of an image from its signature
+
+    :param data: The content of the image
+    :return: The subtype of the image or png if not recognized
+    """
+    for signature, subtype in image_signatures:
+        if data.startswith(signature):
+            return subtype
+
+    return 'png'
+
 
 def db_mark_file_for_secure_deletion(session, directory, filename):
     """
@@ -48,6 +74,82 @@ def get_file_id(session, tid, name):
     return models.db_get(session, models.File, models.File.tid == tid, models.File.name == name).id
 
 
+@inlineCallbacks
+def get_cached_file(tid, id):
+    """
+    Retrieve a customization file stored on the database using the memory cache
+
+    :param tid: A tenant ID
+    :param id: A file ID
+    :return: The cache entry of the file
+    """
+    entry = FileCache.get(tid, id)
+    if entry is None:
+        generation = FileCache.generation
+
+        data, last_modified = yield tw(db_get_file_and_date, tid, id)
+        if not data and State.tenant_cache[tid]['mode'] != 'default':
+            data, last_modified = yield tw(db_get_file_and_date, 1, id)
+
+        entry = FileCache.set(tid, id, data, last_modified, generation)
+
+    returnValue(entry)
+
+
+def db_get_img(session, tid, obj_type, obj_id):
+    """
+    Transaction returning the content of an image
+
+    :param session: An ORM session
+    :param tid: A tenant on which performing the lookup
+    :param obj_type: The type of the object the image is associated to
+    :param obj_id: The ID of the object the image is associated to
+    :return: The base64 content of the image
+    """
+    if obj_type == 'contexts':
+        x = session.query(models.ContextImg.data).filter(models.ContextImg.id == obj_id,
+                                                         models.Context.id == obj_id,
+                                                         models.Context.tid == tid).one_or_none()
+    else:
+        x = session.query(models.UserImg.data).filter(models.UserImg.id == obj_id,
+                                                      models.User.id == obj_id,
+                                                      models.User.tid == tid).one_or_none()
+
+    return x[0] if x is not None else ''
+
+
+class ImgHandler(BaseHandler):
+    """
+    Handler that provide public access to images referenced by the hash of their content
+    """
+    check_roles = 'none'
+
+    @inlineCallbacks
+    def get(self, obj_type, obj_id, hash):
+        self.set_cache_headers(immutable=True)
+
+        # The content identified by an hash never changes
+        if self.check_etag(hash):
+            return
+
+        if obj_type == 'files':
+            entry = yield get_cached_file(self.request.tid, obj_id)
+            if not entry['data'] or entry['hash'] != hash:
+                raise errors.ResourceNotFound
+
+            x = entry['data']
+        else:
+            x = yield tw(db_get_img, self.request.tid, obj_type, obj_id)
+            if not x or sha256(x).decode() != hash:
+                raise errors.ResourceNotFound
+
+            x = base64.b64decode(x)
+
+        self.request.setHeader(b'Content-Type', 'image/' + get_image_type(x))
+
+        returnValue(x)
+
+
 class FileHandler(BaseHandler):
     """
     Handler that provide public access to configuration files
@@ -57,13 +159,25 @@ class FileHandler(BaseHandler):
     @inlineCallbacks
     def get(self, name):
         if name in appfiles:
-            x = yield tw(db_get_file, self.request.tid, name)
-            if not x and self.state.tenant_cache[self.request.tid]['mode'] != 'default':
-                x = yield tw(db_get_file, 1, name)
+            entry = yield get_cached_file(self.request.tid, name)
 
+            self.set_cache_headers()
             self.request.setHeader(b'Content-Type', appfiles[name])
-            x = base64.b64decode(x)
-            returnValue(x)
+            self.request.setHeader(b'Vary', b'Accept-Encoding')
+
+            # The representations with different encodings have different entity tags
+            gzip = b'gzip' in self.request.headers.get(b'accept-encoding', b'')
+            etag = entry['etag'] + '-gz' if gzip else entry['etag']
+
+            etag_match = self.check_etag(etag)
+            if self.check_last_modified(entry['last_modified']) or etag_match:
+                return
+
+            if gzip:
+                self.request.setHeader(b'Content-encoding', b'gzip')
+                returnValue(entry['gzip'])
+
+            returnValue(entry['data'])
         else:
             id = yield get_file_id(self.request.tid, name)
             path = os.path.abspath(os.path.join(self.state.settings.files_path, id))
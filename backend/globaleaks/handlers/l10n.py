@@ -3,12 +3,14 @@
 # Handlers dealing with download of texts translations and customizations
 import os
 
-from globaleaks import models
+from twisted.internet.defer import inlineCallbacks, returnValue
+
+from globaleaks import models, LANGUAGES_SUPPORTED_CODES
 from globaleaks.handlers.base import BaseHandler
-from globaleaks.models.config import ConfigFactory
-from globaleaks.orm import transact
-from globaleaks.rest import errors
+from globaleaks.orm import tw
+from globaleaks.rest.cache import L10NCache
 from globaleaks.settings import Settings
+from globaleaks.state import State
 from globaleaks.utils.fs import directory_traversal_check, read_json_file
 
 
@@ -22,8 +24,31 @@ def langfile_path(lang):
     return os.path.abspath(os.path.join(Settings.client_path, 'l10n', '%s.json' % lang))
 
 
-@transact
-def get_l10n(session, tid, lang):
+def load_l10n_bundles():
+    """
+    Function that parses once the translation bundles of all the supported languages
+    """
+    for lang in LANGUAGES_SUPPORTED_CODES:
+        get_l10n_bundle(lang)
+
+
+def get_l10n_bundle(lang):
+    """
+    Function that returns the immutable translation bundle of a language
+
+    :param lang: A requested language
+    :return: A read-only mapping of the texts shipped with the client
+    """
+    bundle = L10NCache.get_bundle(lang)
+    if bundle is None:
+        path = langfile_path(lang)
+        directory_traversal_check(Settings.client_path, path)
+        bundle = L10NCache.set_bundle(lang, read_json_file(path))
+
+    return bundle
+
+
+def db_get_custom_texts(session, tid, lang):
     """
     Transaction for retrieving the custom texts configured for a specific language
 
@@ -32,28 +57,57 @@ def get_l10n(session, tid, lang):
     :param lang: A requested language
     :return: A dictionary containing the custom texts configured for a specific language
     """
-    if tid != 1:
-        config = ConfigFactory(session, tid)
+    custom_texts = session.query(models.CustomTexts).filter(models.CustomTexts.lang == lang, models.CustomTexts.tid == tid).one_or_none()
+
+    return custom_texts.texts if custom_texts is not None else {}
+
+
+@inlineCallbacks
+def get_l10n(tid, lang):
+    """
+    Retrieve the texts of a language merged with the customizations of a tenant
 
-        if config.get_val('mode') != 'default':
-            tid = 1
+    :param tid:  The tenant ID of the tenant on which perform the lookup
+    :param lang: A requested language
+    :return: The cache entry of the payload
+    """
+    entry = L10NCache.get(tid, lang)
+    if entry is None:
+        get_l10n_bundle(lang)
 
-    path = langfile_path(lang)
-    directory_traversal_check(Settings.client_path, path)
+        generation = L10NCache.generation
 
-    custom_texts = session.query(models.CustomTexts).filter(models.CustomTexts.lang == lang, models.CustomTexts.tid == tid).one_or_none()
-    custom_texts = custom_texts.texts if custom_texts is not None else {}
+        custom_tid = tid
+        if tid != 1 and State.tenant_cache[tid]['mode'] != 'default':
+            custom_tid = 1
 
-    texts = read_json_file(path)
+        custom_texts = yield tw(db_get_custom_texts, custom_tid, lang)
 
-    texts.update(custom_texts)
+        entry = L10NCache.set(tid, lang, custom_texts, generation)
 
-    return texts
+    returnValue(entry)
 
 
 class L10NHandler(BaseHandler):
     check_roles = 'none'
-    cache_resource = True
 
+    @inlineCallbacks
     def get(self, lang):
-        return get_l10n(self.request.tid, lang)
+        entry = yield get_l10n(self.request.tid, lang)
+
+        self.set_cache_headers()
+        self.request.setHeader(b'Content-Type', b'application/json')
+        self.request.setHeader(b'Vary', b'Accept-Encoding')
+
+        # The representations with different encodings have different entity tags
+        gzip = b'gzip' in self.request.headers.get(b'accept-encoding', b'')
+        etag = entry['etag'] + '-gz' if gzip else entry['etag']
+
+        if self.check_etag(etag):
+            return
+
+        if gzip:
+            self.request.setHeader(b'Content-encoding', b'gzip')
+            returnValue(entry['gzip'])
+
+        returnValue(entry['data'])
@@ -13,6 +13,7 @@ from globaleaks.models.config import ConfigFactory, ConfigL10NFactory
 from globaleaks.models.enums import EnumContextStatus
 from globaleaks.orm import transact
 from globaleaks.state import State
+from globaleaks.utils.crypto import sha256
 from globaleaks.utils.sets import merge_dicts
 
 
@@ -25,25 +26,6 @@ trigger_map = {
 }
 
 
-def db_get_triggers_by_type(session, type, object_id):
-    """
-    Transaction for retrieving field triggers associated to an object given the type of trigger
-
-    :param session: An ORM session
-    :param type: The type of trigger involved in the lookup
-    :param object_id: The object on which performing the lookup
-    :return: A list of triggers descriptors
-    """
-    ret = []
-
-    m = trigger_map[type]
-    for x in session.query(models.FieldOption.field_id, models.FieldOption.id, m.sufficient) \
-                    .filter(models.FieldOption.id == m.option_id, m.object_id == object_id):
-        ret.append({'field': x[0], 'option': x[1], 'sufficient': x[2]})
-
-    return ret
-
-
 def db_prepare_contexts_serialization(session, contexts):
     """
     Transaction to prepare and optimize context serialization
@@ -58,7 +40,7 @@ def db_prepare_contexts_serialization(session, contexts):
 
     if contexts_ids:
         for o in session.query(models.ContextImg).filter(models.ContextImg.id.in_(contexts_ids)):
-            data['imgs'][o.id] = o.data
+            data['imgs'][o.id] = sha256(o.data).decode()
 
         for o in session.query(models.ReceiverContext).filter(models.ReceiverContext.context_id.in_(contexts_ids)).order_by(models.ReceiverContext.order):
             if o.context_id not in data['receivers']:
@@ -83,69 +65,114 @@ def db_prepare_receivers_serialization(session, receivers):
 
     if receivers_ids:
         for o in session.query(models.UserImg).filter(models.UserImg.id.in_(receivers_ids)):
-            data['imgs'][o.id] = o.data
+            data['imgs'][o.id] = sha256(o.data).decode()
 
     return data
 
 
-def db_prepare_fields_serialization(session, fields):
+def db_prepare_questionnaires_serialization(session, tids):
     """
-    Transaction to prepare and optimize fields serialization
+    Transaction to prepare and optimize questionnaires serialization
+
+    The whole graph of steps, fields, attributes, options and triggers
+    of the specified tenants is loaded with a fixed number of queries
+    and indexed in memory.
 
     :param session: An ORM session
-    :param fields: The list of receivers for which preparing the serialization
+    :param tids: The set of tenants IDs whose questionnaires are involved in the serialization
     :return: The set of retrieved objects necessary for optimizing the serialization
     """
     ret = {
+        'steps': {},
         'fields': {},
+        'children': {},
+        'step_children': {},
         'attrs': {},
-        'options': {}
+        'options': {},
+        'triggers': {}
     }
 
-    fields_ids = []
-    for f in fields:
-        fields_ids.append(f.id)
-        if f.template_id is not None:
-            fields_ids.append(f.template_id)
-        if f.template_override_id is not None:
-            fields_ids.append(f.template_override_id)
-
-    tmp = copy.deepcopy(fields_ids)
-    while tmp:
-        fs = session.query(models.Field).filter(models.Field.fieldgroup_id.in_(tmp))
-
-        tmp = []
-        for f in fs:
-            tmp.append(f.id)
-            if f.template_id is not None:
-                tmp.append(f.template_id)
-            if f.template_override_id is not None:
-                tmp.append(f.template_override_id)
-
-            if f.fieldgroup_id not in ret['fields']:
-                ret['fields'][f.fieldgroup_id] = []
-            ret['fields'][f.fieldgroup_id].append(f)
-
-        fields_ids.extend(tmp)
-
-    if fields_ids:
-        objs = session.query(models.FieldAttr).filter(models.FieldAttr.field_id.in_(fields_ids))
-        for obj in objs:
-            if obj.field_id not in ret['attrs']:
-                ret['attrs'][obj.field_id] = []
-            ret['attrs'][obj.field_id].append(obj)
-
-        objs = session.query(models.FieldOption)\
-                    .filter(models.FieldOption.field_id.in_(fields_ids)) \
-                    .order_by(models.FieldOption.order)
-        for obj in objs:
-            if obj.field_id not in ret['options']:
-                ret['options'][obj.field_id] = []
-            ret['options'][obj.field_id].append(obj)
+    def index(d, key, value):
+        if key not in d:
+            d[key] = []
+
+        d[key].append(value)
+
+    for s in session.query(models.Step) \
+                    .filter(models.Step.questionnaire_id == models.Questionnaire.id,
+                            models.Questionnaire.tid.in_(tids)) \
+                    .order_by(models.Step.order):
+        index(ret['steps'], s.questionnaire_id, s)
+
+    for f in session.query(models.Field).filter(models.Field.tid.in_(tids)):
+        ret['fields'][f.id] = f
+
+        if f.fieldgroup_id is not None:
+            index(ret['children'], f.fieldgroup_id, f)
+
+        if f.step_id is not None:
+            index(ret['step_children'], f.step_id, f)
+
+    for o in session.query(models.FieldAttr) \
+                    .filter(models.FieldAttr.field_id == models.Field.id,
+                            models.Field.tid.in_(tids)):
+        index(ret['attrs'], o.field_id, o)
+
+    for o in session.query(models.FieldOption) \
+                    .filter(models.FieldOption.field_id == models.Field.id,
+                            models.Field.tid.in_(tids)) \
+                    .order_by(models.FieldOption.order):
+        index(ret['options'], o.field_id, o)
+
+    for x in session.query(models.FieldOptionTriggerField.object_id,
+                           models.FieldOption.field_id,
+                           models.FieldOption.id,
+                           models.FieldOptionTriggerField.sufficient) \
+                    .filter(models.FieldOption.id == models.FieldOptionTriggerField.option_id,
+                            models.FieldOptionTriggerField.object_id == models.Field.id,
+                            models.Field.tid.in_(tids)):
+        index(ret['triggers'], x[0], {'field': x[1], 'option': x[2], 'sufficient': x[3]})
+
+    for x in session.query(models.FieldOptionTriggerStep.object_id,
+                           models.FieldOption.field_id,
+                           models.FieldOption.id,
+                           models.FieldOptionTriggerStep.sufficient) \
+                    .filter(models.FieldOption.id == models.FieldOptionTriggerStep.option_id,
+                            models.FieldOptionTriggerStep.object_id == models.Step.id,
+                            models.Step.questionnaire_id == models.Questionnaire.id,
+                            models.Questionnaire.tid.in_(tids)):
+        index(ret['triggers'], x[0], {'field': x[1], 'option': x[2], 'sufficient': x[3]})
 
     return ret
 
 
+class QuestionnaireCache(object):
+    """
+    Memoization of questionnaires serializations.
+
+    Entries are indexed by tenant, questionnaire, language and template
+    serialization mode and are valid only for the questionnaire revision
+    they have been generated from.
+    """
+    memory_cache_dict = {}
+
+    @classmethod
+    def get(cls, tid, questionnaire, language, serialize_templates):
+        entry = cls.memory_cache_dict.get((tid, questionnaire.id, language, serialize_templates))
+        if entry is not None and entry[0] == questionnaire.revision:
+            return copy.deepcopy(entry[1])
+
+    @classmethod
+    def set(cls, tid, questionnaire, language, serialize_templates, data):
+        cls.memory_cache_dict[(tid, questionnaire.id, language, serialize_templates)] = (questionnaire.revision, copy.deepcopy(data))
+
+        return data
+
+    @classmethod
+    def invalidate(cls):
+        cls.memory_cache_dict.clear()
+
+
 def db_serialize_node(session, tid, language):
     """
     Serialize the public node configuration.
@@ -166,7 +193,7 @@ def db_serialize_node(session, tid, language):
 
     records = session.query(models.File.id, models.File.data).filter(models.File.tid == tid, models.File.id.in_(['logo', 'favicon', 'css', 'script']))
     for x in records:
-        ret_dict[x[0]] = x[1] if x[0] in ['logo', 'favicon'] else True
+        ret_dict[x[0]] = sha256(x[1]).decode() if x[0] in ['logo', 'favicon'] else True
 
     if tid != 1:
         root_tenant_node = ConfigFactory(session, 1)
@@ -190,7 +217,7 @@ def db_serialize_node(session, tid, language):
             records = session.query(models.File.id, models.File.data).filter(models.File.tid == 1, models.File.id.in_(['logo', 'favicon', 'css', 'script']))
             for x in records:
                 if not ret_dict.get(x[0]):
-                    ret_dict[x[0]] = x[1] if x[0] in ['logo', 'favicon'] else True
+                    ret_dict[x[0]] = sha256(x[1]).decode() if x[0] in ['logo', 'favicon'] else True
 
     return ret_dict
 
@@ -293,13 +320,13 @@ def serialize_field(session, tid, field, language, data=None, serialize_template
     :return: The serialized resource
     """
     if data is None:
-        data = db_prepare_fields_serialization(session, [field])
+        data = db_prepare_questionnaires_serialization(session, {1, tid, field.tid})
 
     f_to_serialize = field
     if field.template_override_id is not None and serialize_templates is True:
-        f_to_serialize = session.query(models.Field).filter(models.Field.id == field.template_override_id).one_or_none()
+        f_to_serialize = data['fields'].get(field.template_override_id)
     elif field.template_id is not None and serialize_templates is True:
-        f_to_serialize = session.query(models.Field).filter(models.Field.id == field.template_id).one_or_none()
+        f_to_serialize = data['fields'].get(field.template_id)
 
     attrs = {}
     if field.template_id is None or field.template_id in special_fields:
@@ -309,7 +336,7 @@ def serialize_field(session, tid, field, language, data=None, serialize_template
         for attr in data['attrs'].get(field.template_id, {}):
             attrs[attr.name] = serialize_field_attr(attr, language)
 
-    children = [serialize_field(session, tid, f, language) for f in data['fields'].get(f_to_serialize.id, [])]
+    children = [serialize_field(session, tid, f, language, data) for f in data['children'].get(f_to_serialize.id, [])]
     children.sort(key=lambda f: (f['y'], f['x']))
 
     ret_dict = {
@@ -330,7 +357,7 @@ def serialize_field(session, tid, field, language, data=None, serialize_template
         'y': field.y,
         'width': field.width,
         'triggered_by_score': field.triggered_by_score,
-        'triggered_by_options': db_get_triggers_by_type(session, 'field', field.id),
+        'triggered_by_options': data['triggers'].get(field.id, []),
         'options': [serialize_field_option(o, language) for o in data['options'].get(f_to_serialize.id, [])],
         'children': children
     }
@@ -338,7 +365,7 @@ def serialize_field(session, tid, field, language, data=None, serialize_template
     return get_localized_values(ret_dict, field, field.localized_keys, language)
 
 
-def serialize_step(session, tid, step, language, serialize_templates=True):
+def serialize_step(session, tid, step, language, data=None, serialize_templates=True):
     """
     Serialize a step.
 
@@ -346,14 +373,14 @@ def serialize_step(session, tid, step, language, serialize_templates=True):
     :param tid: A tenant ID
     :param step: The option to be serialized
     :param language: The language to be used during serialization
+    :param data: The dictionary of prefetched resources
     :param serialize_templates: A boolean to require template serialization
     :return: The serialized resource
     """
-    children = session.query(models.Field).filter(models.Field.step_id == step.id)
-
-    data = db_prepare_fields_serialization(session, children)
+    if data is None:
+        data = db_prepare_questionnaires_serialization(session, {1, tid})
 
-    children = [serialize_field(session, tid, f, language, data, serialize_templates=serialize_templates) for f in children]
+    children = [serialize_field(session, tid, f, language, data, serialize_templates=serialize_templates) for f in data['step_children'].get(step.id, [])]
     children.sort(key=lambda f: (f['y'], f['x']))
 
     ret_dict = {
@@ -361,14 +388,14 @@ def serialize_step(session, tid, step, language, serialize_templates=True):
         'questionnaire_id': step.questionnaire_id,
         'order': step.order,
         'triggered_by_score': step.triggered_by_score,
-        'triggered_by_options': db_get_triggers_by_type(session, 'step', step.id),
+        'triggered_by_options': data['triggers'].get(step.id, []),
         'children': children
     }
 
     return get_localized_values(ret_dict, step, step.localized_keys, language)
 
 
-def serialize_questionnaire(session, tid, questionnaire, language, serialize_templates=True):
+def serialize_questionnaire(session, tid, questionnaire, language, data=None, serialize_templates=True):
     """
     Serialize a questionnaire.
 
@@ -376,23 +403,54 @@ def serialize_questionnaire(session, tid, questionnaire, language, serialize_tem
     :param tid: A tenant ID
     :param questionnaire: A questionnaire model
     :param language: The language to be used during serialization
+    :param data: The dictionary of prefetched resources
     :param serialize_templates: A boolean to require template serialization
     :return: The serialized resource
     """
-    steps = session.query(models.Step).filter(models.Step.questionnaire_id == questionnaire.id,
-                                              models.Questionnaire.id == questionnaire.id) \
-                                       .order_by(models.Step.order)
+    if data is None:
+        data = db_prepare_questionnaires_serialization(session, {1, tid, questionnaire.tid})
 
     ret_dict = {
         'id': questionnaire.id,
         'editable': questionnaire.editable and questionnaire.tid == tid,
         'name': questionnaire.name,
-        'steps': [serialize_step(session, tid, s, language, serialize_templates=serialize_templates) for s in steps]
+        'steps': [serialize_step(session, tid, s, language, data, serialize_templates=serialize_templates) for s in data['steps'].get(questionnaire.id, [])]
     }
 
     return get_localized_values(ret_dict, questionnaire, questionnaire.localized_keys, language)
 
 
+def db_serialize_questionnaires(session, tid, questionnaires, language, serialize_templates=True):
+    """
+    Transaction to serialize a list of questionnaires reusing the memoized serializations
+
+    The questionnaires graph is loaded in bulk only if at least one of the questionnaires
+    is not available in the cache for its current revision.
+
+    :param session: An ORM session
+    :param tid: A tenant ID
+    :param questionnaires: The list of questionnaire models to be serialized
+    :param language: The language to be used during serialization
+    :param serialize_templates: A boolean to require template serialization
+    :return: The list of serialized questionnaires
+    """
+    ret = []
+    data = None
+
+    for questionnaire in questionnaires:
+        x = QuestionnaireCache.get(tid, questionnaire, language, serialize_templates)
+        if x is None:
+            if data is None:
+                data = db_prepare_questionnaires_serialization(session, {1, tid})
+
+            x = serialize_questionnaire(session, tid, questionnaire, language, data, serialize_templates)
+            QuestionnaireCache.set(tid, questionnaire, language, serialize_templates, x)
+
+        ret.append(x)
+
+    return ret
+
+
 def serialize_receiver(session, user, language, data=None):
     """
     Serialize a receiver.
@@ -438,7 +496,7 @@ def db_get_questionnaires(session, tid, language):
                                     models.Context.status != EnumContextStatus.disabled.value,
                                     models.Context.tid == tid)
 
-    return [serialize_questionnaire(session, tid, questionnaire, language) for questionnaire in questionnaires]
+    return db_serialize_questionnaires(session, tid, questionnaires, language)
 
 
 def db_get_contexts(session, tid, language):
@@ -3,61 +3,109 @@
 # API handling recipient user functionalities
 import base64
 import json
+from collections import OrderedDict
 
-from sqlalchemy.sql.expression import func, distinct
+from twisted.internet.defer import inlineCallbacks, returnValue
 
 from globaleaks import models
 from globaleaks.handlers.base import BaseHandler
 from globaleaks.handlers.rtip import db_postpone_expiration, db_delete_itips
-from globaleaks.handlers.submission import db_serialize_archived_preview_schema
-from globaleaks.orm import transact
+from globaleaks.handlers.submission import db_get_archived_schemas
+from globaleaks.orm import transact, tw
 from globaleaks.rest import requests, errors
+from globaleaks.settings import Settings
 from globaleaks.state import State
 from globaleaks.utils.crypto import GCE
-from globaleaks.utils.utility import datetime_to_ISO8601
+from globaleaks.utils.utility import datetime_now, datetime_to_ISO8601, ISO8601_to_datetime
 
 
-@transact
-def get_receivertips(session, tid, receiver_id, user_key, language):
+tips_sort_keys = {
+    'creation_date': models.InternalTip.creation_date,
+    'update_date': models.InternalTip.update_date,
+    'expiration_date': models.InternalTip.expiration_date,
+    'last_access': models.ReceiverTip.last_access,
+    'progressive': models.InternalTip.progressive,
+    'score': models.InternalTip.total_score,
+    'label': models.ReceiverTip.label,
+    'status': models.InternalTip.status
+}
+
+
+def db_get_receivertips(session, tid, receiver_id, user_key, language, query=None, preview_cache=None):
     """
-    Return list of submissions received by the specified receiver
+    Return the list of submissions received by the specified receiver matching the specified query
 
     :param session: An ORM session
     :param tid: The tenant ID
     :param receiver_id: The receiver ID
     :param user_key: The user key to be used for decrypting data
     :param language: The language to be used during data serialization
-    :return: A list of submissions descriptors
+    :param query: A dictionary of filtering, sorting and pagination options
+    :param preview_cache: A dictionary where to keep the decrypted previews of the submissions
+    :return: A tuple with the list of submissions descriptors and the total number of matching submissions
     """
     rtip_summary_list = []
 
-    rtip_ids = []
-    itip_ids = []
+    if query is None:
+        query = {}
+
+    if preview_cache is None:
+        preview_cache = {}
+
+    # The preview is the one of the questionnaire used for the submission
+    questionnaire_hash = session.query(models.InternalTipAnswers.questionnaire_hash) \
+                                .filter(models.InternalTipAnswers.internaltip_id == models.InternalTip.id) \
+                                .order_by(models.InternalTipAnswers.creation_date) \
+                                .limit(1).correlate(models.InternalTip).as_scalar()
+
+    filters = [models.ReceiverTip.receiver_id == receiver_id,
+               models.InternalTip.id == models.ReceiverTip.internaltip_id,
+               models.InternalTip.tid == tid,
+               questionnaire_hash.in_(session.query(models.ArchivedSchema.hash))]
+
+    if 'status' in query:
+        filters.append(models.InternalTip.status == query['status'])
+
+    if 'context_id' in query:
+        filters.append(models.InternalTip.context_id == query['context_id'])
 
-    messages_by_rtip = {}
-    comments_by_itip = {}
-    internalfiles_by_itip = {}
+    if 'label' in query:
+        filters.append(models.ReceiverTip.label == query['label'])
+
+    if 'date_from' in query:
+        filters.append(models.InternalTip.creation_date >= query['date_from'])
+
+    if 'date_to' in query:
+        filters.append(models.InternalTip.creation_date <= query['date_to'])
+
+    total = session.query(models.ReceiverTip.id).filter(*filters).count()
+
+    order_by = tips_sort_keys[query.get('sort', 'creation_date')]
+    order_by = order_by.desc() if query.get('order') == 'desc' else order_by.asc()
 
-    # Fetch rtip, internaltip and associated questionnaire schema
     result = session.query(models.ReceiverTip,
                            models.InternalTip,
-                           models.ArchivedSchema) \
-                    .filter(models.ReceiverTip.receiver_id == receiver_id,
-                            models.InternalTip.id == models.ReceiverTip.internaltip_id,
-                            models.InternalTipAnswers.internaltip_id == models.InternalTip.id,
-                            models.ArchivedSchema.hash == models.InternalTipAnswers.questionnaire_hash,
-                            models.InternalTip.tid == tid)
+                           questionnaire_hash) \
+                    .filter(*filters) \
+                    .order_by(order_by, models.ReceiverTip.id) \
+                    .offset(query.get('offset', 0)) \
+                    .limit(query.get('limit', -1)).all()
 
-    for rtip, itip, aqs in result:
-        rtip_ids.append(rtip.id)
-        itip_ids.append(itip.id)
+    schemas = db_get_archived_schemas(session, set(x[2] for x in result), language)
 
+    for rtip, itip, questionnaire_hash in result:
         preview = itip.preview
 
         if itip.crypto_tip_pub_key:
-            tip_key = GCE.asymmetric_decrypt(user_key, base64.b64decode(rtip.crypto_tip_prv_key))
+            cached = preview_cache.get(rtip.id)
+            if cached is not None and cached[0] == itip.update_date:
+                preview = cached[1]
+            else:
+                tip_key = GCE.asymmetric_decrypt(user_key, base64.b64decode(rtip.crypto_tip_prv_key))
+
+                preview = json.loads(GCE.asymmetric_decrypt(tip_key, base64.b64decode(itip.preview.encode())).decode())
 
-            preview = json.loads(GCE.asymmetric_decrypt(tip_key, base64.b64decode(itip.preview.encode())).decode())
+                preview_cache[rtip.id] = (itip.update_date, preview)
 
         rtip_summary_list.append({
             'id': rtip.id,
@@ -71,47 +119,83 @@ def get_receivertips(session, tid, receiver_id, user_key, language):
             'context_id': itip.context_id,
             'access_counter': rtip.access_counter,
             'https': itip.https,
-            'preview_schema': db_serialize_archived_preview_schema(aqs.preview, language),
+            'preview_schema': schemas[questionnaire_hash]['preview'],
             'preview': preview,
             'score': itip.total_score,
             'label': rtip.label,
             'status': itip.status,
-            'substatus': itip.substatus
+            'substatus': itip.substatus,
+            'file_count': itip.file_count,
+            'comment_count': itip.comment_count,
+            'message_count': rtip.message_count
         })
 
-    # Fetch messages count
-    result = session.query(models.ReceiverTip.id,
-                           func.count(distinct(models.Message.id))) \
-                    .filter(models.Message.receivertip_id == models.ReceiverTip.id,
-                            models.ReceiverTip.id.in_(rtip_ids)) \
-                    .group_by(models.ReceiverTip.id)
-    for rtip_id, count in result:
-        messages_by_rtip[rtip_id] = count
-
-    # Fetch comments count
-    result = session.query(models.InternalTip.id,
-                           func.count(distinct(models.Comment.id))) \
-                    .filter(models.Comment.internaltip_id == models.InternalTip.id,
-                            models.InternalTip.id.in_(itip_ids)) \
-                    .group_by(models.InternalTip.id)
-    for itip_id, count in result:
-        comments_by_itip[itip_id] = count
-
-    # Fetch attachment count
-    result = session.query(models.InternalTip.id,
-                           func.count(distinct(models.InternalFile.id))) \
-                    .filter(models.InternalFile.internaltip_id == models.InternalTip.id,
-                            models.InternalTip.id.in_(itip_ids)) \
-                    .group_by(models.InternalTip.id)
-    for itip_id, count in result:
-        internalfiles_by_itip[itip_id] = count
-
-    for elem in rtip_summary_list:
-        elem['file_count'] = internalfiles_by_itip.get(itip.id, 0)
-        elem['comment_count'] = comments_by_itip.get(itip.id, 0)
-        elem['message_count'] = messages_by_rtip.get(rtip.id, 0)
-
-    return rtip_summary_list
+    return rtip_summary_list, total
+
+
+@transact
+def get_receivertips(session, tid, receiver_id, user_key, language, query=None, preview_cache=None):
+    """
+    Return list of submissions received by the specified receiver
+
+    :param session: An ORM session
+    :param tid: The tenant ID
+    :param receiver_id: The receiver ID
+    :param user_key: The user key to be used for decrypting data
+    :param language: The language to be used during data serialization
+    :param query: A dictionary of filtering, sorting and pagination options
+    :param preview_cache: A dictionary where to keep the decrypted previews of the submissions
+    :return: A list of submissions descriptors
+    """
+    return db_get_receivertips(session, tid, receiver_id, user_key, language, query, preview_cache)[0]
+
+
+def serialize_tips_operation(operation):
+    """
+    Serialize the progress of a bulk operation on submissions
+
+    :param operation: The model to be serialized
+    :return: A serialized descriptor of the operation
+    """
+    return {
+        'id': operation.id,
+        'operation': operation.operation,
+        'creation_date': datetime_to_ISO8601(operation.creation_date),
+        'update_date': datetime_to_ISO8601(operation.update_date),
+        'total': operation.total,
+        'done': operation.done,
+        'completed': operation.done >= operation.total
+    }
+
+
+def db_perform_tips_operation_chunk(session, operation):
+    """
+    Transaction performing a bulk operation on the next chunk of its submissions
+
+    :param session: An ORM session
+    :param operation: The operation to be advanced
+    :return: A boolean indicating if other submissions remain to be processed
+    """
+    chunk = operation.rtips[:Settings.tips_operations_chunk_size]
+
+    if chunk:
+        itips = session.query(models.InternalTip) \
+                       .filter(models.ReceiverTip.receiver_id == operation.receiver_id,
+                               models.ReceiverTip.id.in_(chunk),
+                               models.InternalTip.id == models.ReceiverTip.internaltip_id,
+                               models.InternalTip.tid == operation.tid)
+
+        if operation.operation == 'postpone':
+            for itip in itips:
+                db_postpone_expiration(session, itip)
+        else:
+            db_delete_itips(session, [itip.id for itip in itips])
+
+    operation.rtips = operation.rtips[len(chunk):]
+    operation.done += len(chunk)
+    operation.update_date = datetime_now()
+
+    return len(operation.rtips) > 0
 
 
 @transact
@@ -119,11 +203,15 @@ def perform_tips_operation(session, tid, receiver_id, operation, rtips_ids):
     """
     Transaction for performing operation on submissions (postpone/delete)
 
+    The first chunk of submissions is processed immediately while the
+    remaining ones are processed in background by the TipsOperations job
+
     :param session: An ORM session
     :param tid: A tenant ID
     :param receiver_id: A recipient ID
     :param operation: An operation command (postpone/delete)
     :param rtips_ids: The set of submissions on which performing the specified operation
+    :return: A serialized descriptor of the operation
     """
     receiver = models.db_get(session, models.User,
                              models.User.id == receiver_id)
@@ -131,21 +219,44 @@ def perform_tips_operation(session, tid, receiver_id, operation, rtips_ids):
     can_postpone_expiration = State.tenant_cache[tid].can_postpone_expiration or receiver.can_postpone_expiration
     can_delete_submission = State.tenant_cache[tid].can_delete_submission or receiver.can_delete_submission
 
-    itips = session.query(models.InternalTip) \
-                   .filter(models.ReceiverTip.receiver_id == receiver_id,
-                           models.ReceiverTip.id.in_(rtips_ids),
-                           models.InternalTip.id == models.ReceiverTip.internaltip_id,
-                           models.InternalTip.tid == tid)
+    if not (operation == 'postpone' and can_postpone_expiration) and \
+       not (operation == 'delete' and can_delete_submission):
+        raise errors.ForbiddenOperation
 
-    if operation == 'postpone' and can_postpone_expiration:
-        for itip in itips:
-            db_postpone_expiration(session, itip)
+    rtips_ids = list(OrderedDict.fromkeys(rtips_ids))
 
-    elif operation == 'delete' and can_delete_submission:
-        db_delete_itips(session, [itip.id for itip in itips])
+    tips_operation = models.TipsOperation()
+    tips_operation.tid = tid
+    tips_operation.receiver_id = receiver_id
+    tips_operation.operation = operation
+    tips_operation.rtips = rtips_ids
+    tips_operation.total = len(rtips_ids)
+    session.add(tips_operation)
 
-    else:
-        raise errors.ForbiddenOperation
+    db_perform_tips_operation_chunk(session, tips_operation)
+
+    session.flush()
+
+    return serialize_tips_operation(tips_operation)
+
+
+@transact
+def get_tips_operation(session, tid, receiver_id, operation_id):
+    """
+    Transaction retrieving the progress of a bulk operation on submissions
+
+    :param session: An ORM session
+    :param tid: A tenant ID
+    :param receiver_id: A recipient ID
+    :param operation_id: The ID of the operation
+    :return: A serialized descriptor of the operation
+    """
+    operation = models.db_get(session, models.TipsOperation,
+                              models.TipsOperation.id == operation_id,
+                              models.TipsOperation.receiver_id == receiver_id,
+                              models.TipsOperation.tid == tid)
+
+    return serialize_tips_operation(operation)
 
 
 class TipsCollection(BaseHandler):
@@ -155,11 +266,57 @@ class TipsCollection(BaseHandler):
     """
     check_roles = 'receiver'
 
+    def parse_query(self):
+        """
+        Parse the filtering, sorting and pagination options of the request
+
+        :return: A dictionary of options
+        """
+        query = {}
+
+        for key, value in self.request.args.items():
+            key, value = key.decode(), value[0].decode()
+
+            if key in ['status', 'context_id', 'label']:
+                query[key] = value
+            elif key in ['date_from', 'date_to']:
+                try:
+                    query[key] = ISO8601_to_datetime(value)
+                except ValueError:
+                    raise errors.InputValidationError('invalid date')
+            elif key in ['limit', 'offset']:
+                if not value.isdigit():
+                    raise errors.InputValidationError('invalid %s' % key)
+
+                query[key] = int(value)
+            elif key == 'sort':
+                if value not in tips_sort_keys:
+                    raise errors.InputValidationError('invalid sort key')
+
+                query[key] = value
+            elif key == 'order':
+                if value not in ['asc', 'desc']:
+                    raise errors.InputValidationError('invalid order')
+
+                query[key] = value
+
+        return query
+
+    @inlineCallbacks
     def get(self):
-        return get_receivertips(self.request.tid,
-                                    self.current_user.user_id,
-                                    self.current_user.cc,
-                                    self.request.language)
+        query = self.parse_query()
+
+        rtips, total = yield tw(db_get_receivertips,
+                                self.request.tid,
+                                self.current_user.user_id,
+                                self.current_user.cc,
+                                self.request.language,
+                                query,
+                                self.current_user.preview_cache)
+
+        self.request.setHeader(b'X-Total-Count', b'%d' % total)
+
+        returnValue(rtips)
 
 
 class TipsOperations(BaseHandler):
@@ -178,3 +335,15 @@ class TipsOperations(BaseHandler):
                                       self.current_user.user_id,
                                       request['operation'],
                                       request['rtips'])
+
+
+class TipsOperationInstance(BaseHandler):
+    """
+    Handler that enables to track the progress of the operations on submissions
+    """
+    check_roles = 'receiver'
+
+    def get(self, operation_id):
+        return get_tips_operation(self.request.tid,
+                                  self.current_user.user_id,
+                                  operation_id)
@@ -13,6 +13,7 @@ from globaleaks.handlers.admin.node import db_admin_serialize_node
 from globaleaks.handlers.admin.notification import db_get_notification
 from globaleaks.handlers.base import BaseHandler
 from globaleaks.handlers.custodian import serialize_identityaccessrequest
+from globaleaks.handlers.events import db_notify_tip_update
 from globaleaks.handlers.file import db_mark_file_for_secure_deletion
 from globaleaks.handlers.operation import OperationHandler
 from globaleaks.handlers.submission import serialize_usertip, decrypt_tip
@@ -66,17 +67,97 @@ def update_tip_submission_status(session, tid, user_id, rtip_id, status_id, subs
 
     db_update_submission_status(session, user_id, itip, status_id, substatus_id)
 
+    db_notify_tip_update(session, tid, itip.id, 'status')
 
-def receiver_serialize_rfile(session, rfile):
+
+def db_prepare_tip_serialization(session, itip, rtip=None, since=None):
+    """
+    Transaction fetching in a constant number of queries the models
+    referenced by the serialization of a tip
+
+    :param session: An ORM session
+    :param itip: The submission to be serialized
+    :param rtip: The rtip to be serialized or None when serializing the whistleblower tip
+    :param since: An optional update sequence used to fetch only the comments, messages and ifiles created after it
+    :return: A dictionary of the fetched models
+    """
+    data = {
+        'itip': itip,
+        'rtips': {},
+        'users': {},
+        'comments': [],
+        'messages': [],
+        'ifiles': {},
+        'rfiles': [],
+        'wbfiles': [],
+        'iars': []
+    }
+
+    for x in session.query(models.ReceiverTip).filter(models.ReceiverTip.internaltip_id == itip.id):
+        data['rtips'][x.id] = x
+
+    comments = session.query(models.Comment).filter(models.Comment.internaltip_id == itip.id)
+    ifiles = session.query(models.InternalFile).filter(models.InternalFile.internaltip_id == itip.id)
+
+    if since is not None:
+        comments = comments.filter(models.Comment.seq > since)
+
+        # The rfiles reference the ifiles of the whole submission
+        if rtip is None:
+            ifiles = ifiles.filter(models.InternalFile.seq > since)
+
+    data['comments'] = comments.all()
+
+    for x in ifiles:
+        data['ifiles'][x.id] = x
+
+    if data['rtips']:
+        rtips_ids = [rtip.id] if rtip is not None else list(data['rtips'])
+
+        messages = session.query(models.Message) \
+                          .filter(models.Message.receivertip_id.in_(rtips_ids))
+
+        wbfiles = session.query(models.WhistleblowerFile) \
+                         .filter(models.WhistleblowerFile.receivertip_id.in_(list(data['rtips'])))
+
+        if since is not None:
+            messages = messages.filter(models.Message.seq > since)
+
+        data['messages'] = messages.all()
+        data['wbfiles'] = wbfiles.all()
+
+    if rtip is not None:
+        data['rfiles'] = session.query(models.ReceiverFile) \
+                                .filter(models.ReceiverFile.receivertip_id == rtip.id).all()
+
+        data['iars'] = session.query(models.IdentityAccessRequest) \
+                              .filter(models.IdentityAccessRequest.receivertip_id == rtip.id).all()
+
+    users_ids = set(x.receiver_id for x in data['rtips'].values())
+    users_ids.update(x.author_id for x in data['comments'] if x.author_id)
+    users_ids.update(x.reply_user_id for x in data['iars'] if x.reply_user_id)
+
+    if users_ids:
+        for x in session.query(models.User).filter(models.User.id.in_(users_ids)):
+            data['users'][x.id] = x
+
+    return data
+
+
+def receiver_serialize_rfile(session, rfile, data=None):
     """
     Transaction returning a serialized descriptor of an rfile
 
     :param session: An ORM session
     :param rfile: A model to be serialized
+    :param data: The prefetched data returned by db_prepare_tip_serialization
     :return: A serialized description of the model specified
     """
-    ifile = session.query(models.InternalFile) \
-                   .filter(models.InternalFile.id == rfile.internalfile_id).one_or_none()
+    if data is not None:
+        ifile = data['ifiles'].get(rfile.internalfile_id)
+    else:
+        ifile = session.query(models.InternalFile) \
+                       .filter(models.InternalFile.id == rfile.internalfile_id).one_or_none()
 
     if ifile is None or rfile.status == 'unavailable':
         return {
@@ -108,16 +189,20 @@ def receiver_serialize_rfile(session, rfile):
     }
 
 
-def receiver_serialize_wbfile(session, wbfile):
+def receiver_serialize_wbfile(session, wbfile, data=None):
     """
     Transaction returning a serialized descriptor of an wbfile
 
     :param session: An ORM session
     :param wbfile: A model to be serialized
+    :param data: The prefetched data returned by db_prepare_tip_serialization
     :return: A serialized description of the model specified
     """
-    rtip = models.db_get(session, models.ReceiverTip,
-                         models.ReceiverTip.id == wbfile.receivertip_id)
+    if data is not None:
+        rtip = data['rtips'][wbfile.receivertip_id]
+    else:
+        rtip = models.db_get(session, models.ReceiverTip,
+                             models.ReceiverTip.id == wbfile.receivertip_id)
 
     return {
         'id': wbfile.id,
@@ -133,12 +218,13 @@ def receiver_serialize_wbfile(session, wbfile):
     }
 
 
-def serialize_comment(session, comment):
+def serialize_comment(session, comment, data=None):
     """
     Transaction returning a serialized descriptor of a comment
 
     :param session: An ORM session
     :param comment: A model to be serialized
+    :param data: The prefetched data returned by db_prepare_tip_serialization
     :return: A serialized description of the model specified
     """
     author = 'Recipient'
@@ -146,8 +232,11 @@ def serialize_comment(session, comment):
     if comment.type == 'whistleblower':
         author = 'Whistleblower'
     elif comment.author_id is not None:
-        _author = session.query(models.User) \
-                         .filter(models.User.id == comment.author_id).one_or_none()
+        if data is not None:
+            _author = data['users'].get(comment.author_id)
+        else:
+            _author = session.query(models.User) \
+                             .filter(models.User.id == comment.author_id).one_or_none()
 
         if _author is not None:
             author = _author.public_name
@@ -161,18 +250,22 @@ def serialize_comment(session, comment):
     }
 
 
-def serialize_message(session, message):
+def serialize_message(session, message, data=None):
     """
     Transaction returning a serialized descriptor of a message
 
     :param session: An ORM session
     :param message: A model to be serialized
+    :param data: The prefetched data returned by db_prepare_tip_serialization
     :return: A serialized description of the model specified
     """
-    receiver_involved = session.query(models.User) \
-                               .filter(models.User.id == models.ReceiverTip.receiver_id,
-                                       models.ReceiverTip.id == models.Message.receivertip_id,
-                                       models.Message.id == message.id).one()
+    if data is not None:
+        receiver_involved = data['users'][data['rtips'][message.receivertip_id].receiver_id]
+    else:
+        receiver_involved = session.query(models.User) \
+                                   .filter(models.User.id == models.ReceiverTip.receiver_id,
+                                           models.ReceiverTip.id == models.Message.receivertip_id,
+                                           models.Message.id == message.id).one()
 
     if message.type == 'whistleblower':
         author = 'Whistleblower'
@@ -214,16 +307,79 @@ def serialize_rtip(session, rtip, itip, language):
     else:
         ret['label'] = itip.label
 
-    ret['comments'] = db_get_itip_comment_list(session, itip.id)
-    ret['messages'] = db_get_itip_message_list(session, rtip.id)
-    ret['rfiles'] = db_receiver_get_rfile_list(session, rtip.id)
-    ret['wbfiles'] = db_receiver_get_wbfile_list(session, itip.id)
-    ret['iars'] = db_get_rtip_identityaccessrequest_list(session, rtip.id)
+    data = db_prepare_tip_serialization(session, itip, rtip)
+
+    ret['comments'] = db_get_itip_comment_list(session, itip.id, data)
+    ret['messages'] = db_get_itip_message_list(session, rtip.id, data)
+    ret['rfiles'] = db_receiver_get_rfile_list(session, rtip.id, data)
+    ret['wbfiles'] = db_receiver_get_wbfile_list(session, itip.id, data)
+    ret['iars'] = db_get_rtip_identityaccessrequest_list(session, rtip.id, data)
     ret['enable_notifications'] = bool(rtip.enable_notifications)
 
     return ret
 
 
+def serialize_rtip_delta(session, rtip, itip, since):
+    """
+    Transaction returning the changes of a tip since the specified update sequence
+
+    The comments and messages are limited to the ones created after the
+    specified update sequence while the rfiles, the wbfiles and the identity
+    access requests, which are updated in place or deleted, are always
+    returned in full.
+
+    :param session: An ORM session
+    :param rtip: A model to be serialized
+    :param itip: A itip object referenced by the model to be serialized
+    :param since: The update sequence of the last update received by the client
+    :return: A serialized description of the changes of the model specified
+    """
+    data = db_prepare_tip_serialization(session, itip, rtip, since)
+
+    return {
+        'id': rtip.id,
+        'internaltip_id': itip.id,
+        'receiver_id': rtip.receiver_id,
+        'update_date': datetime_to_ISO8601(itip.update_date),
+        'expiration_date': datetime_to_ISO8601(itip.expiration_date),
+        'wb_last_access': datetime_to_ISO8601(itip.wb_last_access),
+        'status': itip.status,
+        'substatus': itip.substatus,
+        'label': rtip.label if State.tenant_cache[itip.tid].enable_private_labels else itip.label,
+        'enable_two_way_comments': itip.enable_two_way_comments,
+        'enable_two_way_messages': itip.enable_two_way_messages,
+        'enable_attachments': itip.enable_attachments,
+        'enable_notifications': bool(rtip.enable_notifications),
+        'comments': db_get_itip_comment_list(session, itip.id, data),
+        'messages': db_get_itip_message_list(session, rtip.id, data),
+        'rfiles': db_receiver_get_rfile_list(session, rtip.id, data),
+        'wbfiles': db_receiver_get_wbfile_list(session, itip.id, data),
+        'iars': db_get_rtip_identityaccessrequest_list(session, rtip.id, data)
+    }
+
+
+def parse_since(request):
+    """
+    Parse the optional since argument used to request the changes of a tip
+
+    :param request: The request
+    :return: The update sequence specified by the client or None
+    """
+    since = request.args.get(b'since')
+    if not since:
+        return None
+
+    try:
+        since = int(since[0])
+    except ValueError:
+        since = -1
+
+    if since < 0:
+        raise errors.InputValidationError('invalid update sequence')
+
+    return since
+
+
 def db_access_rtip(session, tid, user_id, rtip_id):
     """
     Transaction retrieving an rtip and performing basic access checks
@@ -269,18 +425,22 @@ def db_access_wbfile(session, tid, user_id, wbfile_id):
     return wbfile
 
 
-def db_receiver_get_rfile_list(session, rtip_id):
+def db_receiver_get_rfile_list(session, rtip_id, data=None):
     """
     Transaction retrieving the list of rfiles attached to an rtip
 
     :param session: An ORM session
     :param rtip_id: A rtip ID
+    :param data: The prefetched data returned by db_prepare_tip_serialization
     :return: A list of serializations of the retrieved models
     """
-    rfiles = session.query(models.ReceiverFile) \
-                    .filter(models.ReceiverFile.receivertip_id == rtip_id)
+    if data is not None:
+        rfiles = data['rfiles']
+    else:
+        rfiles = session.query(models.ReceiverFile) \
+                        .filter(models.ReceiverFile.receivertip_id == rtip_id)
 
-    return [receiver_serialize_rfile(session, rfile) for rfile in rfiles]
+    return [receiver_serialize_rfile(session, rfile, data) for rfile in rfiles]
 
 
 @transact
@@ -295,25 +455,26 @@ def receiver_get_rfile_list(session, rtip_id):
     return db_receiver_get_rfile_list(session, rtip_id)
 
 
-def db_receiver_get_wbfile_list(session, itip_id):
+def db_receiver_get_wbfile_list(session, itip_id, data=None):
     """
     Transaction retrieving the list of rfiles attached to an itip
 
     :param session: An ORM session
     :param itip_id: A itip ID
+    :param data: The prefetched data returned by db_prepare_tip_serialization
     :return: A list of serializations of the retrieved models
     """
-    rtips = session.query(models.ReceiverTip) \
-                   .filter(models.ReceiverTip.internaltip_id == itip_id)
-
-    rtips_ids = [rt.id for rt in rtips]
+    if data is not None:
+        wbfiles = data['wbfiles']
+    else:
+        rtips_ids = [x[0] for x in session.query(models.ReceiverTip.id).filter(models.ReceiverTip.internaltip_id == itip_id)]
 
-    wbfiles = []
-    if rtips_ids:
-        wbfiles = session.query(models.WhistleblowerFile) \
-                         .filter(models.WhistleblowerFile.receivertip_id.in_(rtips_ids))
+        wbfiles = []
+        if rtips_ids:
+            wbfiles = session.query(models.WhistleblowerFile) \
+                             .filter(models.WhistleblowerFile.receivertip_id.in_(rtips_ids))
 
-    return [receiver_serialize_wbfile(session, wbfile) for wbfile in wbfiles]
+    return [receiver_serialize_wbfile(session, wbfile, data) for wbfile in wbfiles]
 
 
 @transact
@@ -351,6 +512,8 @@ def register_wbfile_on_db(session, tid, rtip_id, uploaded_file):
 
     session.add(new_file)
 
+    db_notify_tip_update(session, tid, itip.id, 'file')
+
     return serializers.serialize_wbfile(session, new_file)
 
 
@@ -375,7 +538,7 @@ def db_set_itip_open_if_new(session, tid, user_id, itip):
         db_update_submission_status(session, user_id, itip, open_status_id, '')
 
 
-def db_get_rtip(session, tid, user_id, rtip_id, language):
+def db_get_rtip(session, tid, user_id, rtip_id, language, since=None):
     """
     Transaction retrieving an rtip
 
@@ -384,20 +547,29 @@ def db_get_rtip(session, tid, user_id, rtip_id, language):
     :param user_id: A user ID of the user opening the submission
     :param rtip_id: A rtip ID to accessed
     :param language: A language to be used for the serialization
+    :param since: An optional update sequence used to retrieve only the changes happened after it
     :return:  The serialized descriptor of the rtip
     """
     rtip, itip = db_access_rtip(session, tid, user_id, rtip_id)
 
     db_set_itip_open_if_new(session, tid, user_id, itip)
 
-    rtip.access_counter += 1
-    rtip.last_access = datetime_now()
+    if since is not None:
+        # The polling of the changes is not accounted as an access to the tip
+        ret = serialize_rtip_delta(session, rtip, itip, since)
+    else:
+        rtip.access_counter += 1
+        rtip.last_access = datetime_now()
+
+        ret = serialize_rtip(session, rtip, itip, language)
+
+    ret['cursor'] = itip.update_seq
 
-    return serialize_rtip(session, rtip, itip, language), base64.b64decode(rtip.crypto_tip_prv_key)
+    return ret, base64.b64decode(rtip.crypto_tip_prv_key)
 
 
 @transact
-def get_rtip(session, tid, user_id, rtip_id, language):
+def get_rtip(session, tid, user_id, rtip_id, language, since=None):
     """
     Transaction retrieving an rtip
 
@@ -406,9 +578,10 @@ def get_rtip(session, tid, user_id, rtip_id, language):
     :param user_id: A user ID of the user opening the submission
     :param rtip_id: A rtip ID to accessed
     :param language: A language to be used for the serialization
+    :param since: An optional update sequence used to retrieve only the changes happened after it
     :return:  The serialized descriptor of the rtip
     """
-    return db_get_rtip(session, tid, user_id, rtip_id, language)
+    return db_get_rtip(session, tid, user_id, rtip_id, language, since)
 
 
 def db_delete_itips_files(session, itips_ids):
@@ -582,14 +755,20 @@ def update_label(session, tid, user_id, rtip_id, value):
         setattr(itip, 'label', value)
 
 
-def db_get_itip_comment_list(session, itip_id):
+def db_get_itip_comment_list(session, itip_id, data=None):
     """
     Transaction for retrieving the list of comments associated to a submission
     :param session: An ORM session
     :param itip_id: A submission object of the request
+    :param data: The prefetched data returned by db_prepare_tip_serialization
     :return: A serialized descriptor of the comments
     """
-    return [serialize_comment(session, comment) for comment in session.query(models.Comment).filter(models.Comment.internaltip_id == itip_id)]
+    if data is not None:
+        comments = data['comments']
+    else:
+        comments = session.query(models.Comment).filter(models.Comment.internaltip_id == itip_id)
+
+    return [serialize_comment(session, comment, data) for comment in comments]
 
 
 def db_create_identityaccessrequest_notifications(session, tid, itip, rtip, iar):
@@ -653,14 +832,20 @@ def create_identityaccessrequest(session, tid, user_id, rtip_id, request):
     return serialize_identityaccessrequest(session, iar)
 
 
-def db_get_rtip_identityaccessrequest_list(session, rtip_id):
+def db_get_rtip_identityaccessrequest_list(session, rtip_id, data=None):
     """
     Transaction for retrieving identity associated to an rtip
     :param session: An ORM session
     :param rtip_id: An rtip ID
+    :param data: The prefetched data returned by db_prepare_tip_serialization
     :return: The list of descriptors of the identity access requests associated to the specified rtip
     """
-    return [serialize_identityaccessrequest(session, iar) for iar in session.query(models.IdentityAccessRequest).filter(models.IdentityAccessRequest.receivertip_id == rtip_id)]
+    if data is not None:
+        iars = data['iars']
+    else:
+        iars = session.query(models.IdentityAccessRequest).filter(models.IdentityAccessRequest.receivertip_id == rtip_id)
+
+    return [serialize_identityaccessrequest(session, iar, data) for iar in iars]
 
 
 @transact
@@ -687,9 +872,14 @@ def create_comment(session, tid, user_id, rtip_id, content):
     comment.type = 'receiver'
     comment.author_id = rtip.receiver_id
     comment.content = _content
+    comment.seq = models.db_next_tip_seq(session, itip)
     session.add(comment)
+
+    itip.comment_count = models.InternalTip.comment_count + 1
     session.flush()
 
+    db_notify_tip_update(session, tid, itip.id, 'comment')
+
     ret = serialize_comment(session, comment)
     ret['content'] = content
 
@@ -719,22 +909,33 @@ def create_message(session, tid, user_id, rtip_id, content):
     msg.receivertip_id = rtip.id
     msg.type = 'receiver'
     msg.content = _content
+    msg.seq = models.db_next_tip_seq(session, itip)
     session.add(msg)
+
+    rtip.message_count = models.ReceiverTip.message_count + 1
     session.flush()
 
+    db_notify_tip_update(session, tid, itip.id, 'message', rtip.id)
+
     ret = serialize_message(session, msg)
     ret['content'] = content
     return ret
 
 
-def db_get_itip_message_list(session, rtip_id):
+def db_get_itip_message_list(session, rtip_id, data=None):
     """
     Transact for retrieving the list of comments associated to a tip
     :param session: An ORM session
     :param rtip_id: An rtip ID
+    :param data: The prefetched data returned by db_prepare_tip_serialization
     :return: A serialized list of descriptors of messages associated to the specified rtip
     """
-    return [serialize_message(session, message) for message in session.query(models.Message).filter(models.Message.receivertip_id == rtip_id)]
+    if data is not None:
+        messages = data['messages']
+    else:
+        messages = session.query(models.Message).filter(models.Message.receivertip_id == rtip_id)
+
+    return [serialize_message(session, message, data) for message in messages]
 
 
 @transact
@@ -759,7 +960,9 @@ class RTipInstance(OperationHandler):
 
     @inlineCallbacks
     def get(self, tip_id):
-        tip, crypto_tip_prv_key = yield get_rtip(self.request.tid, self.current_user.user_id, tip_id, self.request.language)
+        since = parse_since(self.request)
+
+        tip, crypto_tip_prv_key = yield get_rtip(self.request.tid, self.current_user.user_id, tip_id, self.request.language, since)
 
         if State.tenant_cache[self.request.tid].encryption and crypto_tip_prv_key:
             tip = yield deferToThread(decrypt_tip, self.current_user.cc, crypto_tip_prv_key, tip)
@@ -856,6 +1059,23 @@ class WhistleblowerFileHandler(BaseHandler):
                   self.uploaded_file['name'])
 
 
+def open_encrypted_file(user_key, tip_prv_key, filelocation):
+    """
+    Open an encrypted file for decryption
+
+    The function is meant to be executed in a worker thread
+    as it performs the asymmetric decryption of the keys
+
+    :param user_key: The private key of the user
+    :param tip_prv_key: The encrypted private key of the tip
+    :param filelocation: The path of the file
+    :return: A file-like object returning the decrypted content
+    """
+    tip_prv_key = GCE.asymmetric_decrypt(user_key, tip_prv_key)
+
+    return GCE.streaming_encryption_open('DECRYPT', tip_prv_key, filelocation)
+
+
 class WBFileHandler(BaseHandler):
     """
     This class is used in both RTip and WBTip to define a base for respective handlers
@@ -893,10 +1113,9 @@ class WBFileHandler(BaseHandler):
         directory_traversal_check(Settings.attachments_path, filelocation)
 
         if tip_prv_key:
-            tip_prv_key = GCE.asymmetric_decrypt(self.current_user.cc, tip_prv_key)
-            filelocation = GCE.streaming_encryption_open('DECRYPT', tip_prv_key, filelocation)
+            filelocation = yield deferToThread(open_encrypted_file, self.current_user.cc, tip_prv_key, filelocation)
 
-        yield self.write_file_as_download(wbfile['name'], filelocation)
+        yield self.write_file_as_download(wbfile['name'], filelocation, wbfile['id'])
 
 
 class RTipWBFileHandler(WBFileHandler):
@@ -960,10 +1179,9 @@ class ReceiverFileDownload(BaseHandler):
         directory_traversal_check(Settings.attachments_path, filelocation)
 
         if tip_prv_key:
-            tip_prv_key = GCE.asymmetric_decrypt(self.current_user.cc, tip_prv_key)
-            filelocation = GCE.streaming_encryption_open('DECRYPT', tip_prv_key, filelocation)
+            filelocation = yield deferToThread(open_encrypted_file, self.current_user.cc, tip_prv_key, filelocation)
 
-        yield self.write_file_as_download(rfile['name'], filelocation)
+        yield self.write_file_as_download(rfile['name'], filelocation, rfile['id'])
 
 
 
@@ -1,11 +1,89 @@
 # -*- coding: utf-8 -*-
 #
 # Handler exposing application files
+import mimetypes
 import os
+import re
 
-from globaleaks.handlers.base import BaseHandler
+from datetime import datetime
+
+from globaleaks.handlers.base import BaseHandler, FileSlice, serve_file
 from globaleaks.rest import errors
-from globaleaks.utils.fs import directory_traversal_check
+from globaleaks.utils.crypto import sha256
+
+# Files whose name embeds the hash of their content, e.g. scripts.3f2a1b4c.js
+hashed_filename_regexp = re.compile(r'.+\.[a-f0-9]{8,64}\.[a-zA-Z0-9]+$')
+
+
+def describe_static_file(path):
+    """
+    Function that returns the metadata used to serve an application file
+
+    :param path: The path of the file
+    :return: A dictionary describing the file
+    """
+    with open(path, 'rb') as f:
+        etag = sha256(f.read()).decode()
+
+    stat = os.stat(path)
+
+    return {
+        'path': path,
+        'size': stat.st_size,
+        'last_modified': datetime.utcfromtimestamp(int(stat.st_mtime)),
+        'etag': etag
+    }
+
+
+class StaticFileIndex(object):
+    """
+    Index of the application files built once by scanning the client directory
+    """
+    memory_cache_dict = {}
+
+    @classmethod
+    def load(cls, root):
+        """
+        Scan a client directory and index the files it contains
+
+        :param root: The path of the client directory
+        :return: The index of the directory
+        """
+        root = os.path.abspath(root)
+        index = {}
+
+        for dirpath, _, filenames in os.walk(root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                if not os.path.isfile(path):
+                    continue
+
+                name = os.path.relpath(path, root)
+                variant = 'identity'
+                if name.endswith('.gz'):
+                    name, variant = name[:-3], 'gzip'
+
+                if name not in index:
+                    index[name] = {
+                        'immutable': hashed_filename_regexp.match(os.path.basename(name)) is not None,
+                        'mime_type': mimetypes.guess_type(name)[0],
+                        'identity': None,
+                        'gzip': None
+                    }
+
+                index[name][variant] = describe_static_file(path)
+
+        cls.memory_cache_dict[root] = index
+
+        return index
+
+    @classmethod
+    def get(cls, root, name):
+        root = os.path.abspath(root)
+        if root not in cls.memory_cache_dict:
+            cls.load(root)
+
+        return cls.memory_cache_dict[root].get(os.path.normpath(name))
 
 
 class StaticFileHandler(BaseHandler):
@@ -21,13 +99,44 @@ class StaticFileHandler(BaseHandler):
         if not filename:
             filename = 'index.html'
 
-        abspath = os.path.abspath(os.path.join(self.root, filename))
+        entry = StaticFileIndex.get(self.root, filename)
+        if entry is None:
+            raise errors.ResourceNotFound()
+
+        # The entry point of the application keeps the default no-store policy
+        if filename != 'index.html':
+            self.set_cache_headers(immutable=entry['immutable'])
+
+        if entry['mime_type']:
+            self.request.setHeader(b'Content-Type', entry['mime_type'])
+
+        f = entry['identity']
+        if entry['gzip'] is not None:
+            self.request.setHeader(b'Vary', b'Accept-Encoding')
+
+            # Ranges are served on the uncompressed file whenever available
+            if f is None or (b'range' not in self.request.headers and
+                             b'gzip' in self.request.headers.get(b'accept-encoding', b'')):
+                f = entry['gzip']
+                self.request.setHeader(b'Content-encoding', b'gzip')
+
+        etag_match = self.check_etag(f['etag'])
+        if self.check_last_modified(f['last_modified']) or etag_match:
+            return
+
+        self.request.setHeader(b'Accept-Ranges', b'bytes')
+
+        byte_range = self.parse_range(f['size'], f['etag'])
 
-        directory_traversal_check(self.root, abspath)
+        fo = open(f['path'], 'rb')
 
-        if os.path.exists(abspath + '.gz') and os.path.isfile(abspath + '.gz'):
-            return self.write_file(filename + '.gz', abspath + '.gz')
-        elif os.path.exists(abspath) and os.path.isfile(abspath):
-            return self.write_file(filename, abspath)
+        if byte_range is None:
+            self.request.setHeader(b'Content-Length', b'%d' % f['size'])
+        else:
+            start, end = byte_range
+            self.request.setResponseCode(206)
+            self.request.setHeader(b'Content-Range', b'bytes %d-%d/%d' % (start, end, f['size']))
+            self.request.setHeader(b'Content-Length', b'%d' % (end - start + 1))
+            fo = FileSlice(fo, start, end)
 
-        raise errors.ResourceNotFound()
+        return serve_file(self.request, fo)
@@ -4,10 +4,14 @@
 import base64
 import copy
 import json
+import threading
+
+from collections import OrderedDict
 
 from globaleaks import models
 from globaleaks.handlers.admin.questionnaire import db_get_questionnaire
 from globaleaks.handlers.base import BaseHandler
+from globaleaks.handlers.events import db_notify_tip_update
 from globaleaks.models import get_localized_values
 from globaleaks.orm import transact
 from globaleaks.rest import errors, requests
@@ -21,13 +25,15 @@ from globaleaks.utils.utility import get_expiration, \
 
 
 def decrypt_tip(user_key, tip_prv_key, tip):
-    tip_key = GCE.asymmetric_decrypt(user_key, tip_prv_key)
+    return decrypt_tip_with_key(GCE.asymmetric_decrypt(user_key, tip_prv_key), tip)
+
 
-    for questionnaire in tip['questionnaires']:
+def decrypt_tip_with_key(tip_key, tip):
+    for questionnaire in tip.get('questionnaires', []):
         questionnaire['answers'] = json.loads(GCE.asymmetric_decrypt(tip_key, base64.b64decode(questionnaire['answers'].encode())).decode())
 
     for k in ['whistleblower_identity']:
-        if k in tip['data'] and tip['data'][k]:
+        if k in tip.get('data', {}) and tip['data'][k]:
             tip['data'][k] = json.loads(GCE.asymmetric_decrypt(tip_key, base64.b64decode(tip['data'][k].encode())).decode())
 
             if k == 'whistleblower_identity':
@@ -127,6 +133,104 @@ def db_serialize_archived_preview_schema(preview_schema, language):
     return preview
 
 
+class ArchivedSchemaCache(object):
+    """
+    LRU cache of the localized serializations of the archived questionnaire schemas.
+
+    Archived schemas never change and so entries are indexed by (hash, language) and
+    are evicted only to respect the memory budget, accounted as the size of their JSON
+    serialization. Entries are shared between callers and must be treated as read-only.
+    """
+    max_size = 32 * 1024 * 1024
+    memory_cache_dict = OrderedDict()
+    lock = threading.Lock()
+    size = 0
+    hits = 0
+    misses = 0
+
+    @classmethod
+    def get(cls, hash, language):
+        with cls.lock:
+            entry = cls.memory_cache_dict.get((hash, language))
+            if entry is None:
+                cls.misses += 1
+                return
+
+            cls.hits += 1
+            cls.memory_cache_dict.move_to_end((hash, language))
+
+            return entry[0]
+
+    @classmethod
+    def set(cls, hash, language, data):
+        size = len(json.dumps(data))
+
+        with cls.lock:
+            entry = cls.memory_cache_dict.pop((hash, language), None)
+            if entry is not None:
+                cls.size -= entry[1]
+
+            if size > cls.max_size:
+                return data
+
+            cls.memory_cache_dict[(hash, language)] = (data, size)
+            cls.size += size
+
+            while cls.size > cls.max_size:
+                _, entry = cls.memory_cache_dict.popitem(last=False)
+                cls.size -= entry[1]
+
+        return data
+
+    @classmethod
+    def stats(cls):
+        with cls.lock:
+            requests = cls.hits + cls.misses
+
+            return {
+                'entries': len(cls.memory_cache_dict),
+                'size': cls.size,
+                'hits': cls.hits,
+                'misses': cls.misses,
+                'hit_rate': float(cls.hits) / requests if requests else 0.0
+            }
+
+    @classmethod
+    def invalidate(cls):
+        with cls.lock:
+            cls.memory_cache_dict.clear()
+            cls.size = cls.hits = cls.misses = 0
+
+
+def db_get_archived_schemas(session, hashes, language):
+    """
+    Transaction to retrieve the localized serializations of a set of archived schemas
+
+    :param session: An ORM session
+    :param hashes: The set of hashes of the archived schemas
+    :param language: The language to be used during serialization
+    :return: A dictionary of the serialized steps and preview indexed by hash
+    """
+    ret = {}
+    missing = set()
+
+    for hash in hashes:
+        x = ArchivedSchemaCache.get(hash, language)
+        if x is None:
+            missing.add(hash)
+        else:
+            ret[hash] = x
+
+    if missing:
+        for aqs in session.query(models.ArchivedSchema).filter(models.ArchivedSchema.hash.in_(missing)):
+            ret[aqs.hash] = ArchivedSchemaCache.set(aqs.hash, language, {
+                'steps': db_serialize_archived_questionnaire_schema(aqs.schema, language),
+                'preview': db_serialize_archived_preview_schema(aqs.preview, language)
+            })
+
+    return ret
+
+
 def db_save_plaintext_answers(session, tid, internaltip_id, entries, skip_encryption=None):
     if skip_encryption is None:
         skip_encryption = {x[0]: True for x in session.query(models.Field.id).filter(models.Field.encrypt.is_(False))}
@@ -186,8 +290,10 @@ def extract_answers_preview(questionnaire, answers):
     return preview
 
 
-def db_archive_questionnaire_schema(session, questionnaire):
-    hash = str(sha256(json.dumps(questionnaire, sort_keys=True)))
+def db_archive_questionnaire_schema(session, questionnaire, hash=None):
+    if hash is None:
+        hash = str(sha256(json.dumps(questionnaire, sort_keys=True)))
+
     if session.query(models.ArchivedSchema).filter(models.ArchivedSchema.hash == hash).count():
         return hash
 
@@ -202,6 +308,67 @@ def db_archive_questionnaire_schema(session, questionnaire):
     return hash
 
 
+class QuestionnaireSnapshotCache(object):
+    """
+    Cache of the archived snapshots of the current revision of each questionnaire.
+
+    Each entry keeps the serialized schema, its hash and a flag recording that the
+    schema has been found archived in the database; the flag is never set by the
+    transaction that adds the schema so that a rollback cannot leave it stale.
+    """
+    memory_cache_dict = {}
+
+    @classmethod
+    def get(cls, tid, questionnaire):
+        entry = cls.memory_cache_dict.get((tid, questionnaire.id))
+        if entry is not None and entry['revision'] == questionnaire.revision:
+            return entry
+
+    @classmethod
+    def set(cls, tid, questionnaire, schema):
+        entry = {
+            'revision': questionnaire.revision,
+            'schema': schema,
+            'hash': str(sha256(json.dumps(schema, sort_keys=True))),
+            'archived': False
+        }
+
+        cls.memory_cache_dict[(tid, questionnaire.id)] = entry
+
+        return entry
+
+    @classmethod
+    def hashes(cls):
+        return set(entry['hash'] for entry in list(cls.memory_cache_dict.values()))
+
+    @classmethod
+    def invalidate(cls):
+        cls.memory_cache_dict.clear()
+
+
+def db_get_questionnaire_snapshot(session, tid, questionnaire):
+    """
+    Transaction to retrieve the archived snapshot of the current revision of a questionnaire
+
+    :param session: An ORM session
+    :param tid: A tenant ID
+    :param questionnaire: The questionnaire model
+    :return: The cache entry containing the schema and its hash
+    """
+    snapshot = QuestionnaireSnapshotCache.get(tid, questionnaire)
+    if snapshot is None:
+        schema = db_get_questionnaire(session, tid, questionnaire.id, None)['steps']
+        snapshot = QuestionnaireSnapshotCache.set(tid, questionnaire, schema)
+
+    if not snapshot['archived']:
+        if session.query(models.ArchivedSchema.hash).filter(models.ArchivedSchema.hash == snapshot['hash']).count():
+            snapshot['archived'] = True
+        else:
+            db_archive_questionnaire_schema(session, snapshot['schema'], snapshot['hash'])
+
+    return snapshot
+
+
 def db_get_itip_receiver_list(session, itip):
     ret = []
 
@@ -219,14 +386,18 @@ def db_get_itip_receiver_list(session, itip):
 
 
 def serialize_itip(session, internaltip, language):
-    x = session.query(models.InternalTipAnswers, models.ArchivedSchema) \
-               .filter(models.ArchivedSchema.hash == models.InternalTipAnswers.questionnaire_hash,
-                       models.InternalTipAnswers.internaltip_id == internaltip.id)
+    answers = session.query(models.InternalTipAnswers) \
+                     .filter(models.InternalTipAnswers.internaltip_id == internaltip.id).all()
+
+    schemas = db_get_archived_schemas(session, set(ita.questionnaire_hash for ita in answers), language)
 
     questionnaires = []
-    for ita, aqs in x:
+    for ita in answers:
+        if ita.questionnaire_hash not in schemas:
+            continue
+
         questionnaires.append({
-            'steps': db_serialize_archived_questionnaire_schema(aqs.schema, language),
+            'steps': schemas[ita.questionnaire_hash]['steps'],
             'answers': ita.answers
         })
 
@@ -300,8 +471,9 @@ def db_create_submission(session, tid, request, token, client_using_tor):
         len(request['receivers']) > context.maximum_selectable_receivers:
         raise errors.InputValidationError("The number of recipients selected exceed the configured limit")
 
-    steps = db_get_questionnaire(session, tid, questionnaire.id, None)['steps']
-    questionnaire_hash = db_archive_questionnaire_schema(session, steps)
+    snapshot = db_get_questionnaire_snapshot(session, tid, questionnaire)
+    steps = snapshot['schema']
+    questionnaire_hash = snapshot['hash']
     preview = extract_answers_preview(steps, answers)
 
     itip = models.InternalTip()
@@ -414,8 +586,11 @@ def db_create_submission(session, tid, request, token, client_using_tor):
         new_file.internaltip_id = itip.id
         new_file.filename = uploaded_file['filename']
         new_file.submission = uploaded_file['submission']
+        new_file.seq = models.db_next_tip_seq(session, itip)
         session.add(new_file)
 
+        itip.file_count += 1
+
     tip_count = 0
 
     for user in session.query(models.User).filter(models.User.id.in_(request['receivers'])):
@@ -433,6 +608,8 @@ def db_create_submission(session, tid, request, token, client_using_tor):
     if not tip_count:
         raise errors.InputValidationError("Unable to deliver the submission to at least one recipient")
 
+    db_notify_tip_update(session, tid, itip.id, 'tip')
+
     return {
         'receipt': receipt,
         'score': itip.total_score
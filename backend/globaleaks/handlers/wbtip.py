@@ -8,10 +8,12 @@ from twisted.internet.defer import inlineCallbacks, returnValue
 
 from globaleaks import models
 from globaleaks.handlers.base import BaseHandler
-from globaleaks.handlers.rtip import serialize_comment, serialize_message, db_get_itip_comment_list, WBFileHandler
+from globaleaks.handlers.events import db_notify_tip_update
+from globaleaks.handlers.rtip import serialize_comment, serialize_message, db_get_itip_comment_list, \
+    db_prepare_tip_serialization, parse_since, WBFileHandler
 from globaleaks.handlers.submission import serialize_usertip, \
     db_save_plaintext_answers, decrypt_tip, \
-    db_set_internaltip_answers, db_get_questionnaire, db_archive_questionnaire_schema, db_set_internaltip_data
+    db_set_internaltip_answers, db_get_questionnaire_snapshot, db_set_internaltip_data
 from globaleaks.models import serializers
 from globaleaks.orm import transact
 from globaleaks.rest import errors, requests
@@ -20,50 +22,86 @@ from globaleaks.utils.log import log
 from globaleaks.utils.utility import datetime_now, datetime_to_ISO8601
 
 
-def db_get_rfile_list(session, itip_id):
-    ifiles = session.query(models.InternalFile) \
-                    .filter(models.InternalFile.internaltip_id == itip_id,
-                            models.InternalTip.id == itip_id)
+def db_get_rfile_list(session, itip_id, data=None):
+    if data is not None:
+        ifiles = data['ifiles'].values()
+    else:
+        ifiles = session.query(models.InternalFile) \
+                        .filter(models.InternalFile.internaltip_id == itip_id,
+                                models.InternalTip.id == itip_id)
 
     return [serializers.serialize_ifile(session, ifile) for ifile in ifiles]
 
 
-def db_get_wbfile_list(session, itip_id):
-    wbfiles = session.query(models.WhistleblowerFile) \
-                     .filter(models.WhistleblowerFile.receivertip_id == models.ReceiverTip.id,
-                             models.ReceiverTip.internaltip_id == itip_id)
+def db_get_wbfile_list(session, itip_id, data=None):
+    if data is not None:
+        wbfiles = data['wbfiles']
+    else:
+        wbfiles = session.query(models.WhistleblowerFile) \
+                         .filter(models.WhistleblowerFile.receivertip_id == models.ReceiverTip.id,
+                                 models.ReceiverTip.internaltip_id == itip_id)
 
-    return [serializers.serialize_wbfile(session, wbfile) for wbfile in wbfiles]
+    return [serializers.serialize_wbfile(session, wbfile, data) for wbfile in wbfiles]
 
 
-def db_get_wbtip(session, itip_id, language):
+def db_get_wbtip(session, itip_id, language, since=None):
     wbtip, itip = models.db_get(session,
                                 (models.WhistleblowerTip, models.InternalTip),
                                 models.WhistleblowerTip.id == models.InternalTip.id,
                                 models.InternalTip.id == itip_id)
 
-    itip.wb_access_counter += 1
-    itip.wb_last_access = datetime_now()
+    if since is not None:
+        # The polling of the changes is not accounted as an access to the tip
+        ret = serialize_wbtip_delta(session, wbtip, itip, since)
+    else:
+        itip.wb_access_counter += 1
+        itip.wb_last_access = datetime_now()
+
+        ret = serialize_wbtip(session, wbtip, itip, language)
 
-    return serialize_wbtip(session, wbtip, itip, language), base64.b64decode(wbtip.crypto_tip_prv_key)
+    ret['cursor'] = itip.update_seq
+
+    return ret, base64.b64decode(wbtip.crypto_tip_prv_key)
 
 
 @transact
-def get_wbtip(session, itip_id, language):
-    return db_get_wbtip(session, itip_id, language)
+def get_wbtip(session, itip_id, language, since=None):
+    return db_get_wbtip(session, itip_id, language, since)
 
 
 def serialize_wbtip(session, wbtip, itip, language):
     ret = serialize_usertip(session, itip, itip, language)
 
-    ret['comments'] = db_get_itip_comment_list(session, itip.id)
-    ret['messages'] = db_get_itip_message_list(session, itip.id)
-    ret['rfiles'] = db_get_rfile_list(session, itip.id)
-    ret['wbfiles'] = db_get_wbfile_list(session, itip.id)
+    data = db_prepare_tip_serialization(session, itip)
+
+    ret['comments'] = db_get_itip_comment_list(session, itip.id, data)
+    ret['messages'] = db_get_itip_message_list(session, itip.id, data)
+    ret['rfiles'] = db_get_rfile_list(session, itip.id, data)
+    ret['wbfiles'] = db_get_wbfile_list(session, itip.id, data)
 
     return ret
 
 
+def serialize_wbtip_delta(session, wbtip, itip, since):
+    data = db_prepare_tip_serialization(session, itip, None, since)
+
+    return {
+        'id': itip.id,
+        'internaltip_id': itip.id,
+        'update_date': datetime_to_ISO8601(itip.update_date),
+        'expiration_date': datetime_to_ISO8601(itip.expiration_date),
+        'status': itip.status,
+        'substatus': itip.substatus,
+        'enable_two_way_comments': itip.enable_two_way_comments,
+        'enable_two_way_messages': itip.enable_two_way_messages,
+        'enable_attachments': itip.enable_attachments,
+        'comments': db_get_itip_comment_list(session, itip.id, data),
+        'messages': db_get_itip_message_list(session, itip.id, data),
+        'rfiles': db_get_rfile_list(session, itip.id, data),
+        'wbfiles': db_get_wbfile_list(session, itip.id, data)
+    }
+
+
 @transact
 def create_comment(session, tid, wbtip_id, content):
     wbtip, itip = session.query(models.WhistleblowerTip, models.InternalTip)\
@@ -85,22 +123,30 @@ def create_comment(session, tid, wbtip_id, content):
     comment.internaltip_id = wbtip_id
     comment.type = 'whistleblower'
     comment.content = _content
+    comment.seq = models.db_next_tip_seq(session, itip)
     session.add(comment)
+
+    itip.comment_count = models.InternalTip.comment_count + 1
     session.flush()
 
+    db_notify_tip_update(session, tid, itip.id, 'comment')
+
     ret = serialize_comment(session, comment)
     ret['content'] = content
 
     return ret
 
 
-def db_get_itip_message_list(session, wbtip_id):
-    messages = session.query(models.Message) \
-                      .filter(models.Message.receivertip_id == models.ReceiverTip.id,
-                              models.ReceiverTip.internaltip_id == models.InternalTip.id,
-                              models.InternalTip.id == wbtip_id)
+def db_get_itip_message_list(session, wbtip_id, data=None):
+    if data is not None:
+        messages = data['messages']
+    else:
+        messages = session.query(models.Message) \
+                          .filter(models.Message.receivertip_id == models.ReceiverTip.id,
+                                  models.ReceiverTip.internaltip_id == models.InternalTip.id,
+                                  models.InternalTip.id == wbtip_id)
 
-    return [serialize_message(session, message) for message in messages]
+    return [serialize_message(session, message, data) for message in messages]
 
 
 @transact
@@ -126,9 +172,16 @@ def create_message(session, tid, wbtip_id, receiver_id, content):
     msg.receivertip_id = rtip_id
     msg.type = 'whistleblower'
     msg.content = _content
+    msg.seq = models.db_next_tip_seq(session, itip)
     session.add(msg)
+
+    session.query(models.ReceiverTip) \
+           .filter(models.ReceiverTip.id == rtip_id) \
+           .update({'message_count': models.ReceiverTip.message_count + 1}, synchronize_session=False)
     session.flush()
 
+    db_notify_tip_update(session, tid, itip.id, 'message', rtip_id)
+
     ret = serialize_message(session, msg)
     ret['content'] = content
 
@@ -163,8 +216,12 @@ def store_additional_questionnaire_answers(session, tid, tip_id, answers, langua
     if not itip.additional_questionnaire_id:
         return
 
-    steps = db_get_questionnaire(session, tid, itip.additional_questionnaire_id, None)['steps']
-    questionnaire_hash = db_archive_questionnaire_schema(session, steps)
+    questionnaire = models.db_get(session,
+                                  models.Questionnaire,
+                                  models.Questionnaire.tid.in_(set([1, tid])),
+                                  models.Questionnaire.id == itip.additional_questionnaire_id)
+
+    questionnaire_hash = db_get_questionnaire_snapshot(session, tid, questionnaire)['hash']
 
     db_save_plaintext_answers(session, tid, itip.id, answers)
 
@@ -184,7 +241,9 @@ class WBTipInstance(BaseHandler):
 
     @inlineCallbacks
     def get(self):
-        tip, crypto_tip_prv_key = yield get_wbtip(self.current_user.user_id, self.request.language)
+        since = parse_since(self.request)
+
+        tip, crypto_tip_prv_key = yield get_wbtip(self.current_user.user_id, self.request.language, since)
 
         if crypto_tip_prv_key:
             tip = yield deferToThread(decrypt_tip, self.current_user.cc, crypto_tip_prv_key, tip)
@@ -6,8 +6,10 @@ from globaleaks.jobs import anomalies, \
                             exit_nodes_refresh, \
                             notification, \
                             pgp_check, \
+                            secure_deletion, \
                             session_management, \
                             statistics, \
+                            tips_operations, \
                             update_check
 
 jobs_list = [
@@ -19,7 +21,9 @@ jobs_list = [
     exit_nodes_refresh.ExitNodesRefresh,
     notification.Notification,
     pgp_check.PGPCheck,
+    secure_deletion.SecureDeletion,
     session_management.SessionManagement,
     statistics.Statistics,
+    tips_operations.TipsOperations,
     update_check.UpdateCheck,
 ]
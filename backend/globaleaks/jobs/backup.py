@@ -36,6 +36,7 @@ def db_perform_backup(session, id):
 
 class Backup(DailyJob):
     monitor_interval = 5 * 60
+    worker = True
 
     @transact
     def daily_backup(self, session):
@@ -2,6 +2,7 @@
 from datetime import datetime, timedelta
 
 from OpenSSL.crypto import load_certificate, FILETYPE_PEM
+from twisted.internet.defer import inlineCallbacks
 
 from globaleaks import models
 from globaleaks.handlers.admin.https import db_acme_cert_request, load_tls_dict
@@ -18,6 +19,8 @@ from globaleaks.utils.utility import datetime_to_ISO8601
 class CertificateCheck(DailyJob):
     interval = 24 * 3600
 
+    spread_period = 3600
+
     notify_expr_within = 15
     acme_try_renewal = 15
     should_restart_https = False
@@ -37,9 +40,12 @@ class CertificateCheck(DailyJob):
             self.state.format_and_send_mail(session, tid, user_desc, template_vars)
 
     @transact
-    def check_tenants_for_cert_expiration(self, session):
-        for tenant in session.query(models.Tenant.id).filter(models.Tenant.active.is_(True)):
-            self.cert_expiration_checks(session, tenant[0])
+    def get_active_tenants(self, session):
+        return [x[0] for x in session.query(models.Tenant.id).filter(models.Tenant.active.is_(True))]
+
+    @transact
+    def check_tenant_for_cert_expiration(self, session, tid):
+        self.cert_expiration_checks(session, tid)
 
     def cert_expiration_checks(self, session, tid):
         priv_fact = models.config.ConfigFactory(session, tid)
@@ -73,5 +79,9 @@ class CertificateCheck(DailyJob):
             if not self.state.tenant_cache[tid].notification.disable_admin_notification_emails:
                 self.certificate_mail_creation(session, 'https_certificate_expiration', tid, expiration_date_iso)
 
+    @inlineCallbacks
     def operation(self):
-        return self.check_tenants_for_cert_expiration()
+        tids = yield self.get_active_tenants()
+
+        # The checks of the tenants are spread so that the ACME renewals do not happen all at once
+        yield self.spread(tids, self.check_tenant_for_cert_expiration)
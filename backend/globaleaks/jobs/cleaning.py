@@ -2,6 +2,7 @@
 # Implementation of the daily operations.
 import fnmatch
 import os
+import time
 from datetime import datetime, timedelta
 
 from sqlalchemy import not_
@@ -12,11 +13,14 @@ from twisted.internet.defer import inlineCallbacks
 from globaleaks import models
 from globaleaks.handlers.admin.node import db_admin_serialize_node
 from globaleaks.handlers.admin.notification import db_get_notification
+from globaleaks.handlers.file import db_mark_file_for_secure_deletion
 from globaleaks.handlers.rtip import db_delete_itips
+from globaleaks.handlers.submission import QuestionnaireSnapshotCache, db_get_questionnaire_snapshot
 from globaleaks.handlers.user import user_serialize_user
 from globaleaks.jobs.job import DailyJob
 from globaleaks.orm import transact
-from globaleaks.utils.fs import overwrite_and_remove
+from globaleaks.utils import resumable
+from globaleaks.utils.log import log
 from globaleaks.utils.templating import Templating
 from globaleaks.utils.utility import datetime_now, datetime_to_ISO8601, is_expired
 
@@ -26,84 +30,179 @@ __all__ = ['Cleaning']
 
 class Cleaning(DailyJob):
     monitor_interval = 5 * 60
+    worker = True
+
+    # Delay (seconds) after which the expired submissions left by a run are deleted
+    backlog_interval = 60
+
+    def __init__(self):
+        self.progress = {}
+        self.backlog_call = None
+        DailyJob.__init__(self)
+
+    def stop(self):
+        if self.backlog_call is not None and self.backlog_call.active():
+            self.backlog_call.cancel()
+
+        return DailyJob.stop(self)
+
+    def get_status(self):
+        return self.progress
 
     @transact
-    def clean_expired_itips(self, session):
+    def count_expired_itips(self, session):
+        return session.query(func.count(models.InternalTip.id)) \
+                      .filter(models.InternalTip.expiration_date < datetime_now()).scalar()
+
+    @transact
+    def clean_expired_itips_chunk(self, session, limit):
         """
-        This function, checks all the InternalTips and their expiration date.
-        if expired InternalTips are found, it removes that along with
-        all the related DB entries comment and tip related.
+        Transaction deleting a chunk of the expired InternalTips along
+        with all the related DB entries
+
+        :param session: An ORM session
+        :param limit: The maximum number of submissions to be deleted
+        :return: The number of submissions deleted
         """
-        itips_ids = [id[0] for id in session.query(models.InternalTip.id).filter(models.InternalTip.expiration_date < datetime_now())]
+        itips_ids = [x[0] for x in session.query(models.InternalTip.id)
+                                          .filter(models.InternalTip.expiration_date < datetime_now())
+                                          .limit(limit)]
         if itips_ids:
             db_delete_itips(session, itips_ids)
 
-    def db_clean_expired_wbtips(self, session, tid):
+        return len(itips_ids)
+
+    @inlineCallbacks
+    def clean_expired_itips(self):
         """
-        This function checks all the InternalTips and deletes the receipt if the delete threshold is exceeded
+        Delete the expired InternalTips in chunks each one committed in its
+        own transaction so that the database is not held for long
+
+        The submissions not deleted within the time budget of the run are
+        deleted by short follow-up runs scheduled until the backlog is empty.
         """
-        threshold = datetime_now() - timedelta(days=self.state.tenant_cache[tid].wbtip_timetolive)
+        start = time.time()
+
+        pending = yield self.count_expired_itips()
+        self.progress.update({'expired_tips_deleted': 0, 'expired_tips_pending': pending})
+
+        while pending and time.time() - start < self.state.settings.cleaning_time_budget:
+            deleted = yield self.clean_expired_itips_chunk(self.state.settings.tips_operations_chunk_size)
+            if not deleted:
+                break
 
-        subquery = session.query(models.InternalTip.id) \
-                          .filter(models.InternalTip.tid == tid,
-                                  models.InternalTip.wb_last_access < threshold) \
-                          .subquery()
+            pending = max(pending - deleted, 0)
+            self.progress['expired_tips_deleted'] += deleted
+            self.progress['expired_tips_pending'] = pending
 
-        session.query(models.WhistleblowerTip).filter(models.WhistleblowerTip.id.in_(subquery)).delete(synchronize_session=False)
+        if pending and not self.state.shutdown and \
+           (self.backlog_call is None or not self.backlog_call.active()):
+            self.backlog_call = self.clock.callLater(self.backlog_interval, self.clean_expired_itips_backlog)
 
-    def db_check_for_expiring_submissions(self, session, tid):
-        threshold = datetime_now() + timedelta(hours=self.state.tenant_cache[tid].notification.tip_expiration_threshold)
+    @inlineCallbacks
+    def clean_expired_itips_backlog(self):
+        """
+        Continue the deletion of the expired submissions left by a run
+        """
+        # The run in progress is going to continue the deletion
+        if self.executing or self.state.shutdown:
+            return
 
-        result = session.query(models.User, func.count(models.InternalTip.id), func.min(models.InternalTip.expiration_date)) \
-                        .filter(models.InternalTip.tid == tid,
-                                models.ReceiverTip.internaltip_id == models.InternalTip.id,
-                                models.InternalTip.expiration_date < threshold,
-                                models.User.id == models.ReceiverTip.receiver_id) \
-                        .group_by(models.User.id) \
-                        .having(func.count(models.InternalTip.id) > 0) \
-                        .all()
+        self.executing = True
 
-        for x in result:
-            user = x[0]
-            expiring_submission_count = x[1]
-            earliest_expiration_date = x[2]
+        try:
+            yield self.acquire_budget()
+            yield self.clean_expired_itips()
+        except Exception as e:
+            if not self.state.shutdown:
+                self.on_error(e)
+        finally:
+            self.release_budget()
+            self.executing = False
 
-            user_desc = user_serialize_user(session, user, user.language)
+    def get_tenants_by(self, getter):
+        """
+        Group the tenants by the value of one of their settings
 
-            data = {
-                'type': 'tip_expiration_summary',
-                'node': db_admin_serialize_node(session, tid, user.language),
-                'notification': db_get_notification(session, tid, user.language),
-                'user': user_desc,
-                'expiring_submission_count': expiring_submission_count,
-                'earliest_expiration_date': datetime_to_ISO8601(earliest_expiration_date)
-            }
+        :param getter: A function returning the setting given a tenant cache
+        :return: A dictionary mapping each value to the list of the IDs of the tenants
+        """
+        ret = {}
 
-            subject, body = Templating().get_mail_subject_and_body(data)
+        for tid in self.state.tenant_state:
+            ret.setdefault(getter(self.state.tenant_cache[tid]), []).append(tid)
 
-            session.add(models.Mail({
-                'tid': tid,
-                'address': user_desc['mail_address'],
-                'subject': subject,
-                'body': body
-            }))
+        return ret
 
-    def db_expire_old_passwords(self, session, tid):
+    def db_clean_expired_wbtips(self, session):
+        """
+        This function checks all the InternalTips and deletes the receipt if the delete threshold is exceeded
+        """
+        for ttl, tids in self.get_tenants_by(lambda x: x.wbtip_timetolive).items():
+            threshold = datetime_now() - timedelta(days=ttl)
+
+            subquery = session.query(models.InternalTip.id) \
+                              .filter(models.InternalTip.tid.in_(tids),
+                                      models.InternalTip.wb_last_access < threshold) \
+                              .subquery()
+
+            session.query(models.WhistleblowerTip).filter(models.WhistleblowerTip.id.in_(subquery)).delete(synchronize_session=False)
+
+    def db_check_for_expiring_submissions(self, session):
+        for hours, tids in self.get_tenants_by(lambda x: x.notification.tip_expiration_threshold).items():
+            threshold = datetime_now() + timedelta(hours=hours)
+
+            result = session.query(models.User, func.count(models.InternalTip.id), func.min(models.InternalTip.expiration_date)) \
+                            .filter(models.InternalTip.tid.in_(tids),
+                                    models.ReceiverTip.internaltip_id == models.InternalTip.id,
+                                    models.InternalTip.expiration_date < threshold,
+                                    models.User.id == models.ReceiverTip.receiver_id) \
+                            .group_by(models.User.id) \
+                            .having(func.count(models.InternalTip.id) > 0) \
+                            .all()
+
+            for x in result:
+                user = x[0]
+                expiring_submission_count = x[1]
+                earliest_expiration_date = x[2]
+
+                user_desc = user_serialize_user(session, user, user.language)
+
+                data = {
+                    'type': 'tip_expiration_summary',
+                    'node': db_admin_serialize_node(session, user.tid, user.language),
+                    'notification': db_get_notification(session, user.tid, user.language),
+                    'user': user_desc,
+                    'expiring_submission_count': expiring_submission_count,
+                    'earliest_expiration_date': datetime_to_ISO8601(earliest_expiration_date)
+                }
+
+                subject, body = Templating().get_mail_subject_and_body(data)
+
+                session.add(models.Mail({
+                    'tid': user.tid,
+                    'address': user_desc['mail_address'],
+                    'subject': subject,
+                    'body': body
+                }))
+
+    def db_expire_old_passwords(self, session):
         """
         Expires passwords if past the last change date
         """
-        # if the expiration threshold is 0, ignore it
-        if self.state.tenant_cache[tid].password_change_period == 0:
-            return
+        for days, tids in self.get_tenants_by(lambda x: x.password_change_period).items():
+            # if the expiration threshold is 0, ignore it
+            if days == 0:
+                continue
 
-        threshold = datetime_now() - timedelta(days=self.state.tenant_cache[tid].password_change_period)
+            threshold = datetime_now() - timedelta(days=days)
 
-        subquery = session.query(models.User.id) \
-                          .filter(models.User.password_change_date < threshold,
-                                  models.User.tid == tid) \
-                          .subquery()
+            subquery = session.query(models.User.id) \
+                              .filter(models.User.password_change_date < threshold,
+                                      models.User.tid.in_(tids)) \
+                              .subquery()
 
-        session.query(models.User).filter(models.User.id.in_(subquery)).update({'password_change_needed': True}, synchronize_session=False)
+            session.query(models.User).filter(models.User.id.in_(subquery)).update({'password_change_needed': True}, synchronize_session=False)
 
     @transact
     def clean(self, session):
@@ -114,8 +213,20 @@ class Cleaning(DailyJob):
         session.query(models.Anomalies).filter(models.Anomalies.date < datetime_now() - timedelta(365)).delete(synchronize_session=False)
 
         # delete archived schemas not used by any existing submission
+        # preserving the snapshots of the current questionnaires that are assumed to be archived
+        if self.state.settings.jobs_worker_process:
+            # the cache of the jobs worker is not populated by the submissions
+            for questionnaire in session.query(models.Questionnaire):
+                db_get_questionnaire_snapshot(session, questionnaire.tid, questionnaire)
+
         subquery = session.query(models.InternalTipAnswers.questionnaire_hash).subquery()
-        session.query(models.ArchivedSchema).filter(not_(models.ArchivedSchema.hash.in_(subquery))).delete(synchronize_session=False)
+        q = session.query(models.ArchivedSchema).filter(not_(models.ArchivedSchema.hash.in_(subquery)))
+
+        snapshots = QuestionnaireSnapshotCache.hashes()
+        if snapshots:
+            q = q.filter(not_(models.ArchivedSchema.hash.in_(snapshots)))
+
+        q.delete(synchronize_session=False)
 
         # delete the tenants created via signup that has not been completed in 24h
         subquery = session.query(models.Tenant.id).filter(models.Signup.activation_token != '',
@@ -124,45 +235,83 @@ class Cleaning(DailyJob):
                                                   .subquery()
         session.query(models.Tenant).filter(models.Tenant.id.in_(subquery)).delete(synchronize_session=False)
 
+        # delete the operations on submissions completed more than 1 day ago
+        session.query(models.TipsOperation).filter(models.TipsOperation.done >= models.TipsOperation.total,
+                                                   models.TipsOperation.update_date < datetime_now() - timedelta(days=1)).delete(synchronize_session=False)
+
     @transact
-    def get_files_to_secure_delete(self, session):
-        return [x[0] for x in session.query(models.SecureFileDelete.filepath)]
+    def check_tip_counters(self, session):
+        """
+        This function verifies the counters of comments, messages and files
+        kept on the submissions and repairs the ones that drifted
+        """
+        counters = [
+            (models.InternalTip, 'comment_count', models.Comment, models.Comment.internaltip_id),
+            (models.InternalTip, 'file_count', models.InternalFile, models.InternalFile.internaltip_id),
+            (models.ReceiverTip, 'message_count', models.Message, models.Message.receivertip_id)
+        ]
+
+        for model, attr, counted_model, foreign_key in counters:
+            count = session.query(func.count(counted_model.id)) \
+                           .filter(foreign_key == model.id) \
+                           .correlate(model).as_scalar()
+
+            repaired = session.query(model) \
+                              .filter(getattr(model, attr) != count) \
+                              .update({attr: count}, synchronize_session=False)
+
+            if repaired:
+                log.info("Repaired %s of %d %s", attr, repaired, model.__tablename__)
 
     @transact
-    def commit_files_deletion(self, session, filepaths):
-        session.query(models.SecureFileDelete).filter(models.SecureFileDelete.filepath.in_(filepaths)).delete(synchronize_session=False)
+    def mark_files_for_secure_deletion(self, session, filenames):
+        marked = set(x[0] for x in session.query(models.SecureFileDelete.filepath))
+
+        for filename in filenames:
+            if os.path.join(self.state.settings.tmp_path, filename) not in marked:
+                db_mark_file_for_secure_deletion(session, self.state.settings.tmp_path, filename)
 
     @inlineCallbacks
-    def perform_secure_deletion_of_files(self):
-        # Delete files that are marked for secure deletion
-        files_to_delete = yield self.get_files_to_secure_delete()
-        for file_to_delete in files_to_delete:
-            overwrite_and_remove(file_to_delete)
-
-        if files_to_delete:
-            yield self.commit_files_deletion(files_to_delete)
-
-        # Delete the outdated AES files older than 1 day
-        files_to_remove = [f for f in os.listdir(self.state.settings.tmp_path) if fnmatch.fnmatch(f, '*.aes')]
-        for f in files_to_remove:
+    def clean_temporary_files(self):
+        # Delete the resumable uploads expired
+        resumable.clean_expired_uploads(self.state.settings.tmp_path, self.state.settings.upload_resume_timeout)
+
+        # Mark for secure deletion the outdated AES files older than 1 day excluding the resumable uploads;
+        # the files are then overwritten and removed by the SecureDeletion job
+        preserved = resumable.get_resumable_files(self.state.settings.tmp_path, self.state.settings.upload_resume_timeout)
+        files_to_remove = []
+        for f in os.listdir(self.state.settings.tmp_path):
+            if not fnmatch.fnmatch(f, '*.aes') or f in preserved:
+                continue
+
             path = os.path.join(self.state.settings.tmp_path, f)
             timestamp = datetime.fromtimestamp(os.path.getmtime(path))
             if is_expired(timestamp, days=1):
-                overwrite_and_remove(path)
+                files_to_remove.append(f)
+
+        if files_to_remove:
+            yield self.mark_files_for_secure_deletion(files_to_remove)
 
     @transact
-    def per_tenant_clean(self, session, tid):
-        self.db_clean_expired_wbtips(session, tid)
-        self.db_check_for_expiring_submissions(session, tid)
-        self.db_expire_old_passwords(session, tid)
+    def clean_tenants(self, session):
+        """
+        Transaction performing the cleaning operations of all the tenants
+        grouping the tenants sharing the same settings in the same queries
+        """
+        self.db_clean_expired_wbtips(session)
+        self.db_check_for_expiring_submissions(session)
+        self.db_expire_old_passwords(session)
 
     @inlineCallbacks
     def operation(self):
+        self.progress = {}
+
         yield self.clean_expired_itips()
 
-        for tid in self.state.tenant_state:
-            yield self.per_tenant_clean(tid)
+        yield self.clean_tenants()
 
         yield self.clean()
 
-        yield self.perform_secure_deletion_of_files()
+        yield self.check_tip_counters()
+
+        yield self.clean_temporary_files()
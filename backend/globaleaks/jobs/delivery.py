@@ -246,3 +246,7 @@ class Delivery(LoopingJob):
         if whistleblowerfiles_maps:
             process_whistleblowerfiles(self.state, whistleblowerfiles_maps)
             yield update_whistleblowerfiles(whistleblowerfiles_maps)
+
+        # The notifications of the files delivered are generated without waiting for the next run
+        if (receiverfiles_maps or whistleblowerfiles_maps) and self.state.jobs_worker is not None:
+            self.state.jobs_worker.wakeup('Notification')
@@ -1,15 +1,29 @@
 # -*- coding: utf-8
+import random
 import time
 
 from twisted.internet import task, defer, reactor
 
 from globaleaks.state import State, extract_exception_traceback_and_schedule_email
+from globaleaks.utils import utility
 from globaleaks.utils.log import log
 from globaleaks.utils.utility import datetime_now
 
 
 TRACK_LAST_N_EXECUTIONS = 10
 
+# Semaphore limiting the number of heavy jobs executed concurrently
+heavy_jobs_semaphore = None
+
+
+def get_heavy_jobs_semaphore():
+    global heavy_jobs_semaphore
+
+    if heavy_jobs_semaphore is None:
+        heavy_jobs_semaphore = defer.DeferredSemaphore(State.settings.jobs_heavy_concurrency)
+
+    return heavy_jobs_semaphore
+
 
 class Job(task.LoopingCall):
     state = State
@@ -21,8 +35,25 @@ class Job(task.LoopingCall):
     active = None
     last_executions = []
 
+    # Maximum random offset (seconds) added to the schedule of the job
+    jitter = 0
+
+    # Period (seconds) across which the job spreads its per tenant operations
+    spread_period = 0
+
+    # Heavy jobs are executed respecting a global concurrency budget
+    heavy = False
+
+    # Jobs not depending on the state of the web process could be executed by the jobs worker
+    worker = False
+
     def __init__(self):
         self.name = self.__class__.__name__
+        self.offset = random.randint(0, self.jitter) if self.jitter else 0
+        self.waiting_since = None
+        self.budget_acquired = False
+        self.executing = False
+        self.spread_progress = None
 
         task.LoopingCall.__init__(self, self.run)
 
@@ -43,15 +74,81 @@ class Job(task.LoopingCall):
 
     @defer.inlineCallbacks
     def run(self):
-        self.begin()
+        # A job already running or waiting for the budget is not executed
+        # again (e.g. when woken up while a scheduled run is in progress)
+        if self.executing:
+            return
+
+        self.executing = True
 
         try:
-            yield self.operation()
-        except Exception as e:
-            if not self.state.shutdown:
-                self.on_error(e)
+            yield self.acquire_budget()
+
+            if self.state.shutdown:
+                return
+
+            self.begin()
+
+            try:
+                yield self.operation()
+            except Exception as e:
+                if not self.state.shutdown:
+                    self.on_error(e)
+
+            self.release_budget()
 
-        self.end()
+            self.end()
+        finally:
+            self.release_budget()
+            self.executing = False
+
+    @defer.inlineCallbacks
+    def acquire_budget(self):
+        if not self.heavy:
+            return
+
+        self.waiting_since = time.time()
+
+        try:
+            yield get_heavy_jobs_semaphore().acquire()
+            self.budget_acquired = True
+        finally:
+            self.waiting_since = None
+
+    def release_budget(self):
+        if self.budget_acquired:
+            self.budget_acquired = False
+            get_heavy_jobs_semaphore().release()
+
+    @defer.inlineCallbacks
+    def spread(self, items, f):
+        """
+        Call a function on each item spreading the calls across the spread period
+
+        The concurrency budget of heavy jobs is released while waiting
+
+        :param items: The list of the items (e.g. tenants IDs) to be processed
+        :param f: The function to be called on each item
+        """
+        start = time.time()
+        self.spread_progress = [0, len(items)]
+
+        try:
+            for i, item in enumerate(items):
+                delay = start + self.spread_period * i / len(items) - time.time()
+                if delay > 0:
+                    self.release_budget()
+                    yield utility.deferred_sleep(delay)
+                    yield self.acquire_budget()
+
+                if self.state.shutdown:
+                    break
+
+                yield f(item)
+
+                self.spread_progress[0] = i + 1
+        finally:
+            self.spread_progress = None
 
     def begin(self):
         self.active = defer.Deferred()
@@ -84,6 +181,24 @@ class Job(task.LoopingCall):
     def operation(self):
         return
 
+    def get_status(self):
+        """
+        Return the metrics describing the progress of the job
+        """
+        return {}
+
+    def get_schedule(self):
+        """
+        Return the information describing the scheduling of the job
+        """
+        return {
+            'offset': self.offset,
+            'heavy': self.heavy,
+            'running': self.active is not None,
+            'waiting': self.waiting_since is not None,
+            'spread': self.spread_progress
+        }
+
     def get_delay(self):
         return 0
 
@@ -113,18 +228,21 @@ class LoopingJob(Job):
 
 class HourlyJob(LoopingJob):
     interval = 3600
+    jitter = 10 * 60
 
     def get_delay(self):
         current_time = datetime_now()
-        return 3600 - (current_time.minute * 60) - current_time.second
+        return 3600 - (current_time.minute * 60) - current_time.second + self.offset
 
 
 class DailyJob(LoopingJob):
     interval = 24 * 3600
+    jitter = 3600
+    heavy = True
 
     def get_delay(self):
         current_time = datetime_now()
-        return (3600 * 24) - (current_time.hour * 3600) - (current_time.minute * 60) - current_time.second
+        return (3600 * 24) - (current_time.hour * 3600) - (current_time.minute * 60) - current_time.second + self.offset
 
 
 class JobsMonitor(LoopingJob):
@@ -134,15 +252,32 @@ class JobsMonitor(LoopingJob):
         LoopingJob.__init__(self)
         self.jobs_list = jobs_list
 
+    def get_status(self):
+        return {
+            'heavy_jobs_limit': self.state.settings.jobs_heavy_concurrency,
+            'heavy_jobs_running': [job.name for job in self.jobs_list if job.budget_acquired],
+            'heavy_jobs_waiting': [job.name for job in self.jobs_list if job.waiting_since is not None],
+            'jobs': {job.name: job.get_schedule() for job in self.jobs_list}
+        }
+
     def operation(self):
         current_time = time.time()
 
         error_msg = ""
         for job in self.jobs_list:
+            if job.waiting_since is not None and \
+               current_time - job.waiting_since > job.monitor_interval and \
+               current_time - job.last_monitor_check_failed > job.monitor_interval:
+                job.last_monitor_check_failed = current_time
+                error = "Job %s is waiting for more than %d seconds to be executed" % (job.name, current_time - job.waiting_since)
+                error_msg += error + '\n'
+                log.err(error)
+
             if job.active is None:
                 continue
 
-            execution_time = current_time - job.start_time
+            # The jobs spreading their operations are expected to last for the spread period
+            execution_time = current_time - job.start_time / 1000 - job.spread_period
 
             time_from_last_failed_check = current_time - job.last_monitor_check_failed
 
@@ -261,6 +261,7 @@ def get_mails_from_the_pool(session):
 class Notification(LoopingJob):
     interval = 5
     monitor_interval = 3 * 60
+    worker = True
     mails_to_delete = []
 
     @defer.inlineCallbacks
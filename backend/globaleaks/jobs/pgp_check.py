@@ -30,6 +30,7 @@ def db_get_expired_or_expiring_pgp_users(session, tids_list):
 
 class PGPCheck(DailyJob):
     monitor_interval = 5 * 60
+    worker = True
 
     def prepare_admin_pgp_alerts(self, session, tid, expired_or_expiring):
         for user_desc in db_get_users(session, tid, 'admin'):
@@ -0,0 +1,144 @@
+# -*- coding: utf-8
+# Implementation of the secure deletion of the files
+import os
+import time
+
+from twisted.internet.defer import inlineCallbacks
+from twisted.internet.threads import deferToThread
+
+from globaleaks import models
+from globaleaks.jobs.job import LoopingJob
+from globaleaks.orm import transact
+from globaleaks.utils.fs import overwrite_file
+from globaleaks.utils.log import log
+from globaleaks.utils.utility import deferred_sleep
+
+
+__all__ = ['SecureDeletion']
+
+
+@transact
+def get_files_to_secure_delete(session):
+    """
+    Transaction retrieving the files marked for secure deletion
+
+    :param session: An ORM session
+    :return: The list of tuples (id, path) of the files
+    """
+    return [(x[0], x[1]) for x in session.query(models.SecureFileDelete.id, models.SecureFileDelete.filepath)]
+
+
+def get_files_sizes(files):
+    sizes = {}
+
+    for file_id, path in files:
+        try:
+            sizes[file_id] = os.path.getsize(path)
+        except OSError:
+            sizes[file_id] = None
+
+    return sizes
+
+
+@transact
+def commit_file_deletion(session, file_id):
+    session.query(models.SecureFileDelete).filter(models.SecureFileDelete.id == file_id).delete(synchronize_session=False)
+
+
+class SecureDeletion(LoopingJob):
+    """
+    Job continuously overwriting and removing the files marked for secure deletion
+
+    The files are overwritten in blocks in a thread and the writes are
+    throttled so that the deletion of large files does not saturate the disk.
+    """
+    interval = 10
+    monitor_interval = 3600
+    worker = True
+
+    def __init__(self):
+        self.backlog_files = 0
+        self.backlog_bytes = 0
+        self.deleted_files = 0
+        self.deleted_bytes = 0
+        self.throughput = 0
+        LoopingJob.__init__(self)
+
+    def get_status(self):
+        return {
+            'backlog_files': self.backlog_files,
+            'backlog_bytes': self.backlog_bytes,
+            'deleted_files': self.deleted_files,
+            'deleted_bytes': self.deleted_bytes,
+            'throughput': self.throughput
+        }
+
+    @inlineCallbacks
+    def overwrite(self, path, budget):
+        """
+        Overwrite a file respecting the budget of bytes per second
+
+        :param path: The path of the file
+        :param budget: The maximum number of bytes written per second
+        :return: A boolean indicating if the file has been overwritten completely
+        """
+        start = time.time()
+        written = 0
+        blocks = overwrite_file(path)
+
+        try:
+            while not self.state.shutdown:
+                n = yield deferToThread(next, blocks, 0)
+                if not n:
+                    return True
+
+                written += n
+                self.deleted_bytes += n
+                self.backlog_bytes = max(self.backlog_bytes - n, 0)
+
+                delay = start + written / budget - time.time()
+                if delay > 0:
+                    yield deferred_sleep(delay)
+        finally:
+            yield deferToThread(blocks.close)
+
+        return False
+
+    @inlineCallbacks
+    def operation(self):
+        files = yield get_files_to_secure_delete()
+        sizes = yield deferToThread(get_files_sizes, files)
+
+        self.backlog_files = len(files)
+        self.backlog_bytes = sum(x for x in sizes.values() if x is not None)
+
+        start = time.time()
+        deleted_bytes = self.deleted_bytes
+
+        for file_id, path in files:
+            if self.state.shutdown:
+                break
+
+            if sizes[file_id] is not None:
+                try:
+                    completed = yield self.overwrite(path, self.state.settings.secure_deletion_bytes_per_second)
+                except Exception as excep:
+                    log.err("Unable to perform secure overwrite for file %s: %s", path, excep)
+                    completed = True
+
+                if not completed:
+                    break
+
+                try:
+                    os.remove(path)
+                except OSError as excep:
+                    log.err("Unable to perform unlink operation on file %s: %s", path, excep)
+
+            yield commit_file_deletion(file_id)
+
+            self.backlog_files -= 1
+            self.deleted_files += 1
+
+        elapsed = time.time() - start
+        if elapsed > 0 and self.deleted_bytes > deleted_bytes:
+            self.throughput = int((self.deleted_bytes - deleted_bytes) / elapsed)
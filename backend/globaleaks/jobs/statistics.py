@@ -41,6 +41,9 @@ class Statistics(HourlyJob):
     """
     monitor_interval = 5 * 60
 
+    # The statistics are collected at the beginning of each hour
+    jitter = 0
+
     def __init__(self):
         HourlyJob.__init__(self)
         self.stats_collection_start_time = datetime_now()
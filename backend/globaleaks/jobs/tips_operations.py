@@ -0,0 +1,61 @@
+# -*- coding: utf-8
+# Implementation of the bulk operations on submissions
+from twisted.internet.defer import inlineCallbacks
+
+from globaleaks import models
+from globaleaks.handlers.receiver import db_perform_tips_operation_chunk
+from globaleaks.jobs.job import LoopingJob
+from globaleaks.orm import transact
+
+
+__all__ = ['TipsOperations']
+
+
+@transact
+def get_pending_tips_operations(session):
+    """
+    Transaction retrieving the IDs of the operations not yet completed
+
+    :param session: An ORM session
+    :return: The list of IDs of the pending operations
+    """
+    return [x[0] for x in session.query(models.TipsOperation.id)
+                                 .filter(models.TipsOperation.done < models.TipsOperation.total)
+                                 .order_by(models.TipsOperation.creation_date)]
+
+
+@transact
+def perform_tips_operation_chunk(session, operation_id):
+    """
+    Transaction advancing an operation by one chunk of submissions
+
+    :param session: An ORM session
+    :param operation_id: The ID of the operation
+    :return: A boolean indicating if other submissions remain to be processed
+    """
+    operation = session.query(models.TipsOperation) \
+                       .filter(models.TipsOperation.id == operation_id).one_or_none()
+
+    if operation is None:
+        return False
+
+    return db_perform_tips_operation_chunk(session, operation)
+
+
+class TipsOperations(LoopingJob):
+    """
+    Job processing in chunks the bulk operations requested by the recipients
+
+    Each chunk is processed in its own transaction so that the operations
+    do not hold the database for long and are resumed after a restart.
+    """
+    interval = 5
+    monitor_interval = 5 * 60
+
+    @inlineCallbacks
+    def operation(self):
+        operations_ids = yield get_pending_tips_operations()
+
+        for operation_id in operations_ids:
+            while (yield perform_tips_operation_chunk(operation_id)):
+                pass
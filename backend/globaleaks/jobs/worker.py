@@ -0,0 +1,355 @@
+# -*- coding: utf-8
+# Implementation of the process dedicated to the execution of the jobs
+#
+# The web process spawns the worker and supervises it; the two processes
+# coordinate through the database while a set of pipes is used as a local
+# channel to wake up the jobs of the worker and to receive its heartbeats.
+import json
+import os
+import sys
+import time
+
+from optparse import OptionParser
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from twisted.internet import defer, error, protocol, reactor, stdio, task
+from twisted.protocols.basic import LineOnlyReceiver
+
+from globaleaks.db import refresh_memory_variables, sync_refresh_memory_variables
+from globaleaks.jobs import job, jobs_list
+from globaleaks.settings import Settings
+from globaleaks.state import State
+from globaleaks.utils.log import log
+from globaleaks.utils.process import disable_swap, set_proc_title
+
+# File descriptor used by the worker to send its heartbeats
+HEARTBEAT_FD = 3
+
+# Functions used to log the lines printed by the worker given their prefix
+LOG_LEVELS = {
+    '[D]': log.debug,
+    '[I]': log.info,
+    '[E]': log.err
+}
+
+
+def get_jobs_description(jobs):
+    return [{
+        'name': x.name,
+        'timings': x.last_executions,
+        'status': x.get_status(),
+        'schedule': x.get_schedule()
+    } for x in jobs]
+
+
+class JobsWorkerProcessProtocol(protocol.ProcessProtocol):
+    def __init__(self, supervisor):
+        self.supervisor = supervisor
+        self.buffer = b''
+
+    def childDataReceived(self, childFD, data):
+        if childFD != HEARTBEAT_FD:
+            # The output of the worker is forwarded to the log of the web process
+            for line in data.decode('utf-8', 'replace').splitlines():
+                level, _, msg = line.partition(' ')
+                if level not in LOG_LEVELS:
+                    level, msg = '[E]' if childFD == 2 else '[I]', line
+
+                LOG_LEVELS[level]("[jobs worker] %s", msg)
+
+            return
+
+        self.buffer += data
+        while b'\n' in self.buffer:
+            line, self.buffer = self.buffer.split(b'\n', 1)
+            self.supervisor.heartbeat_received(line)
+
+    def processEnded(self, reason):
+        self.supervisor.process_ended(reason)
+
+
+class JobsWorkerSupervisor(object):
+    """
+    Supervisor of the process executing the jobs
+
+    The worker is monitored by means of its heartbeats; a worker that
+    exits or stops sending heartbeats is killed and restarted with an
+    exponential backoff.
+    """
+    check_interval = 5
+    heartbeat_timeout = 60
+    max_restart_delay = 60
+
+    # Seconds after which a worker is considered to have started successfully
+    stable_time = 60
+
+    def __init__(self):
+        self.protocol = None
+        self.pid = None
+        self.start_time = 0
+        self.last_heartbeat = 0
+        self.failures = 0
+        self.restarts = 0
+        self.jobs = []
+        self.stopping = False
+        self.stopped = None
+        self.restart_call = None
+        self.health_check = task.LoopingCall(self.check_health)
+        self.health_check.clock = reactor
+
+    def get_worker_args(self):
+        args = [sys.executable, '-m', 'globaleaks.jobs.worker',
+                '--working-path', Settings.working_path,
+                '--socks-host', Settings.socks_host,
+                '--socks-port', str(Settings.socks_port)]
+
+        if Settings.devel_mode:
+            args.append('--devel-mode')
+
+        if Settings.disable_swap:
+            args.append('--disable-swap')
+
+        return args
+
+    def start(self):
+        self.spawn()
+        self.health_check.start(self.check_interval, now=False)
+
+    def spawn(self):
+        self.restart_call = None
+
+        env = os.environ.copy()
+        env['PYTHONPATH'] = os.pathsep.join([Settings.src_path] +
+                                            [x for x in env.get('PYTHONPATH', '').split(os.pathsep) if x])
+
+        self.protocol = JobsWorkerProcessProtocol(self)
+        self.start_time = self.last_heartbeat = time.time()
+
+        transport = reactor.spawnProcess(self.protocol,
+                                         sys.executable,
+                                         self.get_worker_args(),
+                                         env=env,
+                                         childFDs={0: 'w', 1: 'r', 2: 'r', HEARTBEAT_FD: 'r'})
+
+        self.pid = transport.pid
+
+        log.info("Started the jobs worker (pid: %d)", self.pid)
+
+    def send(self, command):
+        if self.protocol is not None and self.protocol.transport is not None:
+            self.protocol.transport.writeToChild(0, command.encode() + b'\n')
+
+    def wakeup(self, job_name):
+        """
+        Request the immediate execution of a job of the worker
+
+        :param job_name: The name of the job
+        """
+        self.send('wakeup %s' % job_name)
+
+    def refresh(self):
+        """
+        Request the worker to reload the configuration from the database
+        """
+        self.send('refresh')
+
+    def heartbeat_received(self, data):
+        self.last_heartbeat = time.time()
+
+        try:
+            self.jobs = json.loads(data.decode())
+        except ValueError:
+            pass
+
+    def check_health(self):
+        if self.protocol is None or self.protocol.transport is None:
+            return
+
+        if time.time() - self.last_heartbeat > self.heartbeat_timeout:
+            log.err("The jobs worker (pid: %d) is not responding; killing it", self.pid)
+            self.kill()
+
+    def kill(self):
+        try:
+            self.protocol.transport.signalProcess('KILL')
+        except error.ProcessExitedAlready:
+            pass
+
+    def process_ended(self, reason):
+        self.protocol = None
+        self.jobs = []
+
+        if self.stopping:
+            self.stopped.callback(None)
+            return
+
+        if time.time() - self.start_time > self.stable_time:
+            self.failures = 0
+
+        delay = min(2 ** self.failures, self.max_restart_delay)
+        self.failures += 1
+        self.restarts += 1
+
+        log.err("The jobs worker (pid: %d) exited (%s); restarting it in %d seconds",
+                self.pid, reason.getErrorMessage(), delay)
+
+        self.restart_call = reactor.callLater(delay, self.spawn)
+
+    def stop(self):
+        if self.health_check.running:
+            self.health_check.stop()
+
+        if self.restart_call is not None and self.restart_call.active():
+            self.restart_call.cancel()
+
+        if self.protocol is None:
+            return defer.succeed(None)
+
+        self.stopping = True
+        self.stopped = defer.Deferred()
+
+        try:
+            self.protocol.transport.signalProcess('TERM')
+        except error.ProcessExitedAlready:
+            pass
+
+        return self.stopped
+
+    def get_status(self):
+        return {
+            'pid': self.pid,
+            'running': self.protocol is not None,
+            'restarts': self.restarts,
+            'last_heartbeat': int(self.last_heartbeat)
+        }
+
+
+@event.listens_for(Session, 'after_commit')
+def dispatch_refresh(session):
+    if session.info.pop('refresh_jobs_worker', False) and State.jobs_worker is not None:
+        reactor.callFromThread(State.jobs_worker.refresh)
+
+
+@event.listens_for(Session, 'after_rollback')
+def discard_refresh(session):
+    session.info.pop('refresh_jobs_worker', None)
+
+
+class JobsWorkerChannel(LineOnlyReceiver):
+    """
+    Channel used by the worker to receive the commands of the web process
+    """
+    delimiter = b'\n'
+
+    def __init__(self, worker):
+        self.worker = worker
+
+    def lineReceived(self, line):
+        command, _, arg = line.decode().partition(' ')
+
+        if command == 'wakeup':
+            self.worker.wakeup(arg)
+        elif command == 'refresh':
+            self.worker.refresh()
+
+    def connectionLost(self, reason):
+        # The worker terminates together with the web process
+        self.worker.shutdown()
+
+
+class JobsWorker(object):
+    """
+    Process executing the jobs that do not depend on the state of the web process
+    """
+    heartbeat_interval = 5
+
+    def __init__(self, state):
+        self.state = state
+        self.jobs = []
+        self.jobs_monitor = None
+        self.channel = None
+        self.heartbeat = task.LoopingCall(self.send_heartbeat)
+
+    def start(self):
+        self.state.orm_tp.start()
+
+        sync_refresh_memory_variables()
+
+        for j in jobs_list:
+            if j.worker:
+                self.jobs.append(j())
+
+        self.state.jobs = self.jobs
+        self.state.jobs_monitor = self.jobs_monitor = job.JobsMonitor(self.jobs)
+
+        self.channel = JobsWorkerChannel(self)
+        stdio.StandardIO(self.channel, stdin=0, stdout=HEARTBEAT_FD)
+
+        self.heartbeat.start(self.heartbeat_interval)
+
+    def send_heartbeat(self):
+        data = json.dumps(get_jobs_description(self.jobs), separators=(',', ':')).encode()
+        self.channel.sendLine(data)
+
+    def wakeup(self, job_name):
+        for x in self.jobs:
+            if x.name == job_name:
+                x.run()
+
+    def refresh(self):
+        return refresh_memory_variables()
+
+    @defer.inlineCallbacks
+    def stop(self):
+        if self.heartbeat.running:
+            self.heartbeat.stop()
+
+        self.state.shutdown = True
+
+        yield defer.DeferredList([defer.maybeDeferred(x.stop) for x in self.jobs + [self.jobs_monitor]])
+
+        self.state.orm_tp.stop()
+
+    def shutdown(self):
+        if reactor.running:
+            reactor.stop()
+
+
+def main():
+    # this import seems unused but it is required in order to load the mocks
+    import globaleaks.mocks.twisted_mocks  # pylint: disable=W0611
+
+    parser = OptionParser()
+    parser.add_option('--working-path', type='string', dest='working_path')
+    parser.add_option('--socks-host', type='string', dest='socks_host', default=Settings.socks_host)
+    parser.add_option('--socks-port', type='int', dest='socks_port', default=Settings.socks_port)
+    parser.add_option('--devel-mode', action='store_true', dest='devel_mode', default=False)
+    parser.add_option('--disable-swap', action='store_true', dest='disable_swap', default=False)
+    options, _ = parser.parse_args()
+
+    if options.devel_mode:
+        Settings.set_devel_mode()
+
+    Settings.working_path = options.working_path
+    Settings.socks_host = options.socks_host
+    Settings.socks_port = options.socks_port
+    Settings.jobs_worker_process = True
+    Settings.eval_paths()
+
+    # The worker handles decrypted content and keys like the web process
+    if options.disable_swap:
+        Settings.disable_swap = True
+        disable_swap()
+
+    set_proc_title('globaleaks-jobs')
+
+    worker = JobsWorker(State)
+
+    reactor.callWhenRunning(worker.start)
+    reactor.addSystemEventTrigger('before', 'shutdown', worker.stop)
+    reactor.run()
+
+
+if __name__ == '__main__':
+    main()
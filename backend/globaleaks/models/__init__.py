@@ -20,6 +20,22 @@ def db_forge_obj(session, mock_class, mock_fields):
     return obj
 
 
+def db_next_tip_seq(session, itip):
+    """
+    Transaction incrementing the update sequence of a submission
+
+    The increment is performed by the database so that the values are
+    assigned in the order in which the transactions are committed
+
+    :param session: An ORM session
+    :param itip: The submission being updated
+    :return: The sequence number to be assigned to the new item of the submission
+    """
+    itip.update_seq = InternalTip.update_seq + 1
+    session.flush()
+    return itip.update_seq
+
+
 @transact
 def forge_obj(session, mock_class, mock_fields):
     return db_forge_obj(session, mock_class, mock_fields)
@@ -289,10 +305,12 @@ class _Comment(Model):
     content = Column(UnicodeText, nullable=False)
     type = Column(UnicodeText, nullable=False)
     new = Column(Boolean, default=True, nullable=False)
+    seq = Column(Integer, default=0, nullable=False)
 
     @declared_attr
     def __table_args__(self):
-        return (ForeignKeyConstraint(['internaltip_id'], ['internaltip.id'], ondelete='CASCADE', deferrable=True, initially='DEFERRED'),)
+        return (ForeignKeyConstraint(['internaltip_id'], ['internaltip.id'], ondelete='CASCADE', deferrable=True, initially='DEFERRED'),
+                Index('comment_internaltip_id_seq', 'internaltip_id', 'seq'))
 
 
 class _Config(Model):
@@ -690,6 +708,7 @@ class _File(Model):
     id = Column(UnicodeText(36), primary_key=True, default=uuid4)
     name = Column(UnicodeText, default='', nullable=False)
     data = Column(UnicodeText, nullable=False)
+    update_date = Column(DateTime, default=datetime_now, nullable=False)
 
     unicode_keys = ['data', 'name']
 
@@ -753,10 +772,12 @@ class _InternalFile(Model):
     size = Column(JSON, default='', nullable=False)
     new = Column(Boolean, default=True, nullable=False)
     submission = Column(Integer, default=False, nullable=False)
+    seq = Column(Integer, default=0, nullable=False)
 
     @declared_attr
     def __table_args__(self):
-        return (ForeignKeyConstraint(['internaltip_id'], ['internaltip.id'], ondelete='CASCADE', deferrable=True, initially='DEFERRED'),)
+        return (ForeignKeyConstraint(['internaltip_id'], ['internaltip.id'], ondelete='CASCADE', deferrable=True, initially='DEFERRED'),
+                Index('internalfile_internaltip_id_seq', 'internaltip_id', 'seq'))
 
 
 class _InternalTip(Model):
@@ -787,6 +808,9 @@ class _InternalTip(Model):
     status = Column(UnicodeText(36), nullable=True)
     substatus = Column(UnicodeText(36), nullable=True)
     crypto_tip_pub_key = Column(UnicodeText(56), default='', nullable=False)
+    comment_count = Column(Integer, default=0, nullable=False)
+    file_count = Column(Integer, default=0, nullable=False)
+    update_seq = Column(Integer, default=0, nullable=False)
 
     @declared_attr
     def __table_args__(self):
@@ -858,10 +882,12 @@ class _Message(Model):
     content = Column(UnicodeText, nullable=False)
     type = Column(Enum(EnumMessageType), nullable=False)
     new = Column(Boolean, default=True, nullable=False)
+    seq = Column(Integer, default=0, nullable=False)
 
     @declared_attr
     def __table_args__(self):
         return (ForeignKeyConstraint(['receivertip_id'], ['receivertip.id'], ondelete='CASCADE', deferrable=True, initially='DEFERRED'),
+                Index('message_receivertip_id_seq', 'receivertip_id', 'seq'),
                 CheckConstraint(self.type.in_(EnumMessageType.keys())))
 
 
@@ -873,6 +899,7 @@ class _Questionnaire(Model):
     name = Column(UnicodeText, default='', nullable=False)
     enable_whistleblower_identity = Column(Boolean, default=False, nullable=False)
     editable = Column(Boolean, default=True, nullable=False)
+    revision = Column(UnicodeText(36), default=uuid4, nullable=False)
 
     unicode_keys = ['key', 'name']
     bool_keys = ['editable']
@@ -942,6 +969,7 @@ class _ReceiverTip(Model):
     new = Column(Boolean, default=True, nullable=False)
     enable_notifications = Column(Boolean, default=True, nullable=False)
     crypto_tip_prv_key = Column(UnicodeText(84), default='', nullable=False)
+    message_count = Column(Integer, default=0, nullable=False)
 
     @declared_attr
     def __table_args__(self):
@@ -1137,6 +1165,28 @@ class _Tenant(Model):
     bool_keys = ['active']
 
 
+class _TipsOperation(Model):
+    """
+    This model keeps track of the bulk operations requested by the recipients on their tips
+    """
+    __tablename__ = 'tipsoperation'
+
+    id = Column(UnicodeText(36), primary_key=True, default=uuid4, nullable=False)
+    tid = Column(Integer, default=1, nullable=False)
+    receiver_id = Column(UnicodeText(36), nullable=False)
+    creation_date = Column(DateTime, default=datetime_now, nullable=False)
+    update_date = Column(DateTime, default=datetime_now, nullable=False)
+    operation = Column(UnicodeText(16), nullable=False)
+    rtips = Column(JSON, default=list, nullable=False)
+    total = Column(Integer, default=0, nullable=False)
+    done = Column(Integer, default=0, nullable=False)
+
+    @declared_attr
+    def __table_args__(self):
+        return (ForeignKeyConstraint(['tid'], ['tenant.id'], ondelete='CASCADE', deferrable=True, initially='DEFERRED'),
+                ForeignKeyConstraint(['receiver_id'], ['user.id'], ondelete='CASCADE', deferrable=True, initially='DEFERRED'))
+
+
 class _User(Model):
     """
     This model keeps track of users.
@@ -1444,6 +1494,10 @@ class Tenant(_Tenant, Base):
     pass
 
 
+class TipsOperation(_TipsOperation, Base):
+    pass
+
+
 class User(_User, Base):
     pass
 
@@ -44,16 +44,20 @@ def serialize_rfile(session, rfile):
     }
 
 
-def serialize_wbfile(session, wbfile):
+def serialize_wbfile(session, wbfile, data=None):
     """
     Transaction for serializing wbfile
 
     :param session: An ORM session
     :param wbfile: The wbfile to be serialized
+    :param data: The prefetched data returned by db_prepare_tip_serialization
     :return: The serialized wbfile
     """
-    receiver_id = session.query(models.ReceiverTip.receiver_id) \
-                         .filter(models.ReceiverTip.id == wbfile.receivertip_id).one()
+    if data is not None:
+        receiver_id = data['rtips'][wbfile.receivertip_id].receiver_id
+    else:
+        receiver_id = session.query(models.ReceiverTip.receiver_id) \
+                             .filter(models.ReceiverTip.id == wbfile.receivertip_id).one()[0]
 
     return {
         'id': wbfile.id,
@@ -15,6 +15,7 @@ from twisted.web.server import NOT_DONE_YET
 from globaleaks import LANGUAGES_SUPPORTED_CODES
 from globaleaks.handlers import custodian, \
                                 email_validation, \
+                                events, \
                                 exception, \
                                 file, \
                                 receiver, \
@@ -56,6 +57,7 @@ from globaleaks.state import State, extract_exception_traceback_and_schedule_ema
 tid_regexp = r'([0-9]+)'
 uuid_regexp = r'([a-f0-9]{8}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{12})'
 key_regexp = r'([a-f0-9]{8}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{12}|[a-z_]{0,100})'
+sha256_regexp = r'([a-f0-9]{64})'
 
 api_spec = [
     (r'/exception', exception.ExceptionHandler),
@@ -107,6 +109,9 @@ api_spec = [
     # Receiver Handlers
     (r'/recipient/reports', receiver.TipsCollection),
     (r'/rtip/operations', receiver.TipsOperations),
+    (r'/rtip/operations/' + uuid_regexp, receiver.TipsOperationInstance),
+    (r'/rtip/export', export.TipsExportHandler),
+    (r'/recipient/events', events.EventsHandler),
 
     (r'/custodian/identityaccessrequests', custodian.IdentityAccessRequestsCollection),
     (r'/custodian/identityaccessrequest/' + uuid_regexp, custodian.IdentityAccessRequestInstance),
@@ -169,6 +174,8 @@ api_spec = [
     # Special Files Handlers
     (r'/robots.txt', robots.RobotstxtHandler),
     (r'/sitemap.xml', sitemap.SitemapHandler),
+    (r'/img/(users|contexts)/' + uuid_regexp + r'/' + sha256_regexp, file.ImgHandler),
+    (r'/img/(files)/(logo|favicon)/' + sha256_regexp, file.ImgHandler),
     (r'/s/(.+)', file.FileHandler),
     (r'/l10n/(' + '|'.join(LANGUAGES_SUPPORTED_CODES) + ')', l10n.L10NHandler),
 
@@ -364,11 +371,13 @@ class APIResourceWrapper(Resource):
         if method == 'head':
             method = 'get'
 
-        if method not in self.method_map.keys() or not hasattr(handler, method):
+        # Flow.js checks with a GET on the upload target the chunks already received
+        test_chunk = handler.upload_handler and method == 'get' and b'flowChunkNumber' in request.args
+
+        if not test_chunk and (method not in self.method_map.keys() or not hasattr(handler, method)):
             self.handle_exception(errors.MethodNotImplemented(), request)
             return b''
 
-        f = getattr(handler, method)
         groups = match.groups()
 
         self.handler = handler(State, request, **args)
@@ -379,11 +388,38 @@ class APIResourceWrapper(Resource):
             self.handle_exception(errors.ForbiddenOperation(), request)
             return b''
 
+        if test_chunk:
+            try:
+                if not self.handler.test_file_upload_chunk(*groups):
+                    request.setResponseCode(204)
+            except errors.GLException as e:
+                self.handle_exception(e, request)
+
+            return b''
+
         if self.handler.upload_handler and method == 'post':
-            self.handler.process_file_upload()
-            if self.handler.uploaded_file is None:
+            try:
+                d = self.handler.process_file_upload(*groups)
+            except errors.GLException as e:
+                self.handle_exception(e, request)
                 return b''
 
+            if self.handler.uploaded_file is None:
+                if d is None:
+                    return b''
+
+                # The chunks of resumable uploads are acknowledged once recorded durably
+                def concludeChunk(result):
+                    if result is not None:
+                        self.handle_exception(result, request)
+
+                    if not request_finished[0]:
+                        request.finish()
+
+                d.addBoth(concludeChunk)
+
+                return NOT_DONE_YET
+
         @defer.inlineCallbacks
         def concludeHandlerFailure(err):
             yield self.handler.execution_check()
@@ -415,6 +451,8 @@ class APIResourceWrapper(Resource):
 
                 request.finish()
 
+        f = getattr(handler, method)
+
         defer.maybeDeferred(f, self.handler, *groups).addCallbacks(concludeHandlerSuccess, concludeHandlerFailure)
 
         return NOT_DONE_YET
@@ -1,6 +1,13 @@
 # -*- coding: utf-8 -*-
+import base64
 import gzip
 import io
+import json
+
+from types import MappingProxyType
+
+from globaleaks.utils.crypto import sha256
+from globaleaks.utils.utility import datetime_now
 
 def gzipdata(data):
     if isinstance(data, str):
@@ -46,3 +53,121 @@ class Cache(object):
             cls.memory_cache_dict.clear()
         else:
             cls.memory_cache_dict.pop(tid, None)
+
+
+class FileCache(object):
+    """
+    Cache of the decoded customization files stored on the database
+
+    The generation is incremented by every invalidation so that the entries
+    loaded from the database before an invalidation are not stored.
+    """
+    memory_cache_dict = {}
+    generation = 0
+
+    @classmethod
+    def get(cls, tid, id):
+        if tid in cls.memory_cache_dict:
+            return cls.memory_cache_dict[tid].get(id)
+
+    @classmethod
+    def set(cls, tid, id, data, last_modified, generation):
+        """
+        :param tid: The tenant ID
+        :param id: The file ID
+        :param data: The base64 content of the file as stored on the database
+        :param last_modified: The date of the last update of the file or None if it does not exist
+        :param generation: The generation of the cache read before loading the file
+        :return: The cache entry
+        """
+        content = base64.b64decode(data)
+
+        # The removal date of files not existing is not known and is
+        # assumed to precede the loading of the entry
+        if last_modified is None:
+            last_modified = datetime_now()
+
+        entry = {
+            'hash': sha256(data).decode(),
+            'etag': sha256(content).decode(),
+            'last_modified': last_modified.replace(microsecond=0),
+            'data': content,
+            'gzip': gzipdata(content)
+        }
+
+        if generation == cls.generation:
+            cls.memory_cache_dict.setdefault(tid, {})[id] = entry
+
+        return entry
+
+    @classmethod
+    def invalidate(cls, tid=1):
+        cls.generation += 1
+
+        if tid == 1:
+            cls.memory_cache_dict.clear()
+        else:
+            cls.memory_cache_dict.pop(tid, None)
+
+
+class L10NCache(object):
+    """
+    Cache of the translation bundles shipped with the client and of the
+    payloads resulting from the overlay of the custom texts of each tenant
+
+    The generation is incremented by every invalidation so that the payloads
+    built from custom texts loaded before an invalidation are not stored.
+    """
+    bundles = {}
+    memory_cache_dict = {}
+    generation = 0
+
+    @classmethod
+    def get_bundle(cls, lang):
+        return cls.bundles.get(lang)
+
+    @classmethod
+    def set_bundle(cls, lang, texts):
+        cls.bundles[lang] = MappingProxyType(texts)
+
+        return cls.bundles[lang]
+
+    @classmethod
+    def get(cls, tid, lang):
+        if tid in cls.memory_cache_dict:
+            return cls.memory_cache_dict[tid].get(lang)
+
+    @classmethod
+    def set(cls, tid, lang, custom_texts, generation):
+        """
+        :param tid: The tenant ID
+        :param lang: The language of the payload
+        :param custom_texts: The custom texts overlaying the language bundle
+        :param generation: The generation of the cache read before loading the custom texts
+        :return: The cache entry
+        """
+        texts = dict(cls.bundles.get(lang, {}))
+        texts.update(custom_texts)
+
+        data = json.dumps(texts, separators=(',', ':')).encode()
+
+        entry = {
+            'texts': MappingProxyType(dict(custom_texts)),
+            'etag': sha256(data).decode(),
+            'data': data,
+            'gzip': gzipdata(data)
+        }
+
+        if generation == cls.generation:
+            cls.memory_cache_dict.setdefault(tid, {})[lang] = entry
+
+        return entry
+
+    @classmethod
+    def invalidate(cls, tid=1):
+        cls.generation += 1
+
+        if tid == 1:
+            cls.memory_cache_dict.clear()
+        else:
+            cls.memory_cache_dict.pop(tid, None)
@@ -203,3 +203,21 @@ class SessionExpired(GLException):
     reason = "Session expired"
     error_code = 17
     status_code = 401
+
+
+class RangeNotSatisfiable(GLException):
+    reason = "Requested range not satisfiable"
+    error_code = 18
+    status_code = 416
+
+
+class TooManyConnections(GLException):
+    reason = "Too many connections"
+    error_code = 19
+    status_code = 503
+
+
+class UploadQuotaExceeded(GLException):
+    reason = "Upload quota exceeded"
+    error_code = 20
+    status_code = 507
@@ -186,6 +186,10 @@ ReceiverOperationDesc = {
     'rtips': [uuid_regexp]
 }
 
+TipsExportDesc = {
+    'rtips': [uuid_regexp]
+}
+
 CommentDesc = {
     'content': str
 }
@@ -16,6 +16,7 @@ class Session(object):
         self.two_factor = two_factor
         self.cc = cc
         self.ek = ek
+        self.preview_cache = {}
         self.expireCall = None
 
     def getTime(self):
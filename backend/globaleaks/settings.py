@@ -101,8 +101,41 @@ class SettingsClass(object, metaclass=Singleton):
         self.csr_sign_bits = 512
 
         self.notification_limit = 30
+
+        # Server-sent events
+        self.events_heartbeat_interval = 30  # seconds
+        self.events_connections_limit = 100  # per tenant
         self.jobs_operation_limit = 20
 
+        # Maximum bytes per second written by the secure deletion of the files
+        self.secure_deletion_bytes_per_second = 16 * 1024 * 1024
+
+        # Execute the jobs not depending on the state of the web process in a dedicated process
+        self.jobs_worker = False
+        self.jobs_worker_process = False
+
+        # Number of heavy jobs (e.g. the daily jobs) that could be executed concurrently
+        self.jobs_heavy_concurrency = 1
+
+        # Seconds dedicated by each run of the cleaning to the deletion of the expired tips
+        self.cleaning_time_budget = 4 * 60
+
+        # Number of tips processed in each transaction of the bulk operations
+        self.tips_operations_chunk_size = 100
+
+        # Number of chunks prepared in advance by the threads serving downloads
+        self.download_prefetch_chunks = 8
+
+        # Number of chunks of a file that could be uploaded in parallel
+        self.upload_parallel_chunks = 4
+
+        # Seconds after which an interrupted upload could not be resumed anymore
+        self.upload_resume_timeout = 86400
+
+        # Megabytes that could be used by the uploads in progress of each tenant and of each session
+        self.upload_tenant_quota = 10240
+        self.upload_session_quota = 2048
+
         self.user = getpass.getuser()
         self.group = getpass.getuser()
 
@@ -217,6 +250,9 @@ class SettingsClass(object, metaclass=Singleton):
         if self.cmdline_options.orm_debug:
             enable_orm_debug()
 
+        if self.cmdline_options.jobs_worker:
+            self.jobs_worker = True
+
         if self.cmdline_options.working_path:
             self.working_path = self.cmdline_options.working_path
 
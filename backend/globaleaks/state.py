@@ -19,9 +19,11 @@ from globaleaks.utils.log import log
 from globaleaks.utils.mail import sendmail
 from globaleaks.utils.objectdict import ObjectDict
 from globaleaks.utils.pgp import PGPContext
+from globaleaks.utils.resumable import get_resumable_files
 from globaleaks.utils.singleton import Singleton
 from globaleaks.utils.sni import SNIMap
 from globaleaks.utils.tempdict import TempDict
+from globaleaks.utils.tempuploads import TempUploadList
 from globaleaks.utils.templating import Templating
 from globaleaks.utils.token import TokenList
 from globaleaks.utils.tor_exit_set import TorExitSet
@@ -58,6 +60,7 @@ class StateClass(ObjectDict, metaclass=Singleton):
 
         self.jobs = []
         self.jobs_monitor = None
+        self.jobs_worker = None
         self.services = []
         self.onion_service_job = None
 
@@ -74,7 +77,7 @@ class StateClass(ObjectDict, metaclass=Singleton):
         self.tenant_hostname_id_map = {}
 
         self.set_orm_tp(ThreadPool(4, 16))
-        self.TempUploadFiles = TempDict(timeout=3600)
+        self.TempUploadFiles = TempUploadList(timeout=3600)
 
         self.shutdown = False
 
@@ -138,7 +141,13 @@ class StateClass(ObjectDict, metaclass=Singleton):
         temporally_encrypted_dir
         """
         # temporary .aes files must be simply deleted
+        # excluding the ones of the uploads that could be resumed
+        preserved = get_resumable_files(self.settings.tmp_path, self.settings.upload_resume_timeout)
+
         for f in os.listdir(self.settings.tmp_path):
+            if f in preserved:
+                continue
+
             path = os.path.join(self.settings.tmp_path, f)
             log.debug("Removing old temporary file: %s", path)
 
@@ -257,9 +266,7 @@ class StateClass(ObjectDict, metaclass=Singleton):
         db_schedule_email(session, tid, user_desc['mail_address'], subject, body)
 
     def get_tmp_file_by_name(self, filename):
-        for k, v in self.TempUploadFiles.items():
-            if os.path.basename(v.filepath) == filename:
-                return self.TempUploadFiles.pop(k)
+        return self.TempUploadFiles.pop_by_name(filename)
 
 
 def mail_exception_handler(etype, value, tback):
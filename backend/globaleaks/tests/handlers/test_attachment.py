@@ -2,7 +2,10 @@
 import os
 
 from globaleaks.handlers import attachment
+from globaleaks.rest import errors
+from globaleaks.settings import Settings
 from globaleaks.tests import helpers
+from globaleaks.utils import resumable
 from twisted.internet.defer import inlineCallbacks
 
 
@@ -42,6 +45,41 @@ class TestSubmissionAttachment(helpers.TestHandlerWithPopulatedDB):
         handler = self.request()
         self.assertRaises(Exception, handler.post, 'unexistent_submission')
 
+    def forge_chunk_request(self):
+        handler = self.request()
+        handler.request.args = {
+            b'flowFilename': [b'file.bin'],
+            b'flowIdentifier': [self._testMethodName.encode()],
+            b'flowTotalSize': [b'200'],
+            b'flowChunkSize': [b'100'],
+            b'flowChunkNumber': [b'1'],
+            b'flowTotalChunks': [b'2'],
+            b'file': [b'x' * 100]
+        }
+
+        return handler
+
+    @inlineCallbacks
+    def test_upload_accounted_to_token(self):
+        token = self.state.tokens.new(1)
+
+        # The chunks are accepted only for solved tokens
+        handler = self.forge_chunk_request()
+        self.assertRaises(errors.InternalServerError, handler.process_file_upload, token.id)
+
+        token.solved = True
+        yield self.forge_chunk_request().process_file_upload(token.id)
+        self.assertEqual(self.state.TempUploadFiles.get_owner_bytes(token.id), 100)
+
+        manifest = resumable.get_manifest_path(Settings.tmp_path, 1, self._testMethodName)
+        self.assertTrue(os.path.exists(manifest))
+
+        # The uploads in progress are released when the token expires
+        self.state.tokens.reactor.advance(self.state.tokens.get_timeout())
+        self.assertNotIn(self._testMethodName, self.state.TempUploadFiles)
+        self.assertEqual(self.state.TempUploadFiles.get_owner_bytes(token.id), 0)
+        self.assertFalse(os.path.exists(manifest))
+
 
 class TestPostSubmissionAttachment(helpers.TestHandlerWithPopulatedDB):
     _handler = attachment.PostSubmissionAttachment
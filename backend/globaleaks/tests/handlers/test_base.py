@@ -1,9 +1,21 @@
 # -*- coding: utf-8 -*-
+import gc
 import json
+import os
 
-from globaleaks.handlers.base import BaseHandler
+from io import BytesIO
+from twisted.internet import abstract, reactor, task
+from twisted.internet.defer import DeferredList, inlineCallbacks
+
+from globaleaks.handlers.base import BaseHandler, FileProducer
+from globaleaks.rest import errors
 from globaleaks.rest.errors import InputValidationError
+from globaleaks.sessions import Sessions
+from globaleaks.settings import Settings
+from globaleaks.state import State
 from globaleaks.tests import helpers
+from globaleaks.utils import resumable
+from globaleaks.utils.securetempfile import SecureTemporaryFile
 
 FUTURE = 100
 
@@ -69,3 +81,229 @@ class TestBaseHandler(helpers.TestHandlerWithPopulatedDB):
     def test_validate_regexp_valid(self):
         self.assertTrue(BaseHandler.validate_regexp('Foca', '\w+'))
         self.assertFalse(BaseHandler.validate_regexp('Foca', '\d+'))
+
+
+class TestFileUpload(helpers.TestHandler):
+    _handler = BaseHandlerMock
+
+    @inlineCallbacks
+    def setUp(self):
+        yield helpers.TestHandler.setUp(self)
+
+        # The uploads are accounted to the session of the caller
+        self.session = Sessions.new(1, 'user', 1, 'admin', False, False, helpers.USER_PRV_KEY, '')
+
+    def forge_chunk_request(self, number, content, total_chunks=2, streamed=True):
+        handler = self.request(headers={'x-session': self.session.id})
+        handler.request.args = {
+            b'flowFilename': [b'file.bin'],
+            b'flowIdentifier': [self._testMethodName.encode()],
+            b'flowTotalSize': [b'%d' % (total_chunks * len(content))],
+            b'flowChunkSize': [b'%d' % len(content)],
+            b'flowChunkNumber': [b'%d' % number],
+            b'flowTotalChunks': [b'%d' % total_chunks]
+        }
+
+        if not streamed:
+            handler.request.args[b'file'] = [content]
+            return handler
+
+        handler.request.upload_file = SecureTemporaryFile(Settings.tmp_path)
+        handler.request.upload_file_size = len(content)
+        with handler.request.upload_file.open('w') as f:
+            f.write(content)
+
+        return handler
+
+    def test_process_file_upload_streamed(self):
+        chunks = [os.urandom(100000), os.urandom(100000)]
+
+        handler = self.forge_chunk_request(1, chunks[0])
+        chunk_file = handler.request.upload_file
+        handler.process_file_upload()
+        self.assertIsNone(handler.uploaded_file)
+
+        # The first chunk is adopted as the temporary file of the upload
+        self.assertIs(State.TempUploadFiles[self._testMethodName], chunk_file)
+        self.assertIsNone(handler.request.upload_file)
+
+        handler = self.forge_chunk_request(2, chunks[1])
+        handler.process_file_upload()
+
+        with handler.uploaded_file['body'].open('r') as f:
+            self.assertEqual(f.read(), b''.join(chunks))
+
+    def test_process_file_upload_out_of_order(self):
+        chunks = [os.urandom(1000 + i) for i in range(5)]
+        chunks = [x[:1000] for x in chunks]
+
+        for i, streamed in [(2, True), (0, False), (3, True), (1, False)]:
+            handler = self.forge_chunk_request(i + 1, chunks[i], 5, streamed)
+            handler.process_file_upload()
+            self.assertIsNone(handler.uploaded_file)
+
+        handler = self.forge_chunk_request(5, chunks[4], 5)
+        handler.process_file_upload()
+
+        with handler.uploaded_file['body'].open('r') as f:
+            self.assertEqual(f.read(), b''.join(chunks))
+
+    @inlineCallbacks
+    def test_process_file_upload_resume(self):
+        chunks = [os.urandom(1000), os.urandom(1000), os.urandom(1000)]
+
+        # The chunks are acknowledged once the manifest recording them is written
+        yield DeferredList([self.forge_chunk_request(i + 1, chunks[i], 3, i == 0).process_file_upload()
+                            for i in range(2)], fireOnOneErrback=True)
+
+        manifest = resumable.get_manifest_path(Settings.tmp_path, 1, self._testMethodName)
+        self.assertTrue(os.path.exists(manifest))
+
+        # Simulate a restart losing the uploads kept in memory
+        del State.TempUploadFiles[self._testMethodName]
+        handler = None
+        gc.collect()
+
+        handler = self.forge_chunk_request(3, chunks[2], 3)
+        handler.process_file_upload()
+
+        self.assertFalse(os.path.exists(manifest))
+        with handler.uploaded_file['body'].open('r') as f:
+            self.assertEqual(f.read(), b''.join(chunks))
+
+    @inlineCallbacks
+    def test_process_file_upload_quota(self):
+        self.patch(Settings, 'upload_tenant_quota', 1)
+
+        # The quota is accounted on the bytes written and not on the declared size
+        written = State.TempUploadFiles.get_tenant_bytes(1)
+        yield self.forge_chunk_request(1, b'x' * (600 * 1024), 3).process_file_upload()
+        self.assertEqual(State.TempUploadFiles.get_tenant_bytes(1), written + 600 * 1024)
+
+        handler = self.forge_chunk_request(2, b'x' * (600 * 1024), 3)
+        self.assertRaises(errors.UploadQuotaExceeded, handler.process_file_upload)
+        self.assertEqual(State.TempUploadFiles.get_tenant_bytes(1), written + 600 * 1024)
+
+    def test_process_file_upload_session_quota(self):
+        self.patch(Settings, 'upload_session_quota', 1)
+
+        handler = self.forge_chunk_request(1, b'x' * (1024 * 1024 + 1), 3)
+        self.assertRaises(errors.UploadQuotaExceeded, handler.process_file_upload)
+        self.assertNotIn(self._testMethodName, State.TempUploadFiles)
+
+    def test_process_file_upload_unauthenticated(self):
+        handler = self.forge_chunk_request(1, b'x' * 100, 3)
+        del handler.request.headers[b'x-session']
+        self.assertRaises(errors.NotAuthenticated, handler.process_file_upload)
+
+    @inlineCallbacks
+    def test_process_file_upload_resume_quota(self):
+        yield self.forge_chunk_request(1, b'x' * (600 * 1024), 3).process_file_upload()
+
+        # Simulate a restart losing the uploads kept in memory
+        del State.TempUploadFiles[self._testMethodName]
+        gc.collect()
+
+        # The bytes written by the uploads resumed from their manifest are accounted
+        self.patch(Settings, 'upload_tenant_quota', 1)
+        handler = self.forge_chunk_request(2, b'x' * (600 * 1024), 3)
+        self.assertRaises(errors.UploadQuotaExceeded, handler.process_file_upload)
+        self.assertNotIn(self._testMethodName, State.TempUploadFiles)
+
+    @inlineCallbacks
+    def test_process_file_upload_size_mismatch(self):
+        yield self.forge_chunk_request(1, b'x' * 100, 3).process_file_upload()
+
+        # The chunks of an upload cannot exceed the size declared by its first chunk
+        handler = self.forge_chunk_request(2, b'x' * 100, 3)
+        handler.request.args[b'flowTotalSize'] = [b'%d' % (1024 * 1024)]
+        self.assertRaises(errors.InputValidationError, handler.process_file_upload)
+
+    @inlineCallbacks
+    def test_process_file_upload_duplicate_chunk(self):
+        chunks = [os.urandom(1000), os.urandom(1000)]
+
+        yield self.forge_chunk_request(1, chunks[0]).process_file_upload()
+
+        # A chunk received again is not rewritten
+        yield self.forge_chunk_request(1, os.urandom(1000), streamed=False).process_file_upload()
+
+        handler = self.forge_chunk_request(2, chunks[1])
+        handler.process_file_upload()
+
+        with handler.uploaded_file['body'].open('r') as f:
+            self.assertEqual(f.read(), b''.join(chunks))
+
+        # The last chunk received again does not complete the upload twice
+        handler = self.forge_chunk_request(2, chunks[1])
+        self.assertIsNone(handler.process_file_upload())
+        self.assertIsNone(handler.uploaded_file)
+
+    @inlineCallbacks
+    def test_test_file_upload_chunk(self):
+        yield self.forge_chunk_request(1, b'x' * 100, 3).process_file_upload()
+
+        self.assertTrue(self.forge_chunk_request(1, b'', 3).test_file_upload_chunk())
+        self.assertFalse(self.forge_chunk_request(2, b'', 3).test_file_upload_chunk())
+
+        # The uploads are reported only to the tenant and the session that started them
+        handler = self.forge_chunk_request(1, b'', 3)
+        handler.request.tid = 2
+        self.assertRaises(errors.InputValidationError, handler.test_file_upload_chunk)
+
+        handler = self.forge_chunk_request(1, b'', 3)
+        handler.get_upload_owner = lambda: 'other'
+        self.assertRaises(errors.InputValidationError, handler.test_file_upload_chunk)
+
+        # Simulate a restart losing the uploads kept in memory
+        del State.TempUploadFiles[self._testMethodName]
+        gc.collect()
+
+        self.assertTrue(self.forge_chunk_request(1, b'', 3).test_file_upload_chunk())
+        self.assertFalse(self.forge_chunk_request(2, b'', 3).test_file_upload_chunk())
+
+        handler = self.forge_chunk_request(1, b'', 3)
+        handler.request.tid = 2
+        self.assertFalse(handler.test_file_upload_chunk())
+
+    def test_process_file_upload_window(self):
+        handler = self.forge_chunk_request(Settings.upload_parallel_chunks + 1, b'x' * 100, 10)
+        self.assertRaises(errors.InputValidationError, handler.process_file_upload)
+
+        handler = self.forge_chunk_request(11, b'x' * 100, 10)
+        self.assertRaises(errors.InputValidationError, handler.process_file_upload)
+
+
+class TestFileProducer(helpers.TestGL):
+    @inlineCallbacks
+    def test_backpressure(self):
+        data = os.urandom(abstract.FileDescriptor.bufferSize * 10)
+        request = helpers.forge_request()
+
+        producer = FileProducer(request, BytesIO(data), lookahead=2)
+        producer.pauseProducing()
+        finished = producer.start()
+
+        # While the transport is paused only the lookahead chunks are read
+        yield task.deferLater(reactor, 0.1, lambda: None)
+        self.assertEqual(request.written, [])
+        self.assertEqual(len(producer.buffer), 2)
+
+        producer.resumeProducing()
+        yield finished
+
+        self.assertEqual(b''.join(request.written), data)
+
+    @inlineCallbacks
+    def test_stop(self):
+        data = os.urandom(abstract.FileDescriptor.bufferSize * 10)
+        request = helpers.forge_request()
+
+        producer = FileProducer(request, BytesIO(data))
+        producer.pauseProducing()
+        finished = producer.start()
+
+        producer.stopProducing()
+        yield finished
+
+        self.assertEqual(request.written, [])
@@ -1,8 +1,11 @@
 # -*- coding: utf-8 -*-
+import base64
+
 from twisted.internet.defer import inlineCallbacks
 
-from globaleaks.rest.cache import Cache, gzipdata
+from globaleaks.rest.cache import Cache, FileCache, L10NCache, gzipdata
 from globaleaks.tests import helpers
+from globaleaks.utils.utility import datetime_now
 
 
 class TestCache(helpers.TestGL):
@@ -31,3 +34,35 @@ class TestCache(helpers.TestGL):
         self.assertEqual(Cache.get(2, "passante_di_professione", "ca")[1], gzipdata('cacaca'))
         Cache.invalidate()
         self.assertEqual(Cache.memory_cache_dict, {})
+
+
+class TestFileCache(helpers.TestGL):
+    def test_fill_overlapping_invalidation(self):
+        data = base64.b64encode(b'body {}').decode()
+        date = datetime_now()
+
+        generation = FileCache.generation
+        entry = FileCache.set(1, 'css', data, date, generation)
+        self.assertIs(FileCache.get(1, 'css'), entry)
+        self.assertEqual(entry['last_modified'], date.replace(microsecond=0))
+
+        # An entry loaded before an invalidation is returned but not stored
+        generation = FileCache.generation
+        FileCache.invalidate(2)
+        entry = FileCache.set(2, 'css', data, date, generation)
+        self.assertEqual(entry['data'], b'body {}')
+        self.assertIsNone(FileCache.get(2, 'css'))
+
+
+class TestL10NCache(helpers.TestGL):
+    def test_fill_overlapping_invalidation(self):
+        generation = L10NCache.generation
+        entry = L10NCache.set(1, 'en', {'a': 'b'}, generation)
+        self.assertIs(L10NCache.get(1, 'en'), entry)
+
+        # A payload built from texts loaded before an invalidation is returned but not stored
+        generation = L10NCache.generation
+        L10NCache.invalidate(2)
+        entry = L10NCache.set(2, 'en', {'a': 'c'}, generation)
+        self.assertEqual(entry['texts']['a'], 'c')
+        self.assertIsNone(L10NCache.get(2, 'en'))
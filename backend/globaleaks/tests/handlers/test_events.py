@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+from twisted.internet.defer import inlineCallbacks
+
+from globaleaks.handlers import events, rtip
+from globaleaks.jobs.delivery import Delivery
+from globaleaks.rest import errors
+from globaleaks.sessions import Sessions
+from globaleaks.settings import Settings
+from globaleaks.tests import helpers
+from globaleaks.utils.utility import deferred_sleep
+
+
+class TestEventsHandler(helpers.TestHandlerWithPopulatedDB):
+    _handler = events.EventsHandler
+
+    @inlineCallbacks
+    def setUp(self):
+        yield helpers.TestHandlerWithPopulatedDB.setUp(self)
+        yield self.perform_full_submission_actions()
+        yield Delivery().run()
+
+    @inlineCallbacks
+    def test_get(self):
+        rtip_desc = (yield self.get_rtips())[0]
+
+        handler = self.request(role='receiver', user_id=rtip_desc['receiver_id'])
+        finished = handler.get()
+        self.assertEqual(events.EventsHub.count(1), 1)
+        self.assertTrue(handler.request.written[0].startswith(b'retry: '))
+
+        yield rtip.create_comment(1, rtip_desc['receiver_id'], rtip_desc['id'], 'comment')
+        yield deferred_sleep(0.1)
+
+        self.assertIn(b'data: {"type":"comment","tip_id":"%s"}\n\n' % rtip_desc['id'].encode(),
+                      handler.request.written)
+
+        stream = events.EventsHub.streams[1][handler.current_user.id]
+
+        stream.send_heartbeat()
+        self.assertEqual(handler.request.written[-1], b': heartbeat\n\n')
+
+        # The stream is closed at the first heartbeat following the expiration of the session
+        Sessions.delete(handler.current_user.id)
+        stream.send_heartbeat()
+
+        yield finished
+        self.assertEqual(events.EventsHub.count(1), 0)
+
+    def test_get_connections_limit(self):
+        self.patch(Settings, 'events_connections_limit', 0)
+
+        handler = self.request(role='receiver')
+        self.assertRaises(errors.TooManyConnections, handler.get)
@@ -1,7 +1,10 @@
 # -*- coding: utf-8 -*-
+import zipfile
+from io import BytesIO
 
 from globaleaks.handlers import export
 from globaleaks.jobs.delivery import Delivery
+from globaleaks.rest import errors
 from globaleaks.tests import helpers
 from twisted.internet.defer import inlineCallbacks
 
@@ -32,3 +35,44 @@ class TestExportHandler(helpers.TestHandlerWithPopulatedDB):
 
         yield handler.get(rtips_desc[0]['id'])
         self.assertNotEqual(handler.request.getResponseBody(), b'')
+
+
+class TestTipsExportHandler(helpers.TestHandlerWithPopulatedDB):
+    _handler = export.TipsExportHandler
+
+    @inlineCallbacks
+    def setUp(self):
+        yield helpers.TestHandlerWithPopulatedDB.setUp(self)
+
+        for _ in range(2):
+            yield self.perform_full_submission_actions()
+
+        yield Delivery().run()
+
+    @inlineCallbacks
+    def test_post(self):
+        rtips_desc = yield self.get_rtips()
+        rtips_desc = [x for x in rtips_desc if x['receiver_id'] == self.dummyReceiver_1['id']]
+
+        handler = self.request({'rtips': [x['id'] for x in rtips_desc]},
+                               user_id=self.dummyReceiver_1['id'], role='receiver')
+
+        yield handler.post()
+
+        with zipfile.ZipFile(BytesIO(handler.request.getResponseBody())) as archive:
+            self.assertIsNone(archive.testzip())
+            names = archive.namelist()
+
+        for rtip_desc in rtips_desc:
+            prefix = 'submission-%d/' % rtip_desc['progressive']
+            self.assertIn(prefix + 'data.txt', names)
+            self.assertTrue(any(x.startswith(prefix + 'files/') for x in names))
+
+    @inlineCallbacks
+    def test_post_unaccessible_tip(self):
+        rtips_desc = yield self.get_rtips()
+
+        handler = self.request({'rtips': [x['id'] for x in rtips_desc]},
+                               user_id=self.dummyReceiver_1['id'], role='receiver')
+
+        yield self.assertFailure(handler.post(), errors.ModelNotFound)
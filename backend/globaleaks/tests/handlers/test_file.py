@@ -1,9 +1,15 @@
 # -*- coding: utf-8 -*-
-from globaleaks.handlers import file
+import base64
+import calendar
+import gzip
+
+from globaleaks.handlers import file, public
 from globaleaks.handlers.admin import file as admin_file
+from globaleaks.orm import tw
 from globaleaks.rest import errors
 from globaleaks.tests import helpers
 from twisted.internet.defer import inlineCallbacks
+from twisted.web.http import datetimeToString
 
 
 class TestFileInstance(helpers.TestHandler):
@@ -23,3 +29,88 @@ class TestFileInstance(helpers.TestHandler):
         x = yield handler.get(u'upload.raw')
 
         self.assertIsNone(x)
+
+
+class TestImgHandler(helpers.TestHandler):
+    _handler = file.ImgHandler
+
+    @inlineCallbacks
+    def test_get(self):
+        self._handler = admin_file.FileInstance
+        handler = self.request({}, role='admin')
+        yield handler.post('logo')
+
+        node = yield tw(public.db_serialize_node, 1, 'en')
+
+        self._handler = file.ImgHandler
+        handler = self.request()
+        x = yield handler.get('files', 'logo', node['logo'])
+        self.assertEqual(x, base64.b64decode(helpers.VALID_BASE64_IMG))
+        self.assertEqual(handler.request.responseHeaders.getRawHeaders(b'ETag'), [('"%s"' % node['logo']).encode()])
+        self.assertIn(b'immutable', handler.request.responseHeaders.getRawHeaders(b'Cache-control')[0])
+        self.assertEqual(handler.request.responseHeaders.getRawHeaders(b'Content-Type'), [b'image/png'])
+
+        handler = self.request(headers={'if-none-match': ('"%s"' % node['logo']).encode()})
+        x = yield handler.get('files', 'logo', node['logo'])
+        self.assertIsNone(x)
+        self.assertEqual(handler.request.responseCode, 304)
+
+        handler = self.request()
+        yield self.assertFailure(handler.get('files', 'logo', 'a' * 64), errors.ResourceNotFound)
+
+    def test_get_image_type(self):
+        self.assertEqual(file.get_image_type(base64.b64decode(helpers.VALID_BASE64_IMG)), 'png')
+        self.assertEqual(file.get_image_type(b'\xff\xd8\xff\xe0\x00\x10JFIF'), 'jpeg')
+        self.assertEqual(file.get_image_type(b'GIF89a\x01\x00'), 'gif')
+        self.assertEqual(file.get_image_type(b'<svg/>'), 'png')
+
+
+class TestFileHandlerCache(helpers.TestHandler):
+    _handler = file.FileHandler
+
+    @inlineCallbacks
+    def test_get(self):
+        yield tw(admin_file.db_add_file, 1, 'css', '', base64.b64encode(b'body {}').decode())
+
+        handler = self.request()
+        x = yield handler.get('css')
+        self.assertEqual(x, b'body {}')
+
+        etag = handler.request.responseHeaders.getRawHeaders(b'ETag')[0]
+        last_modified = handler.request.responseHeaders.getRawHeaders(b'Last-Modified')[0]
+
+        # The Last-Modified date is the date of the update of the file
+        _, date = yield tw(admin_file.db_get_file_and_date, 1, 'css')
+        self.assertEqual(last_modified, datetimeToString(calendar.timegm(date.utctimetuple())))
+
+        handler = self.request(headers={'accept-encoding': b'gzip, deflate'})
+        x = yield handler.get('css')
+        self.assertEqual(gzip.decompress(x), b'body {}')
+        self.assertEqual(handler.request.responseHeaders.getRawHeaders(b'Content-encoding'), [b'gzip'])
+
+        # The gzip representation has its own entity tag
+        etag_gzip = handler.request.responseHeaders.getRawHeaders(b'ETag')[0]
+        self.assertEqual(etag_gzip, etag[:-1] + b'-gz"')
+
+        handler = self.request(headers={'if-none-match': etag_gzip})
+        x = yield handler.get('css')
+        self.assertEqual(x, b'body {}')
+
+        handler = self.request(headers={'if-none-match': etag})
+        x = yield handler.get('css')
+        self.assertIsNone(x)
+        self.assertEqual(handler.request.responseCode, 304)
+
+        handler = self.request(headers={'if-modified-since': last_modified})
+        x = yield handler.get('css')
+        self.assertIsNone(x)
+        self.assertEqual(handler.request.responseCode, 304)
+
+        self._handler = admin_file.FileInstance
+        handler = self.request({}, role='admin')
+        yield handler.delete('css')
+
+        self._handler = file.FileHandler
+        handler = self.request(headers={'if-none-match': etag})
+        x = yield handler.get('css')
+        self.assertEqual(x, b'')
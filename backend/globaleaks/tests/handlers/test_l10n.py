@@ -1,4 +1,7 @@
 # -*- coding: utf-8 -*-
+import gzip
+import json
+
 from globaleaks.handlers import l10n
 from globaleaks.handlers.admin import l10n as admin_l10n
 from globaleaks.rest import errors
@@ -17,11 +20,11 @@ class TestL10NHandler(helpers.TestHandler):
     def test_get(self):
         handler = self.request()
         response = yield handler.get(u'unexistent')
-        self.assertEqual(response, {})
+        self.assertEqual(json.loads(response), {})
 
         handler = self.request()
         response = yield handler.get(lang=u'en')
-        self.assertNotIn('12345', response)
+        self.assertNotIn('12345', json.loads(response))
 
         self._handler = admin_l10n.AdminL10NHandler
         handler = self.request(custom_texts, role='admin')
@@ -30,5 +33,32 @@ class TestL10NHandler(helpers.TestHandler):
         self._handler = l10n.L10NHandler
         handler = self.request()
         response = yield handler.get(lang=u'en')
+        response = json.loads(response)
         self.assertIn('12345', response)
         self.assertEqual('54321', response['12345'])
+
+    @inlineCallbacks
+    def test_get_cached(self):
+        handler = self.request()
+        response = yield handler.get(lang=u'en')
+        etag = handler.request.responseHeaders.getRawHeaders(b'ETag')[0]
+
+        handler = self.request(headers={'accept-encoding': b'gzip'})
+        response_gzip = yield handler.get(lang=u'en')
+        self.assertEqual(gzip.decompress(response_gzip), response)
+        self.assertEqual(handler.request.responseHeaders.getRawHeaders(b'ETag')[0], etag[:-1] + b'-gz"')
+
+        handler = self.request(headers={'if-none-match': etag})
+        response = yield handler.get(lang=u'en')
+        self.assertEqual(handler.request.responseCode, 304)
+        self.assertIsNone(response)
+
+        self._handler = admin_l10n.AdminL10NHandler
+        handler = self.request(custom_texts, role='admin')
+        yield handler.put(lang=u'en')
+
+        self._handler = l10n.L10NHandler
+        handler = self.request(headers={'if-none-match': etag})
+        response = yield handler.get(lang=u'en')
+        self.assertNotEqual(handler.request.responseCode, 304)
+        self.assertEqual(json.loads(response)['12345'], '54321')
@@ -1,10 +1,15 @@
 # -*- coding: utf-8 -*-
 import json
 
+from globaleaks import models
 from globaleaks.handlers import public
+from globaleaks.handlers.admin.questionnaire import db_create_questionnaire, db_get_questionnaire
+from globaleaks.handlers.admin.step import create_step
+from globaleaks.models import get_localized_values
+from globaleaks.orm import transact, tw
 from globaleaks.rest import requests
 from globaleaks.tests import helpers
-from twisted.internet.defer import inlineCallbacks
+from twisted.internet.defer import inlineCallbacks, returnValue
 
 
 class TestPublicResource(helpers.TestHandlerWithPopulatedDB):
@@ -16,3 +21,198 @@ class TestPublicResource(helpers.TestHandlerWithPopulatedDB):
         response = yield handler.get()
 
         self._handler.validate_message(json.dumps(response), requests.PublicResourcesDesc)
+
+
+def serialize_field_unprefetched(session, tid, field, language, serialize_templates=True):
+    """
+    Serialization of a field loading each referenced object with its own queries
+    """
+    f_to_serialize = field
+    if field.template_override_id is not None and serialize_templates is True:
+        f_to_serialize = session.query(models.Field).filter(models.Field.id == field.template_override_id).one()
+    elif field.template_id is not None and serialize_templates is True:
+        f_to_serialize = session.query(models.Field).filter(models.Field.id == field.template_id).one()
+
+    attrs_field_id = field.id
+    if field.template_id is not None and field.template_id not in public.special_fields:
+        attrs_field_id = field.template_id
+
+    attrs = {}
+    for attr in session.query(models.FieldAttr).filter(models.FieldAttr.field_id == attrs_field_id):
+        attrs[attr.name] = public.serialize_field_attr(attr, language)
+
+    children = [serialize_field_unprefetched(session, tid, f, language)
+                for f in session.query(models.Field).filter(models.Field.fieldgroup_id == f_to_serialize.id)]
+    children.sort(key=lambda f: (f['y'], f['x']))
+
+    options = session.query(models.FieldOption) \
+                     .filter(models.FieldOption.field_id == f_to_serialize.id) \
+                     .order_by(models.FieldOption.order)
+
+    ret_dict = {
+        'id': field.id,
+        'instance': field.instance,
+        'editable': field.editable and field.tid == tid,
+        'type': f_to_serialize.type,
+        'template_id': field.template_id if field.template_id else '',
+        'template_override_id': field.template_override_id if field.template_override_id else '',
+        'step_id': field.step_id if field.step_id else '',
+        'fieldgroup_id': field.fieldgroup_id if field.fieldgroup_id else '',
+        'multi_entry': f_to_serialize.multi_entry,
+        'required': field.required,
+        'preview': field.preview,
+        'encrypt': field.encrypt,
+        'attrs': attrs,
+        'x': field.x,
+        'y': field.y,
+        'width': field.width,
+        'triggered_by_score': field.triggered_by_score,
+        'triggered_by_options': get_triggers_unprefetched(session, 'field', field.id),
+        'options': [public.serialize_field_option(o, language) for o in options],
+        'children': children
+    }
+
+    return get_localized_values(ret_dict, field, field.localized_keys, language)
+
+
+def get_triggers_unprefetched(session, type, object_id):
+    m = public.trigger_map[type]
+
+    return [{'field': x[0], 'option': x[1], 'sufficient': x[2]}
+            for x in session.query(models.FieldOption.field_id, models.FieldOption.id, m.sufficient)
+                            .filter(models.FieldOption.id == m.option_id, m.object_id == object_id)]
+
+
+@transact
+def serialize_questionnaires_unprefetched(session, tid, language):
+    """
+    Serialization of the questionnaires of a tenant loading each step and field with its own queries
+    """
+    ret = []
+
+    for questionnaire in session.query(models.Questionnaire).filter(models.Questionnaire.tid.in_({1, tid})):
+        steps = []
+        for step in session.query(models.Step) \
+                           .filter(models.Step.questionnaire_id == questionnaire.id) \
+                           .order_by(models.Step.order):
+            children = [serialize_field_unprefetched(session, tid, f, language)
+                        for f in session.query(models.Field).filter(models.Field.step_id == step.id)]
+            children.sort(key=lambda f: (f['y'], f['x']))
+
+            step_dict = {
+                'id': step.id,
+                'questionnaire_id': step.questionnaire_id,
+                'order': step.order,
+                'triggered_by_score': step.triggered_by_score,
+                'triggered_by_options': get_triggers_unprefetched(session, 'step', step.id),
+                'children': children
+            }
+
+            steps.append(get_localized_values(step_dict, step, step.localized_keys, language))
+
+        ret_dict = {
+            'id': questionnaire.id,
+            'editable': questionnaire.editable and questionnaire.tid == tid,
+            'name': questionnaire.name,
+            'steps': steps
+        }
+
+        ret.append(get_localized_values(ret_dict, questionnaire, questionnaire.localized_keys, language))
+
+    return ret
+
+
+@transact
+def serialize_questionnaires_prefetched(session, tid, language):
+    questionnaires = session.query(models.Questionnaire).filter(models.Questionnaire.tid.in_({1, tid}))
+
+    return public.db_serialize_questionnaires(session, tid, questionnaires, language)
+
+
+class TestQuestionnairesSerialization(helpers.TestGLWithPopulatedDB):
+    complex_field_population = True
+
+    def setUp(self):
+        self.counter = helpers.QueryCounter(self)
+
+        return helpers.TestGLWithPopulatedDB.setUp(self)
+
+    @inlineCallbacks
+    def get_questionnaires(self):
+        self.counter.queries = 0
+        questionnaires = yield tw(public.db_get_questionnaires, 1, 'en')
+        returnValue((questionnaires, self.counter.queries))
+
+    @inlineCallbacks
+    def test_queries_do_not_depend_on_questionnaire_size(self):
+        public.QuestionnaireCache.invalidate()
+        questionnaires, queries_before = yield self.get_questionnaires()
+
+        for i in range(3):
+            step = helpers.get_dummy_step()
+            step['questionnaire_id'] = 'default'
+            step['children'] = [helpers.get_dummy_field() for _ in range(3)]
+            for field in step['children']:
+                field['instance'] = 'instance'
+                for option in field['options']:
+                    option['id'] = ''
+                field['children'] = [helpers.get_dummy_field()]
+                field['children'][0]['instance'] = 'instance'
+                field['children'][0]['options'] = []
+
+            yield create_step(1, step, 'en')
+
+        public.QuestionnaireCache.invalidate()
+        questionnaires, queries_after = yield self.get_questionnaires()
+
+        self.assertEqual(queries_before, queries_after)
+
+        steps = [s for q in questionnaires if q['id'] == 'default' for s in q['steps']]
+        self.assertEqual(len([s for s in steps if s['label'] == 'Step 1']), 3)
+        for s in steps:
+            if s['label'] == 'Step 1':
+                self.assertEqual(len(s['children']), 3)
+                for f in s['children']:
+                    self.assertEqual(len(f['options']), 2)
+                    self.assertEqual(len(f['children']), 1)
+
+    @inlineCallbacks
+    def test_memoization_follows_questionnaire_revision(self):
+        public.QuestionnaireCache.invalidate()
+        questionnaires1, queries_miss = yield self.get_questionnaires()
+        questionnaires2, queries_hit = yield self.get_questionnaires()
+
+        self.assertEqual(questionnaires1, questionnaires2)
+        self.assertLess(queries_hit, queries_miss)
+
+        step = helpers.get_dummy_step()
+        step['questionnaire_id'] = 'default'
+        step = yield create_step(1, step, 'en')
+
+        questionnaires3, _ = yield self.get_questionnaires()
+
+        steps = [s['id'] for q in questionnaires3 if q['id'] == 'default' for s in q['steps']]
+        self.assertIn(step['id'], steps)
+
+    @inlineCallbacks
+    def test_matches_unprefetched_serialization(self):
+        public.QuestionnaireCache.invalidate()
+
+        expected = yield serialize_questionnaires_unprefetched(1, 'en')
+        questionnaires = yield serialize_questionnaires_prefetched(1, 'en')
+
+        self.assertTrue(any(q['steps'] for q in expected))
+        self.assertEqual(questionnaires, expected)
+
+    @inlineCallbacks
+    def test_memoization_follows_questionnaire_reimport(self):
+        for label in ['Step 1', 'Step 2']:
+            step = helpers.get_dummy_step()
+            step['label'] = label
+
+            yield tw(db_create_questionnaire, 1, {'id': 'imported', 'name': 'imported', 'steps': [step]}, 'en')
+
+            questionnaire = yield tw(db_get_questionnaire, 1, 'imported', 'en')
+            self.assertEqual([s['label'] for s in questionnaire['steps']], [label])
+
+            yield models.delete(models.Questionnaire, models.Questionnaire.id == 'imported')
@@ -4,7 +4,11 @@ from twisted.internet.defer import inlineCallbacks
 from globaleaks import models
 from globaleaks.handlers import receiver
 from globaleaks.handlers.admin import user
-from globaleaks.orm import transact
+from globaleaks.handlers.submission import ArchivedSchemaCache
+from globaleaks.jobs.tips_operations import TipsOperations
+from globaleaks.orm import transact, tw
+from globaleaks.rest import errors
+from globaleaks.settings import Settings
 from globaleaks.tests import helpers
 from globaleaks.utils.utility import datetime_never
 
@@ -31,6 +35,62 @@ class TestTipsCollection(helpers.TestHandlerWithPopulatedDB):
             self.assertEqual(ret[idx]['comment_count'], 3)
             self.assertEqual(ret[idx]['message_count'], 2)
 
+    @inlineCallbacks
+    def test_get_reuses_localized_schemas(self):
+        ArchivedSchemaCache.invalidate()
+
+        handler = self.request(user_id=self.dummyReceiver_1['id'], role='receiver')
+        ret1 = yield handler.get()
+
+        stats = ArchivedSchemaCache.stats()
+        self.assertEqual(stats['hits'], 0)
+        self.assertEqual(stats['misses'], stats['entries'])
+        self.assertGreater(stats['size'], 0)
+
+        handler = self.request(user_id=self.dummyReceiver_1['id'], role='receiver')
+        ret2 = yield handler.get()
+
+        self.assertEqual([x['preview_schema'] for x in ret1], [x['preview_schema'] for x in ret2])
+        self.assertEqual(ArchivedSchemaCache.stats()['hits'], stats['misses'])
+
+    @inlineCallbacks
+    def test_get_paginated(self):
+        yield self.perform_full_submission_actions()
+
+        handler = self.request(user_id=self.dummyReceiver_1['id'], role='receiver')
+        handler.request.args = {b'sort': [b'progressive'], b'order': [b'desc']}
+        ret = yield handler.get()
+        total = int(handler.request.responseHeaders.getRawHeaders(b'X-Total-Count')[0])
+        self.assertEqual(total, len(ret))
+        self.assertEqual([x['progressive'] for x in ret], sorted([x['progressive'] for x in ret], reverse=True))
+
+        handler = self.request(user_id=self.dummyReceiver_1['id'], role='receiver')
+        handler.request.args = {b'sort': [b'progressive'], b'order': [b'desc'], b'offset': [b'1'], b'limit': [b'1']}
+        page = yield handler.get()
+        self.assertEqual([x['id'] for x in page], [ret[1]['id']])
+        self.assertEqual(int(handler.request.responseHeaders.getRawHeaders(b'X-Total-Count')[0]), total)
+
+        handler = self.request(user_id=self.dummyReceiver_1['id'], role='receiver')
+        handler.request.args = {b'context_id': [ret[0]['context_id'].encode()]}
+        filtered = yield handler.get()
+        self.assertEqual(len(filtered), len([x for x in ret if x['context_id'] == ret[0]['context_id']]))
+
+        handler = self.request(user_id=self.dummyReceiver_1['id'], role='receiver')
+        handler.request.args = {b'sort': [b'unexistent']}
+        yield self.assertFailure(handler.get(), errors.InputValidationError)
+
+    @inlineCallbacks
+    def test_get_preview_cache(self):
+        preview_cache = {}
+        ret1 = yield tw(receiver.db_get_receivertips, 1, self.dummyReceiver_1['id'], helpers.USER_PRV_KEY, 'en', None, preview_cache)
+        self.assertEqual(len(preview_cache), len(ret1[0]))
+
+        for rtip_id in preview_cache:
+            preview_cache[rtip_id] = (preview_cache[rtip_id][0], 'cached')
+
+        ret2 = yield tw(receiver.db_get_receivertips, 1, self.dummyReceiver_1['id'], helpers.USER_PRV_KEY, 'en', None, preview_cache)
+        self.assertEqual([x['preview'] for x in ret2[0]], ['cached'] * len(ret2[0]))
+
 
 class TestTipsOperations(helpers.TestHandlerWithPopulatedDB):
     _handler = receiver.TipsOperations
@@ -86,3 +146,41 @@ class TestTipsOperations(helpers.TestHandlerWithPopulatedDB):
         rtips = yield receiver.get_receivertips(1, self.dummyReceiver_1['id'], helpers.USER_PRV_KEY, 'en')
 
         self.assertEqual(len(rtips), 0)
+
+    @inlineCallbacks
+    def test_put_delete_in_background(self):
+        self.patch(Settings, 'tips_operations_chunk_size', 1)
+
+        for _ in range(3):
+            yield self.perform_full_submission_actions()
+
+        rtips = yield receiver.get_receivertips(1, self.dummyReceiver_1['id'], helpers.USER_PRV_KEY, 'en')
+        rtips_ids = [rtip['id'] for rtip in rtips]
+
+        data_request = {
+            'operation': 'delete',
+            'rtips': rtips_ids
+        }
+
+        handler = self.request(data_request, user_id=self.dummyReceiver_1['id'], role='receiver')
+        operation = yield handler.put()
+        self.assertEqual(operation['total'], len(rtips_ids))
+        self.assertEqual(operation['done'], 1)
+        self.assertFalse(operation['completed'])
+
+        rtips = yield receiver.get_receivertips(1, self.dummyReceiver_1['id'], helpers.USER_PRV_KEY, 'en')
+        self.assertEqual(len(rtips), len(rtips_ids) - 1)
+
+        yield TipsOperations().run()
+
+        self._handler = receiver.TipsOperationInstance
+        handler = self.request(user_id=self.dummyReceiver_1['id'], role='receiver')
+        operation = yield handler.get(operation['id'])
+        self.assertEqual(operation['done'], len(rtips_ids))
+        self.assertTrue(operation['completed'])
+
+        rtips = yield receiver.get_receivertips(1, self.dummyReceiver_1['id'], helpers.USER_PRV_KEY, 'en')
+        self.assertEqual(len(rtips), 0)
+
+        handler = self.request(user_id=self.dummyReceiver_2['id'], role='receiver')
+        yield self.assertFailure(handler.get(operation['id']), errors.ResourceNotFound)
@@ -4,12 +4,34 @@ from twisted.internet.defer import inlineCallbacks
 from globaleaks import models
 from globaleaks.handlers import rtip
 from globaleaks.jobs.delivery import Delivery
+from globaleaks.orm import transact, tw
 from globaleaks.rest import errors
 from globaleaks.state import State
 from globaleaks.tests import helpers
 from globaleaks.utils.utility import datetime_now, ISO8601_to_datetime
 
 
+def get_access_counter(session, rtip_id):
+    return session.query(models.ReceiverTip.access_counter).filter(models.ReceiverTip.id == rtip_id).one()[0]
+
+
+@transact
+def serialize_rtip_lists(session, rtip_id, prefetch):
+    receivertip, itip = session.query(models.ReceiverTip, models.InternalTip) \
+                               .filter(models.ReceiverTip.id == rtip_id,
+                                       models.InternalTip.id == models.ReceiverTip.internaltip_id).one()
+
+    data = rtip.db_prepare_tip_serialization(session, itip, receivertip) if prefetch else None
+
+    return {
+        'comments': rtip.db_get_itip_comment_list(session, itip.id, data),
+        'messages': rtip.db_get_itip_message_list(session, receivertip.id, data),
+        'rfiles': rtip.db_receiver_get_rfile_list(session, receivertip.id, data),
+        'wbfiles': rtip.db_receiver_get_wbfile_list(session, itip.id, data),
+        'iars': rtip.db_get_rtip_identityaccessrequest_list(session, receivertip.id, data)
+    }
+
+
 class TestRTipInstance(helpers.TestHandlerWithPopulatedDB):
     _handler = rtip.RTipInstance
 
@@ -26,6 +48,104 @@ class TestRTipInstance(helpers.TestHandlerWithPopulatedDB):
             handler = self.request(role='receiver', user_id=rtip_desc['receiver_id'])
             yield handler.get(rtip_desc['id'])
 
+    @inlineCallbacks
+    def test_get_delta(self):
+        rtip_desc = (yield self.get_rtips())[0]
+
+        handler = self.request(role='receiver', user_id=rtip_desc['receiver_id'])
+        tip = yield handler.get(rtip_desc['id'])
+        access_counter = yield tw(get_access_counter, rtip_desc['id'])
+
+        handler = self.request(role='receiver', user_id=rtip_desc['receiver_id'])
+        handler.request.args = {b'since': [str(tip['cursor']).encode()]}
+        delta = yield handler.get(rtip_desc['id'])
+        self.assertNotIn('questionnaires', delta)
+        self.assertEqual(delta['status'], tip['status'])
+        self.assertEqual(delta['comments'], [])
+        self.assertEqual(delta['messages'], [])
+        self.assertEqual(len(delta['rfiles']), len(tip['rfiles']))
+
+        comment = yield rtip.create_comment(1, rtip_desc['receiver_id'], rtip_desc['id'], 'comment')
+
+        handler = self.request(role='receiver', user_id=rtip_desc['receiver_id'])
+        handler.request.args = {b'since': [str(tip['cursor']).encode()]}
+        delta = yield handler.get(rtip_desc['id'])
+        self.assertEqual([x['id'] for x in delta['comments']], [comment['id']])
+        self.assertEqual(delta['cursor'], tip['cursor'] + 1)
+
+        # The wbfiles are returned in full so that the deletions are propagated
+        wbfile = yield rtip.register_wbfile_on_db(1, rtip_desc['id'], {
+            'name': 'name', 'description': 'description', 'type': 'text/plain', 'size': 1, 'filename': 'wbfile'
+        })
+
+        handler = self.request(role='receiver', user_id=rtip_desc['receiver_id'])
+        handler.request.args = {b'since': [str(delta['cursor']).encode()]}
+        delta = yield handler.get(rtip_desc['id'])
+        self.assertIn(wbfile['id'], [x['id'] for x in delta['wbfiles']])
+
+        yield rtip.delete_wbfile(1, rtip_desc['receiver_id'], wbfile['id'])
+
+        handler = self.request(role='receiver', user_id=rtip_desc['receiver_id'])
+        handler.request.args = {b'since': [str(delta['cursor']).encode()]}
+        delta = yield handler.get(rtip_desc['id'])
+        self.assertNotIn(wbfile['id'], [x['id'] for x in delta['wbfiles']])
+
+        # The polling of the changes is not accounted as an access
+        self.assertEqual((yield tw(get_access_counter, rtip_desc['id'])), access_counter)
+
+        handler = self.request(role='receiver', user_id=rtip_desc['receiver_id'])
+        handler.request.args = {b'since': [b'invalid']}
+        yield self.assertFailure(handler.get(rtip_desc['id']), errors.InputValidationError)
+
+        handler = self.request(role='receiver', user_id=rtip_desc['receiver_id'])
+        handler.request.args = {b'since': [b'-1']}
+        yield self.assertFailure(handler.get(rtip_desc['id']), errors.InputValidationError)
+
+    @inlineCallbacks
+    def get_rtip_queries(self, rtip_desc):
+        handler = self.request(role='receiver', user_id=rtip_desc['receiver_id'])
+        self.counter.queries = 0
+        response = yield handler.get(rtip_desc['id'])
+        return self.counter.queries, response
+
+    @inlineCallbacks
+    def test_get_constant_queries(self):
+        self.counter = helpers.QueryCounter(self)
+
+        rtip_desc = (yield self.get_rtips())[0]
+
+        yield self.get_rtip_queries(rtip_desc)
+        queries, response = yield self.get_rtip_queries(rtip_desc)
+
+        for i in range(3):
+            yield rtip.create_comment(1, rtip_desc['receiver_id'], rtip_desc['id'], 'comment')
+            yield rtip.create_message(1, rtip_desc['receiver_id'], rtip_desc['id'], 'message')
+
+        queries_after, response_after = yield self.get_rtip_queries(rtip_desc)
+
+        self.assertEqual(queries_after, queries)
+        self.assertEqual(len(response_after['comments']), len(response['comments']) + 3)
+        self.assertEqual(len(response_after['messages']), len(response['messages']) + 3)
+
+    @inlineCallbacks
+    def test_get_matches_unprefetched_serialization(self):
+        rtip_desc = (yield self.get_rtips())[0]
+
+        yield rtip.register_wbfile_on_db(1, rtip_desc['id'], {
+            'name': 'name', 'description': 'description', 'type': 'text/plain', 'size': 1, 'filename': 'wbfile'
+        })
+
+        yield rtip.create_identityaccessrequest(1, rtip_desc['receiver_id'], rtip_desc['id'],
+                                                {'request_motivation': 'motivation'})
+
+        expected = yield serialize_rtip_lists(rtip_desc['id'], False)
+        lists = yield serialize_rtip_lists(rtip_desc['id'], True)
+
+        for key in expected:
+            self.assertTrue(expected[key], key)
+            self.assertEqual(sorted(lists[key], key=lambda x: x['id']),
+                             sorted(expected[key], key=lambda x: x['id']))
+
     @inlineCallbacks
     def test_put_postpone(self):
         now = datetime_now()
@@ -258,6 +378,30 @@ class TestReceiverFileDownload(helpers.TestHandlerWithPopulatedDB):
                 yield handler.get(rfile_desc['id'])
                 self.assertNotEqual(handler.request.getResponseBody(), '')
 
+    @inlineCallbacks
+    def test_get_range(self):
+        yield self.perform_minimal_submission()
+        yield Delivery().run()
+
+        rtip_desc = (yield self.get_rtips())[0]
+        rfile_desc = (yield self.get_rfiles(rtip_desc['id']))[0]
+
+        handler = self.request(role='receiver', user_id=rtip_desc['receiver_id'])
+        yield handler.get(rfile_desc['id'])
+        content = handler.request.getResponseBody()
+
+        handler = self.request(role='receiver', user_id=rtip_desc['receiver_id'],
+                               headers={'range': b'bytes=2-5'})
+        yield handler.get(rfile_desc['id'])
+        self.assertEqual(handler.request.responseCode, 206)
+        self.assertEqual(handler.request.responseHeaders.getRawHeaders(b'Content-Range')[0],
+                         b'bytes 2-5/%d' % len(content))
+        self.assertEqual(handler.request.getResponseBody(), content[2:6])
+
+        handler = self.request(role='receiver', user_id=rtip_desc['receiver_id'],
+                               headers={'range': b'bytes=%d-' % len(content)})
+        yield self.assertFailure(handler.get(rfile_desc['id']), errors.RangeNotSatisfiable)
+
 
 class TestIdentityAccessRequestsCollection(helpers.TestHandlerWithPopulatedDB):
     _handler = rtip.IdentityAccessRequestsCollection
@@ -1,7 +1,9 @@
 # -*- coding: utf-8 -*-
+import os
+
 from twisted.internet.defer import inlineCallbacks
 
-from globaleaks.handlers.staticfile import StaticFileHandler
+from globaleaks.handlers.staticfile import StaticFileHandler, StaticFileIndex
 from globaleaks.rest import errors
 from globaleaks.settings import Settings
 from globaleaks.tests import helpers
@@ -22,3 +24,44 @@ class TestStaticFileHandler(helpers.TestHandler):
         handler = self.request(kwargs={'path': Settings.client_path})
 
         return self.assertRaises(errors.ResourceNotFound, handler.get, 'unexistent')
+
+    @inlineCallbacks
+    def test_get_conditional(self):
+        handler = self.request(kwargs={'path': Settings.client_path})
+        yield handler.get('license.txt')
+        etag = handler.request.responseHeaders.getRawHeaders(b'ETag')[0]
+        self.assertEqual(handler.request.responseHeaders.getRawHeaders(b'Cache-control')[0], b'no-cache')
+
+        handler = self.request(kwargs={'path': Settings.client_path}, headers={'if-none-match': etag})
+        yield handler.get('license.txt')
+        self.assertEqual(handler.request.responseCode, 304)
+
+    @inlineCallbacks
+    def test_get_range(self):
+        handler = self.request(kwargs={'path': Settings.client_path}, headers={'range': b'bytes=2-5'})
+        yield handler.get('index.html')
+        self.assertEqual(handler.request.responseCode, 206)
+        self.assertEqual(handler.request.getResponseBody(), b'doct')
+
+        handler = self.request(kwargs={'path': Settings.client_path}, headers={'range': b'bytes=100000000-'})
+        self.assertRaises(errors.RangeNotSatisfiable, handler.get, 'index.html')
+
+    @inlineCallbacks
+    def test_get_hashed_and_precompressed(self):
+        path = os.path.join(Settings.working_path, 'client')
+        os.makedirs(os.path.join(path, 'js'))
+        for filename in ['scripts.0123456789abcdef.js', 'scripts.0123456789abcdef.js.gz']:
+            with open(os.path.join(path, 'js', filename), 'wb') as f:
+                f.write(filename.encode())
+
+        StaticFileIndex.load(path)
+
+        handler = self.request(kwargs={'path': path}, headers={'accept-encoding': b'gzip'})
+        yield handler.get('js/scripts.0123456789abcdef.js')
+        self.assertEqual(handler.request.getResponseBody(), b'scripts.0123456789abcdef.js.gz')
+        self.assertEqual(handler.request.responseHeaders.getRawHeaders(b'Content-encoding')[0], b'gzip')
+        self.assertIn(b'immutable', handler.request.responseHeaders.getRawHeaders(b'Cache-control')[0])
+
+        handler = self.request(kwargs={'path': path})
+        yield handler.get('js/scripts.0123456789abcdef.js')
+        self.assertEqual(handler.request.getResponseBody(), b'scripts.0123456789abcdef.js')
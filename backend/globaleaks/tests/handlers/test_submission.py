@@ -1,11 +1,17 @@
 # -*- coding: utf-8 -*-
+import json
+
 from twisted.internet.defer import inlineCallbacks, returnValue
 
+from globaleaks import models
 from globaleaks.handlers import authentication, wbtip
-from globaleaks.handlers.submission import SubmissionInstance
+from globaleaks.handlers.admin.questionnaire import db_create_questionnaire
+from globaleaks.handlers.admin.step import create_step
+from globaleaks.handlers.submission import SubmissionInstance, ArchivedSchemaCache, QuestionnaireSnapshotCache, \
+    db_get_questionnaire_snapshot
 from globaleaks.jobs import delivery
 from globaleaks.models.config import db_set_config_variable
-from globaleaks.orm import tw
+from globaleaks.orm import transact, tw
 from globaleaks.rest import errors
 from globaleaks.tests import helpers
 
@@ -125,6 +131,85 @@ class TestSubmissionTokenInteract(helpers.TestHandlerWithPopulatedDB):
         yield self.assertRaises(Exception, handler.put, token.id)
 
 
+class TestQuestionnaireSnapshot(helpers.TestHandlerWithPopulatedDB):
+    _handler = SubmissionInstance
+
+    @inlineCallbacks
+    def create_submission(self):
+        submission_desc = yield self.get_dummy_submission(self.dummyContext['id'])
+        handler = self.request(submission_desc)
+        yield handler.put(self.getSolvedToken().id)
+        returnValue(list(QuestionnaireSnapshotCache.memory_cache_dict.values()))
+
+    @inlineCallbacks
+    def test_snapshot_follows_questionnaire_revision(self):
+        QuestionnaireSnapshotCache.invalidate()
+
+        snapshots = yield self.create_submission()
+        self.assertEqual(len(snapshots), 1)
+        snapshot = snapshots[0]
+
+        snapshots = yield self.create_submission()
+        self.assertIs(snapshots[0], snapshot)
+        self.assertTrue(snapshot['archived'])
+
+        step = helpers.get_dummy_step()
+        step['questionnaire_id'] = self.dummyContext['questionnaire_id']
+        yield create_step(1, step, 'en')
+
+        snapshots = yield self.create_submission()
+        self.assertEqual(len(snapshots), 1)
+        self.assertNotEqual(snapshots[0]['hash'], snapshot['hash'])
+
+    @transact
+    def get_snapshot(self, session, questionnaire_id):
+        questionnaire = session.query(models.Questionnaire).filter(models.Questionnaire.id == questionnaire_id).one()
+        return db_get_questionnaire_snapshot(session, 1, questionnaire)
+
+    @inlineCallbacks
+    def test_snapshot_follows_questionnaire_reimport(self):
+        QuestionnaireSnapshotCache.invalidate()
+
+        hashes = set()
+        for label in ['Step 1', 'Step 2']:
+            step = helpers.get_dummy_step()
+            step['label'] = label
+
+            yield tw(db_create_questionnaire, 1, {'id': 'imported', 'name': 'imported', 'steps': [step]}, 'en')
+
+            snapshot = yield self.get_snapshot('imported')
+            self.assertEqual([s['label']['en'] for s in snapshot['schema']], [label])
+            hashes.add(snapshot['hash'])
+
+            yield models.delete(models.Questionnaire, models.Questionnaire.id == 'imported')
+
+        self.assertEqual(len(hashes), 2)
+
+
+class TestArchivedSchemaCache(helpers.TestGL):
+    def test_lru_eviction(self):
+        entry = {'steps': [], 'preview': ['x' * 100]}
+        size = len(json.dumps(entry))
+
+        self.patch(ArchivedSchemaCache, 'max_size', size * 2)
+
+        ArchivedSchemaCache.set('a', 'en', entry)
+        ArchivedSchemaCache.set('b', 'en', entry)
+        self.assertEqual(ArchivedSchemaCache.get('a', 'en'), entry)
+
+        ArchivedSchemaCache.set('c', 'en', entry)
+        self.assertIsNone(ArchivedSchemaCache.get('b', 'en'))
+        self.assertEqual(ArchivedSchemaCache.get('a', 'en'), entry)
+        self.assertEqual(ArchivedSchemaCache.get('c', 'en'), entry)
+
+        stats = ArchivedSchemaCache.stats()
+        self.assertEqual(stats['entries'], 2)
+        self.assertEqual(stats['size'], size * 2)
+        self.assertEqual(stats['hits'], 3)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hit_rate'], 0.75)
+
+
 class TestSubmissionEncryptedScenarioOneKeyExpired(TestSubmissionEncryptedScenario):
     encryption_scenario = 'ENCRYPTED_WITH_ONE_KEY_EXPIRED'
 
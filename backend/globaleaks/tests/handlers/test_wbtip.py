@@ -1,9 +1,25 @@
 # -*- coding: utf-8 -*-
-from globaleaks.handlers import wbtip
+from globaleaks import models
+from globaleaks.handlers import rtip, wbtip
+from globaleaks.orm import transact
 from globaleaks.tests import helpers
 from twisted.internet.defer import inlineCallbacks
 
 
+@transact
+def serialize_wbtip_lists(session, wbtip_id, prefetch):
+    itip = session.query(models.InternalTip).filter(models.InternalTip.id == wbtip_id).one()
+
+    data = rtip.db_prepare_tip_serialization(session, itip) if prefetch else None
+
+    return {
+        'comments': rtip.db_get_itip_comment_list(session, itip.id, data),
+        'messages': wbtip.db_get_itip_message_list(session, itip.id, data),
+        'rfiles': wbtip.db_get_rfile_list(session, itip.id, data),
+        'wbfiles': wbtip.db_get_wbfile_list(session, itip.id, data)
+    }
+
+
 class TestWBTipInstance(helpers.TestHandlerWithPopulatedDB):
     _handler = wbtip.WBTipInstance
 
@@ -20,6 +36,75 @@ class TestWBTipInstance(helpers.TestHandlerWithPopulatedDB):
 
             yield handler.get()
 
+    @inlineCallbacks
+    def test_get_delta(self):
+        wbtip_desc = (yield self.get_wbtips())[0]
+
+        handler = self.request(role='whistleblower', user_id=wbtip_desc['id'])
+        tip = yield handler.get()
+
+        handler = self.request(role='whistleblower', user_id=wbtip_desc['id'])
+        handler.request.args = {b'since': [str(tip['cursor']).encode()]}
+        delta = yield handler.get()
+        self.assertNotIn('questionnaires', delta)
+        self.assertEqual(delta['status'], tip['status'])
+        self.assertEqual(delta['comments'], [])
+        self.assertEqual(delta['messages'], [])
+        self.assertEqual(delta['rfiles'], [])
+
+        comment = yield wbtip.create_comment(1, wbtip_desc['id'], 'comment')
+
+        handler = self.request(role='whistleblower', user_id=wbtip_desc['id'])
+        handler.request.args = {b'since': [str(tip['cursor']).encode()]}
+        delta = yield handler.get()
+        self.assertEqual([x['id'] for x in delta['comments']], [comment['id']])
+        self.assertEqual(delta['cursor'], tip['cursor'] + 1)
+
+    @inlineCallbacks
+    def get_wbtip_queries(self, wbtip_desc):
+        handler = self.request(role='whistleblower', user_id=wbtip_desc['id'])
+        self.counter.queries = 0
+        response = yield handler.get()
+        return self.counter.queries, response
+
+    @inlineCallbacks
+    def test_get_constant_queries(self):
+        self.counter = helpers.QueryCounter(self)
+
+        wbtip_desc = (yield self.get_wbtips())[0]
+
+        yield self.get_wbtip_queries(wbtip_desc)
+        queries, response = yield self.get_wbtip_queries(wbtip_desc)
+
+        for i in range(3):
+            yield wbtip.create_comment(1, wbtip_desc['id'], 'comment')
+            for rcvr_id in wbtip_desc['receivers_ids']:
+                yield wbtip.create_message(1, wbtip_desc['id'], rcvr_id, 'message')
+
+        queries_after, response_after = yield self.get_wbtip_queries(wbtip_desc)
+
+        self.assertEqual(queries_after, queries)
+        self.assertEqual(len(response_after['comments']), len(response['comments']) + 3)
+        self.assertEqual(len(response_after['messages']),
+                         len(response['messages']) + 3 * len(wbtip_desc['receivers_ids']))
+
+    @inlineCallbacks
+    def test_get_matches_unprefetched_serialization(self):
+        wbtip_desc = (yield self.get_wbtips())[0]
+
+        rtip_desc = [x for x in (yield self.get_rtips()) if x['internaltip_id'] == wbtip_desc['id']][0]
+        yield rtip.register_wbfile_on_db(1, rtip_desc['id'], {
+            'name': 'name', 'description': 'description', 'type': 'text/plain', 'size': 1, 'filename': 'wbfile'
+        })
+
+        expected = yield serialize_wbtip_lists(wbtip_desc['id'], False)
+        lists = yield serialize_wbtip_lists(wbtip_desc['id'], True)
+
+        for key in expected:
+            self.assertTrue(expected[key], key)
+            self.assertEqual(sorted(lists[key], key=lambda x: x['id']),
+                             sorted(expected[key], key=lambda x: x['id']))
+
 
 class TestWBTipCommentCollection(helpers.TestHandlerWithPopulatedDB):
     _handler = wbtip.WBTipCommentCollection
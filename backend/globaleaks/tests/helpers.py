@@ -12,6 +12,8 @@ from datetime import timedelta
 
 from urllib.parse import urlsplit  # pylint: disable=import-error
 
+from sqlalchemy import event as sqlalchemy_event
+from sqlalchemy.engine import Engine
 from twisted.internet import defer, task
 from twisted.internet.address import IPv4Address
 from twisted.internet.defer import inlineCallbacks, Deferred
@@ -36,10 +38,12 @@ from globaleaks.handlers.admin.questionnaire import db_get_questionnaire
 from globaleaks.handlers.admin.step import db_create_step
 from globaleaks.handlers.admin.tenant import create as create_tenant
 from globaleaks.handlers.admin.user import create_user
+from globaleaks.handlers.public import QuestionnaireCache
 from globaleaks.handlers.wizard import db_wizard
-from globaleaks.handlers.submission import create_submission
+from globaleaks.handlers.submission import create_submission, ArchivedSchemaCache, QuestionnaireSnapshotCache
 from globaleaks.models.config import db_set_config_variable
 from globaleaks.rest import decorators
+from globaleaks.rest.cache import FileCache, L10NCache
 from globaleaks.sessions import Sessions
 from globaleaks.settings import Settings
 from globaleaks.state import State
@@ -142,6 +146,20 @@ class FakeThreadPool(object):
         onResult(success, result)
 
 
+class QueryCounter(object):
+    """
+    Counter of the queries issued to the database for the duration of a test
+    """
+    def __init__(self, testcase):
+        self.queries = 0
+
+        sqlalchemy_event.listen(Engine, 'before_cursor_execute', self.count)
+        testcase.addCleanup(sqlalchemy_event.remove, Engine, 'before_cursor_execute', self.count)
+
+    def count(self, *args, **kwargs):
+        self.queries += 1
+
+
 def init_state():
     Settings.testing = True
     Settings.set_devel_mode()
@@ -165,6 +183,12 @@ def init_state():
 
     Sessions.clear()
 
+    QuestionnaireCache.invalidate()
+    QuestionnaireSnapshotCache.invalidate()
+    ArchivedSchemaCache.invalidate()
+    FileCache.invalidate()
+    L10NCache.invalidate()
+
 
 @transact
 def mock_users_keys(session):
@@ -348,6 +372,16 @@ def forge_request(uri=b'https://www.globaleaks.org/',
 
     request.notifyFinish = notifyFinish
 
+    def registerProducer(producer, streaming):
+        # Push producers are in charge of writing their data, while
+        # pull producers are driven by DummyRequest until they unregister
+        if streaming:
+            request.producer = producer
+        else:
+            DummyRequest.registerProducer(request, producer, streaming)
+
+    request.registerProducer = registerProducer
+
     request.requestHeaders.setRawHeaders('host', [b'127.0.0.1'])
     request.requestHeaders.setRawHeaders('user-agent', [b'NSA Agent'])
 
@@ -2,7 +2,7 @@
 import os
 
 from globaleaks import models
-from globaleaks.jobs import cleaning, delivery
+from globaleaks.jobs import cleaning, delivery, secure_deletion
 from globaleaks.orm import transact
 from globaleaks.settings import Settings
 from globaleaks.state import State
@@ -121,6 +121,8 @@ class TestCleaning(helpers.TestGLWithPopulatedDB):
 
         yield cleaning.Cleaning().run()
 
+        yield secure_deletion.SecureDeletion().run()
+
         # verify cascade deletion when tips expire
         yield self.check4()
 
@@ -129,3 +131,64 @@ class TestCleaning(helpers.TestGLWithPopulatedDB):
         yield self.set_passwords_ready_to_expire(1)
         yield cleaning.Cleaning().run()
         yield self.check5()
+
+    @transact
+    def corrupt_tip_counters(self, session):
+        session.query(models.InternalTip).update({'comment_count': 0, 'file_count': 100})
+        session.query(models.ReceiverTip).update({'message_count': 100})
+
+    @transact
+    def check_tip_counters(self, session):
+        for itip in session.query(models.InternalTip):
+            self.assertEqual(itip.comment_count, session.query(models.Comment).filter(models.Comment.internaltip_id == itip.id).count())
+            self.assertEqual(itip.file_count, session.query(models.InternalFile).filter(models.InternalFile.internaltip_id == itip.id).count())
+
+        for rtip in session.query(models.ReceiverTip):
+            self.assertEqual(rtip.message_count, session.query(models.Message).filter(models.Message.receivertip_id == rtip.id).count())
+
+    @inlineCallbacks
+    def test_check_tip_counters(self):
+        yield self.perform_full_submission_actions()
+
+        # verify that the counters are maintained on write
+        yield self.check_tip_counters()
+
+        yield self.corrupt_tip_counters()
+
+        yield cleaning.Cleaning().check_tip_counters()
+
+        yield self.check_tip_counters()
+
+    @inlineCallbacks
+    def test_clean_expired_itips_time_budget(self):
+        yield self.perform_full_submission_actions()
+        yield self.force_itip_expiration()
+
+        self.patch(Settings, 'tips_operations_chunk_size', 1)
+        self.patch(Settings, 'cleaning_time_budget', 0)
+
+        job = cleaning.Cleaning()
+        yield job.clean_expired_itips()
+
+        # No chunk is processed when the time budget is exhausted
+        self.assertEqual(job.get_status(), {'expired_tips_deleted': 0,
+                                            'expired_tips_pending': self.population_of_submissions})
+
+        # The backlog is deleted by a follow-up run
+        call = job.backlog_call
+        self.assertTrue(call.active())
+        self.assertEqual(call.getTime(), self.test_reactor.seconds() + job.backlog_interval)
+        self.assertEqual(call.func, job.clean_expired_itips_backlog)
+        call.cancel()
+
+        self.patch(Settings, 'cleaning_time_budget', 60)
+
+        yield job.clean_expired_itips_backlog()
+
+        self.assertEqual(job.get_status(), {'expired_tips_deleted': self.population_of_submissions,
+                                            'expired_tips_pending': 0})
+
+        yield self.test_model_count(models.InternalTip, 0)
+
+        # No follow-up run is scheduled once the backlog is empty
+        self.assertIs(job.backlog_call, call)
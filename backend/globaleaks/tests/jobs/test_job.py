@@ -1,6 +1,9 @@
 # -*- coding: utf-8 -*-
-from globaleaks.jobs.job import LoopingJob
+from twisted.internet import defer
 
+from globaleaks.jobs import job
+from globaleaks.jobs.job import DailyJob, LoopingJob
+from globaleaks.settings import Settings
 from globaleaks.tests import helpers
 
 
@@ -35,3 +38,79 @@ class TestLoopingJob(helpers.TestGL):
             self.assertEqual(job.operation_called, i)
 
         return job.stop()
+
+
+class HeavyJobX(LoopingJob):
+    heavy = True
+
+    def __init__(self):
+        self.operation_deferred = defer.Deferred()
+        LoopingJob.__init__(self)
+
+    def operation(self):
+        return self.operation_deferred
+
+
+class TestHeavyJobs(helpers.TestGL):
+    def test_concurrency_budget(self):
+        self.patch(Settings, 'jobs_heavy_concurrency', 1)
+        self.patch(job, 'heavy_jobs_semaphore', None)
+
+        a, b = HeavyJobX(), HeavyJobX()
+        monitor = job.JobsMonitor([a, b])
+
+        da, db = a.run(), b.run()
+
+        # The second heavy job waits for the first one to complete
+        status = monitor.get_status()
+        self.assertEqual(status['heavy_jobs_running'], [a.name])
+        self.assertEqual(status['heavy_jobs_waiting'], [b.name])
+        self.assertTrue(status['jobs'][b.name]['waiting'])
+        self.assertIsNone(b.active)
+
+        a.operation_deferred.callback(None)
+        self.assertIsNotNone(b.active)
+        self.assertEqual(monitor.get_status()['heavy_jobs_waiting'], [])
+
+        b.operation_deferred.callback(None)
+        self.assertEqual(monitor.get_status()['heavy_jobs_running'], [])
+
+        return defer.gatherResults([da, db])
+
+    def test_no_concurrent_executions(self):
+        self.patch(Settings, 'jobs_heavy_concurrency', 1)
+        self.patch(job, 'heavy_jobs_semaphore', None)
+
+        a, b = HeavyJobX(), HeavyJobX()
+        da, db = a.run(), b.run()
+
+        # Runs requested while the job is running or waiting are discarded
+        self.assertTrue(a.run().called)
+        self.assertTrue(b.run().called)
+        self.assertEqual(len(a.last_executions), 1)
+
+        a.operation_deferred.callback(None)
+        b.operation_deferred.callback(None)
+
+        self.assertFalse(a.executing)
+        self.assertFalse(b.executing)
+
+        return defer.gatherResults([da, db])
+
+    @defer.inlineCallbacks
+    def test_spread(self):
+        x = LoopingJobX()
+        x.spread_period = 10
+
+        items = []
+        yield x.spread([1, 2, 3], items.append)
+        self.assertEqual(items, [1, 2, 3])
+        self.assertIsNone(x.spread_progress)
+
+
+class TestJitter(helpers.TestGL):
+    def test_offset(self):
+        x = DailyJob()
+        self.assertTrue(0 <= x.offset <= DailyJob.jitter)
+        self.assertTrue(x.get_delay() <= 24 * 3600 + x.offset)
+        self.assertEqual(x.get_schedule()['offset'], x.offset)
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+import os
+
+from twisted.internet.defer import inlineCallbacks
+
+from globaleaks import models
+from globaleaks.handlers.file import db_mark_file_for_secure_deletion
+from globaleaks.jobs import secure_deletion
+from globaleaks.orm import transact
+from globaleaks.settings import Settings
+from globaleaks.tests import helpers
+from globaleaks.utils import fs
+
+
+@transact
+def mark_files_for_secure_deletion(session, filenames):
+    for filename in filenames:
+        db_mark_file_for_secure_deletion(session, Settings.attachments_path, filename)
+
+
+class TestSecureDeletion(helpers.TestGL):
+    @inlineCallbacks
+    def test_job(self):
+        sizes = [0, 1000, fs.OVERWRITE_BLOCK_SIZE * 2 + 1]
+        filenames = ['secure_deletion_%d' % i for i in range(len(sizes))]
+
+        for filename, size in zip(filenames, sizes):
+            with open(os.path.join(Settings.attachments_path, filename), 'wb') as f:
+                f.write(b'x' * size)
+
+        yield mark_files_for_secure_deletion(filenames)
+
+        # Simulate a file removed in the meanwhile
+        os.remove(os.path.join(Settings.attachments_path, filenames[1]))
+
+        job = secure_deletion.SecureDeletion()
+        yield job.run()
+
+        for filename in filenames:
+            self.assertFalse(os.path.exists(os.path.join(Settings.attachments_path, filename)))
+
+        yield self.test_model_count(models.SecureFileDelete, 0)
+
+        status = job.get_status()
+        self.assertEqual(status['backlog_files'], 0)
+        self.assertEqual(status['backlog_bytes'], 0)
+        self.assertEqual(status['deleted_files'], 3)
+        self.assertEqual(status['deleted_bytes'], sizes[2])
+
+    def test_overwrite_file(self):
+        path = os.path.join(Settings.tmp_path, 'overwrite')
+        with open(path, 'wb') as f:
+            f.write(b'x' * (fs.OVERWRITE_BLOCK_SIZE + 10))
+
+        self.assertEqual(list(fs.overwrite_file(path)), [fs.OVERWRITE_BLOCK_SIZE, 10])
+
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        self.assertEqual(len(data), fs.OVERWRITE_BLOCK_SIZE + 10)
+        self.assertNotIn(b'x' * 100, data)
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+import json
+
+from twisted.internet import defer, error
+from twisted.python.failure import Failure
+from twisted.test.proto_helpers import StringTransport
+
+from globaleaks.jobs import worker
+from globaleaks.tests import helpers
+
+
+class FakeProcessTransport(object):
+    pid = 1234
+
+    def __init__(self):
+        self.written = []
+        self.signals = []
+
+    def writeToChild(self, fd, data):
+        self.written.append((fd, data))
+
+    def signalProcess(self, signal):
+        self.signals.append(signal)
+
+
+class FakeWorker(object):
+    def __init__(self):
+        self.woken = []
+        self.refreshed = 0
+        self.closed = False
+
+    def wakeup(self, job_name):
+        self.woken.append(job_name)
+
+    def refresh(self):
+        self.refreshed += 1
+
+    def shutdown(self):
+        self.closed = True
+
+
+class TestJobsWorkerSupervisor(helpers.TestGL):
+    @defer.inlineCallbacks
+    def setUp(self):
+        yield helpers.TestGL.setUp(self)
+
+        self.transports = []
+
+        def spawnProcess(protocol, *args, **kwargs):
+            transport = FakeProcessTransport()
+            protocol.transport = transport
+            self.transports.append(transport)
+            return transport
+
+        self.test_reactor.spawnProcess = spawnProcess
+        self.patch(worker, 'reactor', self.test_reactor)
+        self.patch(worker.time, 'time', self.test_reactor.seconds)
+
+        self.supervisor = worker.JobsWorkerSupervisor()
+        self.supervisor.start()
+
+    def end_process(self):
+        self.supervisor.protocol.processEnded(Failure(error.ProcessTerminated(exitCode=1)))
+
+    def test_heartbeat(self):
+        jobs = [{'name': 'Cleaning'}]
+
+        self.test_reactor.advance(10)
+        self.supervisor.protocol.childDataReceived(worker.HEARTBEAT_FD, json.dumps(jobs).encode()[:5])
+        self.assertEqual(self.supervisor.jobs, [])
+
+        self.supervisor.protocol.childDataReceived(worker.HEARTBEAT_FD, json.dumps(jobs).encode()[5:] + b'\n')
+        self.assertEqual(self.supervisor.jobs, jobs)
+        self.assertEqual(self.supervisor.last_heartbeat, 10)
+
+    def test_output_is_logged(self):
+        lines = []
+        self.patch(worker, 'LOG_LEVELS', {
+            '[D]': lambda msg, *args: lines.append(('D', msg % args)),
+            '[I]': lambda msg, *args: lines.append(('I', msg % args)),
+            '[E]': lambda msg, *args: lines.append(('E', msg % args))
+        })
+
+        self.supervisor.protocol.childDataReceived(1, b'[I] started\n[E] failure\n')
+        self.supervisor.protocol.childDataReceived(2, b'Traceback\n')
+
+        self.assertEqual(lines, [('I', '[jobs worker] started'),
+                                 ('E', '[jobs worker] failure'),
+                                 ('E', '[jobs worker] Traceback')])
+
+    def test_commands(self):
+        self.supervisor.wakeup('Notification')
+        self.supervisor.refresh()
+
+        self.assertEqual(self.transports[0].written, [(0, b'wakeup Notification\n'), (0, b'refresh\n')])
+
+        fake_worker = FakeWorker()
+        channel = worker.JobsWorkerChannel(fake_worker)
+        channel.makeConnection(StringTransport())
+        channel.dataReceived(b'wakeup Notification\nrefresh\n')
+
+        self.assertEqual(fake_worker.woken, ['Notification'])
+        self.assertEqual(fake_worker.refreshed, 1)
+
+        channel.connectionLost(None)
+        self.assertTrue(fake_worker.closed)
+
+    def test_unresponsive_worker_is_killed(self):
+        self.test_reactor.advance(self.supervisor.heartbeat_timeout)
+        self.assertEqual(self.transports[0].signals, [])
+
+        self.test_reactor.advance(self.supervisor.check_interval)
+        self.assertEqual(self.transports[0].signals, ['KILL'])
+
+    def test_restart_with_backoff(self):
+        for delay in [1, 2, 4]:
+            self.end_process()
+            self.assertFalse(self.supervisor.get_status()['running'])
+
+            self.test_reactor.advance(delay - 0.5)
+            self.assertIsNone(self.supervisor.protocol)
+
+            self.test_reactor.advance(0.5)
+            self.assertIsNotNone(self.supervisor.protocol)
+
+        self.assertEqual(len(self.transports), 4)
+        self.assertEqual(self.supervisor.restarts, 3)
+
+        # a worker running for a while resets the backoff
+        self.test_reactor.advance(self.supervisor.stable_time + 1)
+        self.end_process()
+        self.test_reactor.advance(1)
+        self.assertEqual(len(self.transports), 5)
+
+    @defer.inlineCallbacks
+    def test_stop(self):
+        d = self.supervisor.stop()
+        self.assertEqual(self.transports[0].signals, ['TERM'])
+        self.assertFalse(d.called)
+
+        self.end_process()
+        yield d
+
+        self.test_reactor.advance(self.supervisor.max_restart_delay)
+        self.assertEqual(len(self.transports), 1)
+        self.assertFalse(self.supervisor.health_check.running)
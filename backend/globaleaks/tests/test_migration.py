@@ -12,7 +12,7 @@ from twisted.trial import unittest
 
 from globaleaks import DATABASE_VERSION, FIRST_DATABASE_VERSION_SUPPORTED, models
 from globaleaks.db import update_db
-from globaleaks.orm import set_db_uri
+from globaleaks.orm import get_session, make_db_uri, set_db_uri
 from globaleaks.settings import Settings
 from globaleaks.tests import helpers
 
@@ -52,6 +52,18 @@ class TestMigrationRoutines(unittest.TestCase):
 
         self.assertNotEqual(ret, -1)
 
+    def postconditions_52(self):
+        session = get_session(make_db_uri(self.final_db_file))
+
+        for itip in session.query(models.InternalTip):
+            self.assertEqual(itip.comment_count, session.query(models.Comment).filter(models.Comment.internaltip_id == itip.id).count())
+            self.assertEqual(itip.file_count, session.query(models.InternalFile).filter(models.InternalFile.internaltip_id == itip.id).count())
+
+        for rtip in session.query(models.ReceiverTip):
+            self.assertEqual(rtip.message_count, session.query(models.Message).filter(models.Message.receivertip_id == rtip.id).count())
+
+        session.close()
+
 def test(path, version):
     return lambda self: self._test(path, version)
 
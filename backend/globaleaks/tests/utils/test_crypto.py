@@ -1,6 +1,10 @@
 # -*- coding: utf-8
 import filecmp
 import os
+import struct
+
+from nacl.secret import SecretBox
+from nacl.utils import random as nacl_random
 
 from globaleaks.settings import Settings
 from globaleaks.tests import helpers
@@ -76,6 +80,58 @@ class TestCryptoUtils(helpers.TestGL):
         self.assertFalse(filecmp.cmp(a, b, False))
         self.assertTrue(filecmp.cmp(a, c, False))
 
+    def test_encrypt_and_decrypt_file_seek(self):
+        prv_key, pub_key = GCE.generate_keypair()
+        data = os.urandom(200000)
+        b = os.path.join(Settings.tmp_path, 'b')
+
+        with GCE.streaming_encryption_open('ENCRYPT', pub_key, b) as seo:
+            seo.encrypt_chunk(data[:100], 0)
+            seo.encrypt_chunk(data[100:], 1)
+
+        with GCE.streaming_encryption_open('DECRYPT', prv_key, b) as seo:
+            self.assertTrue(seo.seekable())
+            self.assertEqual(seo.size, len(data))
+
+            for start in [0, 1, 65535, 65536, 131072 + 10, len(data) - 1]:
+                seo.seek(start)
+                self.assertEqual(seo.read(100), data[start:start + 100])
+
+    def test_decrypt_file_sequential_format(self):
+        # Files written with the sequential format of the previous versions
+        prv_key, pub_key = GCE.generate_keypair()
+        data = os.urandom(100000)
+        b = os.path.join(Settings.tmp_path, 'b')
+
+        key = nacl_random(32)
+        partial_nonce = nacl_random(16)
+        box = SecretBox(key)
+        chunks = [data[:65536], data[65536:]]
+
+        with open(b, 'wb') as f:
+            f.write(GCE.asymmetric_encrypt(pub_key, key))
+            f.write(partial_nonce)
+            for i, chunk in enumerate(chunks):
+                last = int(i == len(chunks) - 1)
+                nonce = partial_nonce + (struct.pack('>Q', 1) if last else struct.pack('<Q', i))
+                f.write(struct.pack('>B', last))
+                f.write(struct.pack('>I', len(chunk)))
+                f.write(box.encrypt(chunk, nonce)[24:])
+
+        with GCE.streaming_encryption_open('DECRYPT', prv_key, b) as seo:
+            self.assertFalse(seo.seekable())
+            self.assertIsNone(seo.size)
+
+            output = b''
+            while True:
+                x = seo.read(4096)
+                if not x:
+                    break
+
+                output += x
+
+        self.assertEqual(output, data)
+
     def test_recovery_key(self):
         prv_key, _ = GCE.generate_keypair()
         bck_key, rec_key = GCE.generate_recovery_key(prv_key)
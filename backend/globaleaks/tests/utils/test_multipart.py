@@ -0,0 +1,69 @@
+# -*- coding: utf-8
+import os
+
+from globaleaks.settings import Settings
+from globaleaks.tests import helpers
+from globaleaks.utils.multipart import MultipartError, MultipartParser, parse_header
+
+boundary = b'----GlobaLeaksBoundary'
+
+
+def forge_body(fields, file_content):
+    body = b''
+    for name, value in fields:
+        body += b'--' + boundary + b'\r\n'
+        body += b'Content-Disposition: form-data; name="%s"\r\n\r\n' % name
+        body += value + b'\r\n'
+
+    body += b'--' + boundary + b'\r\n'
+    body += b'Content-Disposition: form-data; name="file"; filename="file.bin"\r\n'
+    body += b'Content-Type: application/octet-stream\r\n\r\n'
+    body += file_content + b'\r\n'
+    body += b'--' + boundary + b'--\r\n'
+
+    return body
+
+
+class TestMultipartParser(helpers.TestGL):
+    def test_parse(self):
+        file_content = os.urandom(100000) + b'\r\n--' + boundary[:-1]
+        body = forge_body([(b'flowChunkNumber', b'1'), (b'flowFilename', b'file.bin')], file_content)
+
+        for chunk_size in [1, 7, 1024, len(body)]:
+            parser = MultipartParser(boundary, Settings.tmp_path)
+            for i in range(0, len(body), chunk_size):
+                parser.feed(body[i:i + chunk_size])
+
+            fields = parser.close()
+
+            self.assertEqual(fields, {b'flowChunkNumber': [b'1'], b'flowFilename': [b'file.bin']})
+            self.assertEqual(parser.file_name, 'file.bin')
+            self.assertEqual(parser.file_size, len(file_content))
+
+            with parser.file.open('r') as f:
+                self.assertEqual(f.read(), file_content)
+
+    def test_parse_truncated_body(self):
+        body = forge_body([(b'flowChunkNumber', b'1')], b'content')
+
+        parser = MultipartParser(boundary, Settings.tmp_path)
+        parser.feed(body[:-10])
+        self.assertRaises(MultipartError, parser.close)
+        self.assertIsNone(parser.file)
+
+    def test_parse_fields_too_large(self):
+        body = forge_body([(b'description', b'x' * 100000)], b'content')
+
+        parser = MultipartParser(boundary, Settings.tmp_path)
+        parser.feed(body)
+        self.assertRaises(MultipartError, parser.close)
+
+    def test_parse_header(self):
+        self.assertEqual(parse_header('Multipart/Form-Data; boundary="a b"'),
+                         ('multipart/form-data', {'boundary': 'a b'}))
+
+        self.assertEqual(parse_header('form-data; name="file"; filename="a;b.bin"'),
+                         ('form-data', {'name': 'file', 'filename': 'a;b.bin'}))
+
+        self.assertEqual(parse_header(''), ('', {}))
+
@@ -0,0 +1,81 @@
+# -*- coding: utf-8
+import os
+import time
+
+from twisted.internet.defer import DeferredList, inlineCallbacks
+
+from globaleaks.settings import Settings
+from globaleaks.tests import helpers
+from globaleaks.utils import resumable
+
+
+class TestResumable(helpers.TestGL):
+    def test_save_and_load_upload(self):
+        f = resumable.create_upload(Settings.tmp_path, 1, self._testMethodName, 2)
+        with f.open('rw'):
+            f.write_at(4, b'data')
+
+        f.set_chunk(1)
+        resumable.save_manifest(f, 1, self._testMethodName, 8)
+
+        f, total_size = resumable.load_upload(Settings.tmp_path, 1, self._testMethodName)
+        self.assertEqual(total_size, 8)
+        self.assertEqual(f.first_missing_chunk(), 0)
+
+        with f.open('r'):
+            self.assertEqual(f.read()[4:], b'data')
+
+        # The manifest is bound to the tenant and to the identifier of the upload
+        self.assertIsNone(resumable.load_upload(Settings.tmp_path, 2, self._testMethodName))
+        self.assertIsNone(resumable.load_upload(Settings.tmp_path, 1, 'other'))
+
+    @inlineCallbacks
+    def test_persist_upload(self):
+        f = resumable.create_upload(Settings.tmp_path, 1, self._testMethodName, 3)
+        with f.open('rw'):
+            f.write_at(0, b'data')
+
+        calls = []
+        write_manifest = resumable.write_manifest
+        self.patch(resumable, 'write_manifest', lambda *args: calls.append(args) or write_manifest(*args))
+
+        # The requests received while a write is in progress are coalesced
+        f.set_chunk(0)
+        d1 = resumable.persist_upload(f, 1, self._testMethodName, 30)
+        f.set_chunk(1)
+        d2 = resumable.persist_upload(f, 1, self._testMethodName, 30)
+        d3 = resumable.persist_upload(f, 1, self._testMethodName, 30)
+
+        yield DeferredList([d1, d2, d3], fireOnOneErrback=True)
+        self.assertEqual(len(calls), 2)
+
+        f, _ = resumable.load_upload(Settings.tmp_path, 1, self._testMethodName)
+        self.assertEqual(f.first_missing_chunk(), 2)
+
+        # A manifest of a completed upload is removed after the write in progress
+        resumable.persist_upload(f, 1, self._testMethodName, 30)
+        resumable.delete_manifest(f, 1, self._testMethodName)
+        yield f.manifest_saving
+
+        self.assertFalse(os.path.exists(resumable.get_manifest_path(Settings.tmp_path, 1, self._testMethodName)))
+
+    def test_clean_expired_uploads(self):
+        f = resumable.create_upload(Settings.tmp_path, 1, self._testMethodName, 2)
+        with f.open('rw'):
+            f.write_at(0, b'data')
+
+        f.set_chunk(0)
+        resumable.save_manifest(f, 1, self._testMethodName, 8)
+
+        manifest = resumable.get_manifest_path(Settings.tmp_path, 1, self._testMethodName)
+
+        resumable.clean_expired_uploads(Settings.tmp_path, 3600)
+        self.assertTrue(os.path.exists(manifest))
+        self.assertTrue(os.path.exists(f.filepath))
+
+        t = time.time() - 7200
+        os.utime(manifest, (t, t))
+
+        resumable.clean_expired_uploads(Settings.tmp_path, 3600)
+        self.assertFalse(os.path.exists(manifest))
+        self.assertFalse(os.path.exists(f.filepath))
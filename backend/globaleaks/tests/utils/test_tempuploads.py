@@ -0,0 +1,62 @@
+# -*- coding: utf-8
+import os
+
+from globaleaks.rest import errors
+from globaleaks.settings import Settings
+from globaleaks.tests import helpers
+from globaleaks.utils.securetempfile import SecureTemporaryFile
+from globaleaks.utils.tempuploads import TempUploadList
+
+
+class TestTempUploadList(helpers.TestGL):
+    def get_file(self, tid, owner, size):
+        f = SecureTemporaryFile(Settings.tmp_path)
+        f.tid = tid
+        f.owner = owner
+        f.size = size
+        return f
+
+    def test_index(self):
+        uploads = TempUploadList(timeout=10)
+
+        a = self.get_file(1, 'session_a', 100)
+        b = self.get_file(1, 'session_b', 200)
+        c = self.get_file(2, None, 300)
+
+        uploads.set('a', a)
+        uploads.set('b', b)
+        uploads['c'] = c
+
+        self.assertEqual(uploads.get_tenant_bytes(1), 300)
+        self.assertEqual(uploads.get_tenant_bytes(2), 300)
+        self.assertEqual(uploads.get_owner_bytes('session_a'), 100)
+
+        # The bytes written are accounted to the tenant and to the owner
+        uploads.add_size('b', 50)
+        self.assertEqual(uploads.get_tenant_bytes(1), 350)
+        self.assertEqual(uploads.get_owner_bytes('session_b'), 250)
+
+        self.assertIs(uploads.pop_by_name(os.path.basename(a.filepath)), a)
+        self.assertIsNone(uploads.pop_by_name(os.path.basename(a.filepath)))
+        self.assertEqual(uploads.get_tenant_bytes(1), 250)
+        self.assertEqual(uploads.get_owner_bytes('session_a'), 0)
+        self.assertEqual(uploads.pop_by_owner('session_a'), [])
+        self.assertEqual(uploads.pop_by_owner('session_b'), [('b', b)])
+
+        del uploads['c']
+        self.assertEqual(uploads.names, {})
+        self.assertEqual(uploads.tenant_bytes, {})
+        self.assertEqual(uploads.owner_bytes, {})
+
+    def test_check_quota(self):
+        uploads = TempUploadList(timeout=10)
+        uploads.set('a', self.get_file(1, 'session', 1024 * 1024))
+
+        uploads.check_quota(1, 'session', 1024 * 1024, 2, 2)
+        uploads.check_quota(1, None, 1024 * 1024, 2, 1)
+
+        self.assertRaises(errors.UploadQuotaExceeded,
+                          uploads.check_quota, 1, 'session', 1024 * 1024 + 1, 2, 2)
+
+        self.assertRaises(errors.UploadQuotaExceeded,
+                          uploads.check_quota, 1, 'session', 1024 * 1024, 3, 1)
@@ -6,6 +6,7 @@ from twisted.internet.defer import inlineCallbacks
 from zipfile import ZipFile
 
 from globaleaks.tests import helpers
+from globaleaks.utils import zipstream
 from globaleaks.utils.zipstream import ZipStream
 
 
@@ -39,3 +40,40 @@ class TestZipStream(helpers.TestGL):
                     self.assertTrue(ff.file_size == len(self.unicode_seq.encode()))
                 else:
                     self.assertTrue(ff.file_size == os.stat(os.path.abspath(__file__)).st_size)
+
+    def test_zipstream_compression(self):
+        text = b'GlobaLeaks ' * 1024
+        files = [
+          {'name': 'text.txt', 'fo': BytesIO(text)},
+          {'name': 'random.bin', 'fo': BytesIO(os.urandom(8192))},
+          {'name': 'picture.jpg', 'fo': BytesIO(text)},
+          {'name': 'picture', 'type': 'image/jpeg', 'fo': BytesIO(text)}
+        ]
+
+        output = BytesIO()
+
+        for data in ZipStream(files):
+            output.write(data)
+
+        with ZipFile(output, 'r') as f:
+            self.assertIsNone(f.testzip())
+            self.assertEqual(f.read('text.txt'), text)
+            self.assertEqual(f.getinfo('text.txt').compress_type, zipstream.ZIP_DEFLATED)
+            self.assertEqual(f.getinfo('random.bin').compress_type, zipstream.ZIP_STORED)
+            self.assertEqual(f.getinfo('picture.jpg').compress_type, zipstream.ZIP_STORED)
+            self.assertEqual(f.getinfo('picture').compress_type, zipstream.ZIP_STORED)
+
+    def test_zipstream_zip64(self):
+        self.patch(zipstream, 'ZIP64_LIMIT', 1024)
+
+        output = BytesIO()
+
+        for data in ZipStream(self.files):
+            output.write(data)
+
+        with ZipFile(output, 'r') as f:
+            self.assertIsNone(f.testzip())
+            for ff in f.infolist():
+                if ff.filename != self.unicode_seq:
+                    self.assertEqual(ff.file_size, os.stat(os.path.abspath(__file__)).st_size)
+                    self.assertEqual(f.read(ff), open(os.path.abspath(__file__), 'rb').read())
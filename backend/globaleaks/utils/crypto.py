@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 import base64
 import binascii
+import io
 import os
 import random
 import string
@@ -107,7 +108,28 @@ def _hash_argon2(password, salt):
     return base64.b64encode(hash).decode()
 
 
+# Magic number identifying the seekable format of the encrypted files
+STREAMING_ENCRYPTION_MAGIC = b'GLSE\x00\x00\x00\x02'
+
+# Size of the plaintext chunks of the seekable format
+STREAMING_ENCRYPTION_CHUNK_SIZE = 64 * 1024
+
+
 class _StreamingEncryptionObject(object):
+    """
+    File-like object encrypting or decrypting a file in chunks
+
+    Files are written in a seekable format made of fixed-size chunks:
+
+    [magic 8B][chunk size 4B][nonce prefix 16B][sealed key and file size 88B][chunks]
+
+    Each chunk is encrypted with the nonce prefix and its index so that any
+    range of the file can be decrypted without reading the preceding data;
+    sealing the size together with the key prevents truncation.
+
+    Files written in the previous sequential format, where each chunk
+    carries its last flag and its length, are still readable
+    """
     def __init__(self, mode, user_key, filepath):
         self.mode = mode
         self.user_key = user_key
@@ -117,21 +139,44 @@ class _StreamingEncryptionObject(object):
 
         self.index = 0
 
+        self.version = 2
+        self.chunk_size = STREAMING_ENCRYPTION_CHUNK_SIZE
+        self.size = None
+        self.position = 0
+        self.buffer = b''
+        self.cache = (None, b'')
+
         if self.mode == 'ENCRYPT':
             self.fd = open(filepath, 'wb')
             self.key = nacl_random(32)
             self.partial_nonce = nacl_random(16)
-            key = _GCE.asymmetric_encrypt(self.user_key, self.key)
-            self.fd.write(key)
+            self.size = 0
+            self.fd.write(STREAMING_ENCRYPTION_MAGIC)
+            self.fd.write(struct.pack('>I', self.chunk_size))
             self.fd.write(self.partial_nonce)
+            self.fd.write(self.seal_header())
         else:
             self.fd = open(filepath, 'rb')
-            x = self.fd.read(80)
-            self.key = _GCE.asymmetric_decrypt(self.user_key, x)
-            self.partial_nonce = self.fd.read(16)
+            if self.fd.read(len(STREAMING_ENCRYPTION_MAGIC)) == STREAMING_ENCRYPTION_MAGIC:
+                self.chunk_size = struct.unpack('>I', self.fd.read(4))[0]
+                self.partial_nonce = self.fd.read(16)
+                x = _GCE.asymmetric_decrypt(self.user_key, self.fd.read(88))
+                self.key, self.size = x[:32], struct.unpack('>Q', x[32:])[0]
+            else:
+                self.version = 1
+                self.fd.seek(0)
+                x = self.fd.read(80)
+                self.key = _GCE.asymmetric_decrypt(self.user_key, x)
+                self.partial_nonce = self.fd.read(16)
 
         self.box = SecretBox(self.key)
 
+    def seal_header(self):
+        return _GCE.asymmetric_encrypt(self.user_key, self.key + struct.pack('>Q', self.size))
+
+    def header_size(self):
+        return len(STREAMING_ENCRYPTION_MAGIC) + 4 + 16 + 88
+
     def fullNonce(self, i):
         return self.partial_nonce + struct.pack('<Q', i)
 
@@ -148,13 +193,49 @@ class _StreamingEncryptionObject(object):
 
         return chunkNonce
 
+    def write_chunk(self, chunk):
+        self.fd.write(self.box.encrypt(chunk, self.fullNonce(self.index))[24:])
+        self.index += 1
+
     def encrypt_chunk(self, chunk, last=0):
-        chunkNonce = self.getNextNonce(last)
-        self.fd.write(struct.pack('>B', last))
-        self.fd.write(struct.pack('>I', len(chunk)))
-        self.fd.write(self.box.encrypt(chunk, chunkNonce)[24:])
+        """
+        Encrypt data to be appended to the file
+
+        :param chunk: The data to be encrypted
+        :param last: A flag marking the end of the file
+        """
+        self.buffer += chunk
+        self.size += len(chunk)
+
+        while len(self.buffer) >= self.chunk_size:
+            self.write_chunk(self.buffer[:self.chunk_size])
+            self.buffer = self.buffer[self.chunk_size:]
+
+        if last:
+            self.finalize()
+
+    def finalize(self):
+        if self.EOF:
+            return
+
+        self.EOF = True
+
+        if self.buffer:
+            self.write_chunk(self.buffer)
+            self.buffer = b''
+
+        self.fd.seek(self.header_size() - 88)
+        self.fd.write(self.seal_header())
 
     def decrypt_chunk(self):
+        if self.version == 2:
+            if self.position >= self.size:
+                self.EOF = True
+                return 1, b''
+
+            data = self.read(self.chunk_size)
+            return int(self.position >= self.size), data
+
         last = struct.unpack('>B', self.fd.read(1))[0]
         if last:
             self.EOF = True
@@ -164,12 +245,63 @@ class _StreamingEncryptionObject(object):
         chunk = self.fd.read(chunkLen + 16)
         return last, self.box.decrypt(chunk, chunkNonce)
 
-    def read(self, a):
-        if not self.EOF:
-            return self.decrypt_chunk()[1]
+    def decrypt_chunk_at(self, i):
+        """
+        Decrypt the chunk with the given index of a file in the seekable format
+        """
+        if self.cache[0] != i:
+            self.fd.seek(self.header_size() + i * (self.chunk_size + 16))
+            length = min(self.chunk_size, self.size - i * self.chunk_size)
+            self.cache = (i, self.box.decrypt(self.fd.read(length + 16), self.fullNonce(i)))
+
+        return self.cache[1]
+
+    def seekable(self):
+        return self.version == 2
+
+    def seek(self, offset, whence=0):
+        if self.version != 2:
+            raise io.UnsupportedOperation('seek')
+
+        if whence == 1:
+            offset += self.position
+        elif whence == 2:
+            offset += self.size
+
+        self.position = max(offset, 0)
+
+        return self.position
+
+    def tell(self):
+        return self.position
+
+    def read(self, a=-1):
+        if self.version == 1:
+            if not self.EOF:
+                return self.decrypt_chunk()[1]
+
+            return b''
+
+        if a is None or a < 0:
+            a = self.size
+
+        data = []
+        while a > 0 and self.position < self.size:
+            i, offset = divmod(self.position, self.chunk_size)
+
+            x = self.decrypt_chunk_at(i)[offset:offset + a]
+
+            self.position += len(x)
+            a -= len(x)
+            data.append(x)
+
+        return b''.join(data)
 
     def close(self):
         if self.fd is not None:
+            if self.mode == 'ENCRYPT':
+                self.finalize()
+
             self.fd.close()
             self.fd = None
 
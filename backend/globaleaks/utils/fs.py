@@ -2,15 +2,43 @@
 import io
 import json
 import os
-import random
 
 from globaleaks.rest import errors
 from globaleaks.utils.utility import log
 
 
+# Size of the blocks of random data used to overwrite the files
+OVERWRITE_BLOCK_SIZE = 1024 * 1024
+
+
+def overwrite_file(absolutefpath, block_size=OVERWRITE_BLOCK_SIZE):
+    """
+    Generator overwriting the whole content of a file with random data
+
+    The file is overwritten one block at a time so that the caller could
+    throttle the operation; the data is flushed to the disk at the end.
+
+    :param absolutefpath: the absolute path of the file to overwrite
+    :param block_size: the size of the blocks written
+    :return: a generator yielding the number of bytes of each block written
+    """
+    size = os.path.getsize(absolutefpath)
+
+    with open(absolutefpath, 'r+b') as f:
+        written = 0
+        while written < size:
+            n = min(block_size, size - written)
+            f.write(os.urandom(n))
+            written += n
+            yield n
+
+        f.flush()
+        os.fsync(f.fileno())
+
+
 def overwrite_and_remove(absolutefpath, iterations_number=1):
     """
-    Overwrite the file with all_zeros, all_ones, random patterns
+    Overwrite the file with random data and remove it
 
     This feature is a legacy security measure known to has important
     drawbacks and to not be effective on all the situations as it
@@ -25,36 +53,13 @@ def overwrite_and_remove(absolutefpath, iterations_number=1):
     """
     log.debug("Starting secure deletion of file %s", absolutefpath)
 
-    def _overwrite(absolutefpath, pattern):
-        count = 0
-        length = len(pattern)
-
-        with open(absolutefpath, 'w+') as f:
-            f.seek(0)
-            while count < length:
-                f.write(pattern)
-                count += len(pattern)
-
-    randomgen = random.SystemRandom()
-
     try:
-        # in the following loop, the file is open and closed on purpose, to trigger flush operations
-        all_zeros = "\0\0\0\0" * 1024               # 4kb of zeros
-        all_ones = "\xFF" * 4096
-
         for iteration in range(iterations_number):
-            OPTIMIZATION_RANDOM_BLOCK = randomgen.randint(4096, 4096 * 2)
-
-            random_pattern = ""
-            for _ in range(OPTIMIZATION_RANDOM_BLOCK):
-                random_pattern += str(randomgen.randrange(256))
-
             log.debug("Excecuting rewrite iteration (%d out of %d)",
                       iteration, iterations_number)
 
-            _overwrite(absolutefpath, all_zeros)
-            _overwrite(absolutefpath, all_ones)
-            _overwrite(absolutefpath, random_pattern)
+            for _ in overwrite_file(absolutefpath):
+                pass
 
     except Exception as excep:
         log.err("Unable to perform secure overwrite for file %s: %s",
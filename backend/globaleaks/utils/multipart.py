@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+#
+# Incremental parser of multipart/form-data request bodies
+from email.message import Message
+from email.utils import collapse_rfc2231_value
+
+from globaleaks.utils.securetempfile import SecureTemporaryFile
+
+# Maximum size of the headers of each part
+MAX_HEADERS_SIZE = 16 * 1024
+
+# Maximum size of the values of the fields that are not files
+MAX_FIELDS_SIZE = 64 * 1024
+
+
+class MultipartError(Exception):
+    pass
+
+
+def parse_header(value):
+    """
+    Parse a header composed by a value followed by parameters like
+    Content-Type and Content-Disposition
+
+    :param value: The value of the header
+    :return: A tuple of the lowercased value and of the dictionary of the parameters
+    """
+    msg = Message()
+    msg['content-type'] = value
+
+    params = msg.get_params(failobj=[('', '')])
+
+    return params[0][0].lower(), {k.lower(): collapse_rfc2231_value(v) for k, v in params[1:]}
+
+
+class MultipartParser(object):
+    """
+    Incremental parser of multipart/form-data bodies
+
+    The parser is fed with the body as it is received; the values of the
+    fields are kept in memory while the content of the file is directly
+    encrypted into a SecureTemporaryFile so that the memory used does not
+    depend on the size of the upload.
+    """
+    def __init__(self, boundary, filesdir):
+        self.delimiter = b'--' + boundary
+        self.filesdir = filesdir
+        self.buffer = b''
+        self.state = 'preamble'
+        self.error = None
+
+        self.fields = {}
+        self.fields_size = 0
+        self.file = None
+        self.file_field = None
+        self.file_name = None
+        self.file_size = 0
+
+        self.part = None
+
+    def feed(self, data):
+        """
+        Parse a chunk of the body
+
+        :param data: The chunk to be parsed
+        """
+        if self.error is not None:
+            return
+
+        try:
+            self.buffer += data
+            self.parse()
+        except MultipartError as e:
+            self.error = e
+            self.buffer = b''
+
+    def parse(self):
+        while True:
+            if self.state == 'preamble':
+                idx = self.buffer.find(self.delimiter)
+                if idx < 0:
+                    self.buffer = self.buffer[-len(self.delimiter):]
+                    return
+
+                self.buffer = self.buffer[idx + len(self.delimiter):]
+                self.state = 'delimiter'
+
+            elif self.state == 'delimiter':
+                if len(self.buffer) < 2:
+                    return
+
+                if self.buffer.startswith(b'--'):
+                    self.buffer = b''
+                    self.state = 'end'
+                elif self.buffer.startswith(b'\r\n'):
+                    self.buffer = self.buffer[2:]
+                    self.state = 'headers'
+                else:
+                    raise MultipartError('Malformed delimiter')
+
+            elif self.state == 'headers':
+                idx = self.buffer.find(b'\r\n\r\n')
+                if idx < 0:
+                    if len(self.buffer) > MAX_HEADERS_SIZE:
+                        raise MultipartError('Headers too large')
+
+                    return
+
+                self.open_part(self.buffer[:idx])
+                self.buffer = self.buffer[idx + 4:]
+                self.state = 'body'
+
+            elif self.state == 'body':
+                idx = self.buffer.find(b'\r\n' + self.delimiter)
+                if idx < 0:
+                    # Keep the bytes that could be the beginning of the delimiter
+                    safe = len(self.buffer) - len(self.delimiter) - 2
+                    if safe > 0:
+                        self.write_part(self.buffer[:safe])
+                        self.buffer = self.buffer[safe:]
+
+                    return
+
+                self.write_part(self.buffer[:idx])
+                self.close_part()
+                self.buffer = self.buffer[idx + 2 + len(self.delimiter):]
+                self.state = 'delimiter'
+
+            else:
+                self.buffer = b''
+                return
+
+    def open_part(self, data):
+        name = filename = None
+
+        for line in data.split(b'\r\n'):
+            key, _, value = line.decode('utf-8', 'surrogateescape').partition(':')
+            if key.strip().lower() != 'content-disposition':
+                continue
+
+            _, params = parse_header(value.strip())
+            name = params.get('name')
+            filename = params.get('filename')
+
+        if name is None:
+            raise MultipartError('Missing field name')
+
+        name = name.encode('utf-8', 'surrogateescape')
+
+        if filename is None:
+            self.part = []
+            self.fields.setdefault(name, []).append(self.part)
+            return
+
+        if self.file is not None:
+            raise MultipartError('Multiple files')
+
+        self.file = SecureTemporaryFile(self.filesdir)
+        self.file.open('w')
+        self.file_field = name
+        self.file_name = filename
+        self.part = self.file
+
+    def write_part(self, data):
+        if not data:
+            return
+
+        if self.part is self.file:
+            self.file.write(data)
+            self.file_size += len(data)
+        else:
+            self.fields_size += len(data)
+            if self.fields_size > MAX_FIELDS_SIZE:
+                raise MultipartError('Fields too large')
+
+            self.part.append(data)
+
+    def close_part(self):
+        if self.part is self.file:
+            self.file.close()
+
+        self.part = None
+
+    def close(self):
+        """
+        Complete the parsing of the body
+
+        :return: A dictionary of the values of the fields
+        """
+        if self.error is None and self.state != 'end':
+            self.error = MultipartError('Truncated body')
+
+        if self.error is not None:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+            raise self.error
+
+        return {name: [b''.join(x) for x in values] for name, values in self.fields.items()}
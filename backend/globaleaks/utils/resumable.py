@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+#
+# Durable manifests of the uploads in progress allowing to resume them
+# after a disconnection or a restart of the application
+#
+# The manifest of an upload records the key of its temporary file and the
+# chunks received; it is encrypted with a key derived from the identifier
+# of the upload that is known only to the client, so that the content of
+# the temporary files stored on disk cannot be recovered without it.
+import base64
+import hashlib
+import json
+import os
+import time
+
+from nacl.exceptions import CryptoError
+from twisted.internet import defer, threads
+from twisted.python.failure import Failure
+
+from globaleaks.utils.crypto import GCE
+from globaleaks.utils.log import log
+from globaleaks.utils.securetempfile import SecureTemporaryFile
+
+MANIFEST_SUFFIX = '.manifest'
+
+
+def _derive(purpose, tid, upload_id):
+    return hashlib.sha256(b'%s:%d:%s' % (purpose, tid, upload_id.encode())).digest()
+
+
+def get_upload_name(tid, upload_id):
+    """
+    Return the name used on disk by the files of an upload
+
+    :param tid: A tenant ID
+    :param upload_id: The identifier of the upload
+    :return: The name of the files of the upload
+    """
+    return _derive(b'name', tid, upload_id).hex()
+
+
+def get_manifest_path(filesdir, tid, upload_id):
+    return os.path.join(filesdir, get_upload_name(tid, upload_id) + MANIFEST_SUFFIX)
+
+
+def create_upload(filesdir, tid, upload_id, total_chunks, chunk_file=None):
+    """
+    Create the temporary file of a new resumable upload
+
+    :param filesdir: The directory of the temporary files
+    :param tid: A tenant ID
+    :param upload_id: The identifier of the upload
+    :param total_chunks: The number of chunks of the upload
+    :param chunk_file: An optional temporary file containing the first chunk to be adopted
+    :return: The temporary file of the upload
+    """
+    name = get_upload_name(tid, upload_id)
+
+    if chunk_file is None:
+        f = SecureTemporaryFile(filesdir, key_id=name)
+    else:
+        f = chunk_file
+        f.key_id = name
+        filepath = os.path.join(filesdir, "%s.aes" % name)
+        os.rename(f.filepath, filepath)
+        f.filepath = filepath
+
+    f.persistent = True
+    f.init_chunks(total_chunks)
+
+    return f
+
+
+def get_manifest(f, total_size):
+    return json.dumps({
+        'key': base64.b64encode(f.key).decode(),
+        'nonce': base64.b64encode(f.key_counter_nonce).decode(),
+        'chunks': base64.b64encode(bytes(f.chunks)).decode(),
+        'total_size': total_size
+    }).encode()
+
+
+def write_manifest(filepath, tid, upload_id, data):
+    """
+    Durably store the manifest of an upload
+
+    The temporary file is flushed to disk before the manifest is replaced
+    so that the manifest never references chunks that could be lost
+
+    :param filepath: The path of the temporary file of the upload
+    :param tid: A tenant ID
+    :param upload_id: The identifier of the upload
+    :param data: The manifest returned by get_manifest
+    """
+    fd = os.open(filepath, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+    path = get_manifest_path(os.path.dirname(filepath), tid, upload_id)
+
+    with open(path + '.tmp', 'wb') as manifest:
+        manifest.write(GCE.symmetric_encrypt(_derive(b'key', tid, upload_id), data))
+        manifest.flush()
+        os.fsync(manifest.fileno())
+
+    os.replace(path + '.tmp', path)
+
+
+def save_manifest(f, tid, upload_id, total_size):
+    """
+    Synchronously store the manifest of an upload
+
+    :param f: The temporary file of the upload
+    :param tid: A tenant ID
+    :param upload_id: The identifier of the upload
+    :param total_size: The size of the file uploaded
+    """
+    write_manifest(f.filepath, tid, upload_id, get_manifest(f, total_size))
+
+
+def persist_upload(f, tid, upload_id, total_size):
+    """
+    Store the manifest of an upload in a thread
+
+    The requests received while the manifest is being written are
+    coalesced in a single following write so that a single write per
+    upload is in progress and the manifests are replaced in order.
+
+    :param f: The temporary file of the upload
+    :param tid: A tenant ID
+    :param upload_id: The identifier of the upload
+    :param total_size: The size of the file uploaded
+    :return: A deferred fired when the current state of the upload is durable
+    """
+    d = defer.Deferred()
+    f.manifest_waiters.append(d)
+
+    if f.manifest_saving is None:
+        _persist_upload(f, tid, upload_id, total_size)
+
+    return d
+
+
+def _persist_upload(f, tid, upload_id, total_size):
+    waiters, f.manifest_waiters = f.manifest_waiters, []
+
+    def done(result):
+        f.manifest_saving = None
+
+        if isinstance(result, Failure):
+            log.err("Unable to store the manifest of an upload: %s", result.getErrorMessage())
+
+        if f.manifest_waiters and f.persistent:
+            _persist_upload(f, tid, upload_id, total_size)
+        else:
+            waiters.extend(f.manifest_waiters)
+            f.manifest_waiters = []
+
+        for d in waiters:
+            if isinstance(result, Failure):
+                d.errback(result)
+            else:
+                d.callback(None)
+
+    f.manifest_saving = threads.deferToThread(write_manifest, f.filepath, tid, upload_id, get_manifest(f, total_size))
+    f.manifest_saving.addBoth(done)
+
+
+def load_upload(filesdir, tid, upload_id):
+    """
+    Load a resumable upload from its manifest
+
+    :param filesdir: The directory of the temporary files
+    :param tid: A tenant ID
+    :param upload_id: The identifier of the upload
+    :return: A tuple (temporary file, total size) or None if the upload is not available
+    """
+    path = get_manifest_path(filesdir, tid, upload_id)
+
+    try:
+        with open(path, 'rb') as manifest:
+            data = json.loads(GCE.symmetric_decrypt(_derive(b'key', tid, upload_id), manifest.read()))
+    except (OSError, ValueError, CryptoError):
+        return None
+
+    f = SecureTemporaryFile(filesdir,
+                            key=base64.b64decode(data['key']),
+                            key_counter_nonce=base64.b64decode(data['nonce']),
+                            key_id=get_upload_name(tid, upload_id))
+
+    f.persistent = True
+
+    if not os.path.exists(f.filepath):
+        return None
+
+    f.chunks = bytearray(base64.b64decode(data['chunks']))
+
+    # Loading the manifest postpones its expiration
+    os.utime(path)
+
+    return f, data['total_size']
+
+
+def delete_manifest(f, tid, upload_id):
+    """
+    Delete the manifest of a completed or abandoned upload whose temporary file
+    returns to be deleted as soon as it is not used anymore
+
+    :param f: The temporary file of the upload
+    :param tid: A tenant ID
+    :param upload_id: The identifier of the upload
+    """
+    f.persistent = False
+
+    def remove(_):
+        try:
+            os.remove(get_manifest_path(os.path.dirname(f.filepath), tid, upload_id))
+        except OSError:
+            pass
+
+    # The manifest is removed after the completion of a write in progress
+    if f.manifest_saving is not None:
+        f.manifest_saving.addBoth(remove)
+    else:
+        remove(None)
+
+
+def get_resumable_files(filesdir, timeout):
+    """
+    Return the files of the resumable uploads not yet expired
+
+    :param filesdir: The directory of the temporary files
+    :param timeout: The number of seconds after which an upload not updated is expired
+    :return: The set of names of the files that should be preserved
+    """
+    ret = set()
+    threshold = time.time() - timeout
+
+    for filename in os.listdir(filesdir):
+        if not filename.endswith(MANIFEST_SUFFIX):
+            continue
+
+        try:
+            if os.path.getmtime(os.path.join(filesdir, filename)) < threshold:
+                continue
+        except OSError:
+            continue
+
+        name = filename[:-len(MANIFEST_SUFFIX)]
+        ret.update([filename, name + '.aes'])
+
+    return ret
+
+
+def clean_expired_uploads(filesdir, timeout):
+    """
+    Delete the files of the resumable uploads expired
+
+    :param filesdir: The directory of the temporary files
+    :param timeout: The number of seconds after which an upload not updated is expired
+    """
+    preserved = get_resumable_files(filesdir, timeout)
+
+    for filename in os.listdir(filesdir):
+        if not filename.endswith(MANIFEST_SUFFIX) or filename in preserved:
+            continue
+
+        name = filename[:-len(MANIFEST_SUFFIX)]
+        for x in [filename, name + '.aes']:
+            try:
+                os.remove(os.path.join(filesdir, x))
+            except OSError:
+                pass
@@ -11,23 +11,47 @@ crypto_backend = default_backend()
 
 class SecureTemporaryFile(object):
     file = None
+    fd = None
 
-    def __init__(self, filesdir):
+    # Files of resumable uploads are preserved on disk when the object is released
+    persistent = False
+
+    # Tenant, owner and bytes written accounted for the quotas of the uploads
+    tid = None
+    owner = None
+    size = 0
+
+    # Size of the upload declared by the client
+    total_size = 0
+
+    def __init__(self, filesdir, key=None, key_counter_nonce=None, key_id=None):
         """
         Create the AES Key to encrypt the uploaded file and initialize the cipher
+
+        An existing file could be reopened by providing its key, nonce and key id
         """
-        self.key = os.urandom(32)
-        self.key_id = generateRandomKey(16)
-        self.key_counter_nonce = os.urandom(16)
+        self.key = key if key is not None else os.urandom(32)
+        self.key_id = key_id if key_id is not None else generateRandomKey(16)
+        self.key_counter_nonce = key_counter_nonce if key_counter_nonce is not None else os.urandom(16)
         self.cipher = Cipher(algorithms.AES(self.key), modes.CTR(self.key_counter_nonce), backend=crypto_backend)
         self.filepath = os.path.join(filesdir, "%s.aes" % self.key_id)
         self.enc = self.cipher.encryptor()
         self.dec = None
 
+        # Bitmap of the chunks received for the uploads split in chunks
+        self.chunks = None
+
+        # Write of the manifest of a resumable upload in progress and requests waiting for it
+        self.manifest_saving = None
+        self.manifest_waiters = []
+
     def open(self, mode):
         if self.file is None:
             if mode == 'w':
                 self.fd = open(self.filepath, 'ab+')
+            elif mode == 'rw':
+                # Random access writes used for the uploads split in chunks
+                self.fd = open(self.filepath, 'r+b' if os.path.exists(self.filepath) else 'w+b')
             else:
                 self.fd = open(self.filepath, 'rb')
                 self.dec = self.cipher.decryptor()
@@ -40,6 +64,38 @@ class SecureTemporaryFile(object):
 
         self.fd.write(self.enc.update(data))
 
+    def write_at(self, offset, data):
+        """
+        Write data at an arbitrary offset of the file
+
+        AES-CTR allows to encrypt any block independently by computing
+        the value of the counter corresponding to its position
+        """
+        if isinstance(data, str):
+            data = data.encode()
+
+        counter = (int.from_bytes(self.key_counter_nonce, 'big') + offset // 16) % (1 << 128)
+        cipher = Cipher(algorithms.AES(self.key), modes.CTR(counter.to_bytes(16, 'big')), backend=crypto_backend)
+        enc = cipher.encryptor()
+
+        # Skip the part of the keystream preceding the offset in its block
+        enc.update(b'\0' * (offset % 16))
+
+        self.fd.seek(offset)
+        self.fd.write(enc.update(data) + enc.finalize())
+
+    def init_chunks(self, total_chunks):
+        self.chunks = bytearray(total_chunks)
+
+    def set_chunk(self, index):
+        self.chunks[index] = 1
+
+    def first_missing_chunk(self):
+        """
+        Return the index of the first chunk not yet received or -1 if all the chunks are present
+        """
+        return self.chunks.find(0)
+
     def finalize_write(self):
         self.fd.write(self.enc.finalize())
 
@@ -68,6 +124,9 @@ class SecureTemporaryFile(object):
     def __del__(self):
         self.close()
 
+        if self.persistent:
+            return
+
         try:
             os.remove(self.filepath)
         except:
@@ -0,0 +1,144 @@
+# -*- coding: utf-8
+# Registry of the temporary files of the uploads
+import os
+
+from globaleaks.rest import errors
+from globaleaks.utils.tempdict import TempDict
+
+
+class TempUploadList(TempDict):
+    """
+    Registry of the temporary files of the uploads
+
+    The files are indexed by name and by owner and the bytes written by
+    the uploads are accounted per tenant and per owner so that the quotas
+    could be enforced before writing each chunk.
+    """
+    def __init__(self, *args, **kwds):
+        self.names = {}
+        self.owners = {}
+        self.tenant_bytes = {}
+        self.owner_bytes = {}
+        TempDict.__init__(self, *args, **kwds)
+
+    def __setitem__(self, key, item):
+        if key in self:
+            self._unindex(key, self[key])
+
+        TempDict.__setitem__(self, key, item)
+        self._index(key, item)
+
+    def __delitem__(self, key):
+        self._unindex(key, self[key])
+        TempDict.__delitem__(self, key)
+
+    def pop(self, key, *args):
+        if key not in self:
+            if args:
+                return args[0]
+
+            raise KeyError(key)
+
+        item = self[key]
+        del self[key]
+        return item
+
+    def popitem(self, last=True):
+        key = next(reversed(self)) if last else next(iter(self))
+        return key, self.pop(key)
+
+    def clear(self):
+        TempDict.clear(self)
+        self.names.clear()
+        self.owners.clear()
+        self.tenant_bytes.clear()
+        self.owner_bytes.clear()
+
+    def _index(self, key, item):
+        self.names[os.path.basename(item.filepath)] = key
+
+        size = getattr(item, 'size', 0)
+        tid = getattr(item, 'tid', None)
+        owner = getattr(item, 'owner', None)
+
+        if tid is not None:
+            self.tenant_bytes[tid] = self.tenant_bytes.get(tid, 0) + size
+
+        if owner is not None:
+            self.owners.setdefault(owner, set()).add(key)
+            self.owner_bytes[owner] = self.owner_bytes.get(owner, 0) + size
+
+    def _unindex(self, key, item):
+        self.names.pop(os.path.basename(item.filepath), None)
+
+        size = getattr(item, 'size', 0)
+        tid = getattr(item, 'tid', None)
+        owner = getattr(item, 'owner', None)
+
+        if tid is not None:
+            self.tenant_bytes[tid] -= size
+            if not self.tenant_bytes[tid]:
+                del self.tenant_bytes[tid]
+
+        if owner is not None:
+            self.owners[owner].discard(key)
+            if not self.owners[owner]:
+                del self.owners[owner]
+
+            self.owner_bytes[owner] -= size
+            if not self.owner_bytes[owner]:
+                del self.owner_bytes[owner]
+
+    def pop_by_name(self, filename):
+        """
+        Remove from the registry the file with the given name
+
+        :param filename: The name of the temporary file
+        :return: The temporary file or None if not registered
+        """
+        key = self.names.get(filename)
+        if key is not None:
+            return self.pop(key)
+
+    def pop_by_owner(self, owner):
+        """
+        Remove from the registry the uploads of an owner
+
+        :param owner: The identifier to which the uploads are accounted
+        :return: The list of the identifiers and of the temporary files of the uploads
+        """
+        return [(key, self.pop(key)) for key in list(self.owners.get(owner, []))]
+
+    def add_size(self, key, size):
+        """
+        Account the bytes written by an upload
+
+        :param key: The identifier of the upload
+        :param size: The number of bytes written
+        """
+        item = self[key]
+        self._unindex(key, item)
+        item.size += size
+        self._index(key, item)
+
+    def get_tenant_bytes(self, tid):
+        return self.tenant_bytes.get(tid, 0)
+
+    def get_owner_bytes(self, owner):
+        return self.owner_bytes.get(owner, 0)
+
+    def check_quota(self, tid, owner, size, tenant_quota, owner_quota):
+        """
+        Verify that new bytes could be written without exceeding the quotas
+
+        :param tid: A tenant ID
+        :param owner: The identifier to which the upload is accounted
+        :param size: The number of bytes to be written
+        :param tenant_quota: The quota of each tenant in megabytes
+        :param owner_quota: The quota of each session in megabytes
+        """
+        if self.get_tenant_bytes(tid) + size > tenant_quota * 1024 * 1024:
+            raise errors.UploadQuotaExceeded
+
+        if owner is not None and self.get_owner_bytes(owner) + size > owner_quota * 1024 * 1024:
+            raise errors.UploadQuotaExceeded
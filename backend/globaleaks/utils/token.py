@@ -4,6 +4,7 @@ import os
 from datetime import timedelta
 
 from globaleaks.rest import errors
+from globaleaks.utils import resumable
 from globaleaks.utils.crypto import sha256, generateRandomKey, GCE
 from globaleaks.utils.tempdict import TempDict
 from globaleaks.utils.utility import datetime_now, datetime_to_ISO8601
@@ -64,6 +65,10 @@ class TokenList(TempDict):
             except Exception:
                 pass
 
+        # The uploads in progress of an expired token could not be completed anymore
+        for upload_id, f in self.state.TempUploadFiles.pop_by_owner(item.id):
+            resumable.delete_manifest(f, item.tid, upload_id)
+
     def new(self, tid):
         token = Token(self, tid)
         self.set(token.id, token)
@@ -7,16 +7,106 @@
 # that is initially derived from zipfile.py and then changed heavily for
 # our purpose (that's the reason why is not in third party)
 import binascii
+import math
+import mimetypes
 import os
 import struct
 import time
 import zlib
 
+from collections import Counter
+
 __all__ = ["ZipStream"]
 
 ZIP64_LIMIT = (1 << 31) - 1
+ZIP_FILECOUNT_LIMIT = (1 << 16) - 1
+ZIP_STORED = 0
 ZIP_DEFLATED = 8
 
+# Size of the blocks read from the files being archived
+CHUNK_SIZE = 64 * 1024
+
+# Media types whose content is already compressed and is stored as is
+COMPRESSED_MIME_TYPES = {
+    'application/gzip',
+    'application/vnd.rar',
+    'application/x-7z-compressed',
+    'application/x-bzip2',
+    'application/x-gzip',
+    'application/x-rar-compressed',
+    'application/x-xz',
+    'application/zip',
+    'audio/aac',
+    'audio/mp4',
+    'audio/mpeg',
+    'audio/ogg',
+    'image/gif',
+    'image/heic',
+    'image/jpeg',
+    'image/png',
+    'image/webp',
+    'video/mp4',
+    'video/mpeg',
+    'video/ogg',
+    'video/quicktime',
+    'video/webm',
+    'video/x-matroska'
+}
+
+# Prefixes of the office formats that are zip archives themselves
+COMPRESSED_MIME_TYPES_PREFIXES = (
+    'application/vnd.oasis.opendocument.',
+    'application/vnd.openxmlformats-officedocument.'
+)
+
+# Entropy in bits per byte above which a sample is considered incompressible
+ENTROPY_THRESHOLD = 7.5
+
+# Minimum size of a sample for its entropy to be meaningful
+ENTROPY_SAMPLE_MIN_SIZE = 1024
+
+
+def sample_entropy(sample):
+    """
+    Return the Shannon entropy in bits per byte of a sample of data
+    """
+    size = len(sample)
+    if not size:
+        return 0.0
+
+    return -sum(count / size * math.log2(count / size) for count in Counter(sample).values())
+
+
+def should_compress(name, mime_type, sample):
+    """
+    Decide if a member is worth compressing given its media type
+    and a sample of its content
+
+    :param name: The name of the member
+    :param mime_type: The media type of the member if known
+    :param sample: The first block of the content of the member
+    :return: A boolean telling if the member should be deflated
+    """
+    if not mime_type:
+        mime_type = mimetypes.guess_type(name)[0] or ''
+
+    mime_type = mime_type.split(';')[0].strip().lower()
+
+    if mime_type in COMPRESSED_MIME_TYPES or mime_type.startswith(COMPRESSED_MIME_TYPES_PREFIXES):
+        return False
+
+    if len(sample) < ENTROPY_SAMPLE_MIN_SIZE:
+        return True
+
+    return sample_entropy(sample) < ENTROPY_THRESHOLD
+
+
+def deflate_bound(size):
+    """
+    Return the maximum size of the output of deflate for an input of the given size
+    """
+    return size + (size >> 12) + (size >> 14) + (size >> 25) + 13
+
 # Here are some struct module formats for reading headers
 structEndArchive = b"<4s4H2lH"     # 9 items, end of archive, 22 bytes
 stringEndArchive = b"PK\005\006"   # magic number for end of archive record
@@ -83,6 +173,10 @@ class ZipInfo(object):
         self.compress_size = 0
         self.file_size = 0
 
+        # Whether the sizes may exceed ZIP64_LIMIT; as the header is written
+        # before the data this has to be decided in advance
+        self.zip64 = False
+
     def _encodeFilenameFlags(self):
         if isinstance(self.filename, str):
             try:
@@ -93,7 +187,7 @@ class ZipInfo(object):
             return self.filename, self.flag_bits
 
     def DataDescriptor(self):
-        if self.compress_size > ZIP64_LIMIT or self.file_size > ZIP64_LIMIT:
+        if self.zip64:
             fmt = "<4sLQQ"
         else:
             fmt = "<4sLLL"
@@ -115,7 +209,7 @@ class ZipInfo(object):
 
         extra = self.extra
 
-        if file_size > ZIP64_LIMIT or compress_size > ZIP64_LIMIT:
+        if self.zip64 or file_size > ZIP64_LIMIT or compress_size > ZIP64_LIMIT:
             # File is larger than what fits into a 4 byte integer,
             # fall back to the ZIP64 extension
             fmt = b'<hhqq'
@@ -158,11 +252,17 @@ class ZipStream(object):
         self.data_ptr += len(data)
         return data
 
-    def zipinfo_open(self, arcname):
-        zinfo = ZipInfo(arcname, self.time, ZIP_DEFLATED)
+    def zipinfo_open(self, arcname, compression=ZIP_DEFLATED, size=None):
+        zinfo = ZipInfo(arcname, self.time, compression)
         zinfo.header_offset = self.data_ptr
 
-        cmpr = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        # Members of unknown size are always prepared for the ZIP64 extension
+        zinfo.zip64 = size is None or deflate_bound(size) > ZIP64_LIMIT
+
+        if compression == ZIP_DEFLATED:
+            cmpr = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        else:
+            cmpr = None
 
         header = zinfo.FileHeader()
 
@@ -176,15 +276,20 @@ class ZipStream(object):
         zinfo.file_size += len(chunk)
         zinfo.CRC = binascii.crc32(chunk, zinfo.CRC) & 0xffffffff
 
-        chunk = cmpr.compress(chunk)
+        if cmpr is not None:
+            chunk = cmpr.compress(chunk)
+
         zinfo.compress_size += len(chunk)
 
+        if not zinfo.zip64 and (zinfo.file_size > ZIP64_LIMIT or zinfo.compress_size > ZIP64_LIMIT):
+            raise RuntimeError('File size unexpectedly exceeded ZIP64 limit')
+
         self.update_data_ptr(chunk)
 
         return chunk
 
     def zipinfo_close(self, zinfo, cmpr):
-        buf = cmpr.flush()
+        buf = cmpr.flush() if cmpr is not None else b''
         zinfo.compress_size += len(buf)
         self.update_data_ptr(buf)
 
@@ -193,23 +298,44 @@ class ZipStream(object):
 
         return buf + trailer
 
-    def zip_fo(self, fo, arcname):
-        zipinfo, cmpr, header = self.zipinfo_open(arcname)
+    def zip_fo(self, fo, arcname, mime_type=None, size=None):
+        """
+        Add a file object to the archive
 
-        yield header
+        The first block of the file is used to decide if the member is
+        worth compressing; already compressed content is stored as is.
 
+        fo -- the file object to be archived
+        arcname -- the name of the member
+        mime_type -- the media type of the member if known
+        size -- the size of the member if known
+        """
         with fo:
-            while True:
-                buf = fo.read(8 * 1024)
-                if not buf:
-                    break
+            if size is None:
+                try:
+                    size = os.fstat(fo.fileno()).st_size
+                except (AttributeError, OSError):
+                    pass
 
+            buf = fo.read(CHUNK_SIZE)
+
+            if should_compress(arcname, mime_type, buf):
+                compression = ZIP_DEFLATED
+            else:
+                compression = ZIP_STORED
+
+            zipinfo, cmpr, header = self.zipinfo_open(arcname, compression, size)
+
+            yield header
+
+            while buf:
                 yield self.zipinfo_update(zipinfo, cmpr, buf)
+                buf = fo.read(CHUNK_SIZE)
 
         yield self.zipinfo_close(zipinfo, cmpr)
 
-    def zip_file(self, filepath, arcname):
-        return self.zip_fo(open(filepath, "rb"), arcname)
+    def zip_file(self, filepath, arcname, mime_type=None):
+        return self.zip_fo(open(filepath, "rb"), arcname, mime_type, os.path.getsize(filepath))
 
     def archive_footer(self):
         """
@@ -278,7 +404,7 @@ class ZipStream(object):
 
         pos2 = self.data_ptr
         # Write end-of-zip-archive record
-        if pos1 > ZIP64_LIMIT:
+        if count >= ZIP_FILECOUNT_LIMIT or pos1 > ZIP64_LIMIT or pos2 - pos1 > ZIP64_LIMIT:
             # Need to write the ZIP64 end-of-archive records
             zip64endrec = struct.pack(structEndArchive64, stringEndArchive64,
                                       44, 45, 45, 0, 0, count, count, pos2 - pos1, pos1)
@@ -288,8 +414,11 @@ class ZipStream(object):
                                       stringEndArchive64Locator, 0, pos2, 1)
             data.append(self.update_data_ptr(zip64locrec))
 
+            centdir_count = min(count, ZIP_FILECOUNT_LIMIT)
+            centdir_size = pos2 - pos1 if pos2 - pos1 <= ZIP64_LIMIT else -1
+
             endrec = struct.pack(structEndArchive, stringEndArchive,
-                                 0, 0, count, count, pos2 - pos1, -1, 0)
+                                 0, 0, centdir_count, centdir_count, centdir_size, -1, 0)
             data.append(self.update_data_ptr(endrec))
 
         else:
@@ -299,14 +428,25 @@ class ZipStream(object):
 
         return b''.join(data)
 
-    def __iter__(self):
-        for f in self.files:
+    def zip_files(self, files):
+        """
+        Add a set of files to the archive without closing it
+
+        files -- iterable of dictionaries with the name of the member
+                 and either an open file object or a file path, and
+                 optionally its media type and its size
+        """
+        for f in files:
             if 'fo' in f:
-                for data in self.zip_fo(f['fo'], f['name']):
+                for data in self.zip_fo(f['fo'], f['name'], f.get('type'), f.get('size')):
                     yield data
 
             elif 'path' in f:
-                for data in self.zip_file(f['path'], f['name']):
+                for data in self.zip_file(f['path'], f['name'], f.get('type')):
                     yield data
 
+    def __iter__(self):
+        for data in self.zip_files(self.files):
+            yield data
+
         yield self.archive_footer()
@@ -546,10 +546,20 @@ var GLClient = angular.module("GLClient", [
     _flowFactoryProvider.defaults = {
         chunkSize: 1000 * 1024,
         forceChunkSize: true,
-        testChunks: false,
-        simultaneousUploads: 1,
+        // The chunks already received are skipped when an upload is resumed
+        testChunks: true,
+        simultaneousUploads: 3,
+        // Chunks failed due to a disconnection or a restart are retried and the upload is resumed
+        maxChunkRetries: 30,
+        chunkRetryInterval: 2000,
+        permanentErrors: [404, 413, 415, 500, 501, 507],
         generateUniqueIdentifier: function () {
-          return Math.random() * 1000000 + 1000000;
+          // The identifier protects the manifest used to resume the upload
+          var bytes = new Uint8Array(32);
+          window.crypto.getRandomValues(bytes);
+          return Array.prototype.map.call(bytes, function(x) {
+            return ("0" + x.toString(16)).slice(-2);
+          }).join("");
         },
         headers: function() {
           return $rootScope.Authentication.get_headers();
@@ -653,10 +663,10 @@ var GLClient = angular.module("GLClient", [
             elem = document.createElement("link");
             elem.setAttribute("id", "load-favicon");
             elem.setAttribute("rel", "shortcut icon");
-            elem.setAttribute("href", "data:image/png;base64," + $rootScope.public.node.favicon);
+            elem.setAttribute("href", $rootScope.Utils.imgUrl("files", "favicon", $rootScope.public.node.favicon));
             document.getElementsByTagName("head")[0].appendChild(elem);
           } else {
-            elem.setAttribute("href", "data:image/png;base64," + $rootScope.public.node.favicon);
+            elem.setAttribute("href", $rootScope.Utils.imgUrl("files", "favicon", $rootScope.public.node.favicon));
           }
         }
 
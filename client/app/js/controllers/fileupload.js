@@ -78,6 +78,17 @@ controller("ImageUploadCtrl", ["$scope", "$rootScope", "$http", "uploadUtils", "
     }
   });
 
+  $scope.getPictureSrc = function() {
+    var value = $scope.imageUploadModel[$scope.imageUploadModelAttr];
+
+    // Images referenced by their hash are loaded from the img handler
+    if ($scope.imageUploadImgType && value) {
+      return Utils.imgUrl($scope.imageUploadImgType, $scope.imageUploadModelAttr, value);
+    }
+
+    return Utils.imgDataUri(value);
+  };
+
   $scope.deletePicture = function() {
     $http({
       method: "DELETE",
@@ -938,6 +938,10 @@ factory("AdminUtils", ["AdminContextResource", "AdminQuestionnaireResource", "Ad
         return Math.random() * 1000000 + 1000000;
       },
 
+      imgUrl: function(type, id, hash) {
+        return "img/" + type + "/" + id + "/" + hash;
+      },
+
       imgDataUri: function(data) {
         if (data === "") {
           data = "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mP8Xw8AAoMBgDTD2qgAAAAASUVORK5CYII=";